@@ -0,0 +1,306 @@
+"""Throughput, memory and match quality benchmarks for the compare subsystem.
+
+Run with `python scripts/benchmark.py --sizes 1000 10000 100000`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from unittest import mock
+
+import numpy as np
+from rich.table import Table as RichTable
+
+from cms_etl.compare import compare_tools
+from cms_etl.compare.blocking import BlockIndex
+from cms_etl.compare.synthetic import SyntheticTables, generate_tables
+from cms_etl.table.table import Table
+from cms_etl.utils import console
+
+CCN_COL = "CMS Certification Number (CCN)"
+BENCH_SIZES = [1_000, 10_000, 100_000]
+ROW_PATH_SAMPLE = 1_000
+"""Number of rows run through the row-by-row stages at every size."""
+
+type StageFn = Callable[[SyntheticTables], Tuple[int, Dict[str, int]]]
+
+
+@dataclass
+class BenchResult:
+    """Measurements of one stage at one table size.
+
+    `precision` and `recall` compare the predicted profile ids to the ground
+    truth; `precision` is None for stages that only produce candidates.
+    """
+
+    stage: str
+    table_rows: int
+    measured_rows: int
+    seconds: float
+    peak_mb: Optional[float]
+    precision: Optional[float]
+    recall: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        """Return the throughput of the stage."""
+        return self.measured_rows / self.seconds if self.seconds else float("inf")
+
+
+def score_predictions(
+    predicted: Dict[str, int], truth: Dict[str, int]
+) -> Tuple[Optional[float], float]:
+    """Return the precision and recall of predicted CCN -> profile id pairs."""
+    correct = sum(truth.get(ccn) == row_id for ccn, row_id in predicted.items())
+    precision = correct / len(predicted) if predicted else None
+    recall = correct / len(truth) if truth else 1.0
+    return precision, recall
+
+
+@contextmanager
+def non_interactive() -> Iterator[None]:
+    """Answer every prompt with "n" (rejecting ambiguous picks) and silence the console."""
+    quiet = console.quiet
+    console.quiet = True
+    try:
+        with mock.patch.object(console, "input", return_value="n"), mock.patch.object(
+            console, "clear"
+        ):
+            yield
+    finally:
+        console.quiet = quiet
+
+
+@contextmanager
+def in_tmp_dir() -> Iterator[Path]:
+    """Run in a fresh working directory, so output files don't leak between runs."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(cwd)
+
+
+def _sample(tables: SyntheticTables, size: int, seed: int = 0) -> np.ndarray:
+    """Return the CMS positions run through the row-by-row stages."""
+    rng = np.random.default_rng(seed)
+    n_rows = len(tables.cms)
+    return np.sort(rng.choice(n_rows, size=min(size, n_rows), replace=False))
+
+
+def _sample_truth(tables: SyntheticTables, positions: np.ndarray) -> Dict[str, int]:
+    """Return the ground truth of the sampled CMS rows."""
+    ccns = tables.cms[CCN_COL].iloc[positions]
+    return {ccn: tables.truth[ccn] for ccn in ccns if ccn in tables.truth}
+
+
+def bench_filter_by_lead_digits(
+    tables: SyntheticTables, sample: int = ROW_PATH_SAMPLE
+) -> Tuple[int, Dict[str, int]]:
+    """Filter the zip block of sampled rows by house number; predict every surviving candidate."""
+    db_table = Table(tables.db, "db")
+    keys = db_table.match_keys("address")
+    zip_index = BlockIndex(tables.db, "zip_code")
+    positions = _sample(tables, sample)
+    truth = _sample_truth(tables, positions)
+    found = {}
+    for _, row in tables.cms.iloc[positions].iterrows():
+        block = zip_index.get_block(row["ZIP Code"])
+        if block is None:
+            continue
+        filtered = compare_tools.filter_by_lead_digits(
+            block, "address", row["Provider Address"], keys
+        )
+        if filtered is not None and truth.get(row[CCN_COL]) in set(filtered["id"]):
+            found[row[CCN_COL]] = truth[row[CCN_COL]]
+    return len(positions), found
+
+
+def bench_fuzz_col_w_process(
+    tables: SyntheticTables, sample: int = ROW_PATH_SAMPLE
+) -> Tuple[int, Dict[str, int]]:
+    """Match sampled rows with the row-by-row path, rejecting ambiguous picks."""
+    db_table = Table(tables.db, "db")
+    keys = db_table.match_keys("address")
+    zip_index = BlockIndex(tables.db, "zip_code")
+    positions = _sample(tables, sample)
+    predicted = {}
+    with non_interactive():
+        for _, row in tables.cms.iloc[positions].iterrows():
+            block = zip_index.get_block(row["ZIP Code"])
+            if block is None:
+                continue
+            filtered = compare_tools.filter_by_lead_digits(
+                block, "address", row["Provider Address"], keys
+            )
+            if filtered is None or filtered.empty:
+                continue
+            match = compare_tools.fuzz_col_w_process(
+                filtered, row, "address", row["Provider Address"], "token_set", keys
+            )
+            if match is not None:
+                predicted[row[CCN_COL]] = int(match["id"])
+    return len(positions), predicted
+
+
+def bench_fuzz_col_vs_col(tables: SyntheticTables, workers: int = 1) -> Tuple[int, Dict[str, int]]:
+    """Run the whole compare menu flow without prompts and read back the matches it wrote."""
+    # pylint: disable=import-outside-toplevel,protected-access
+    from cms_etl.menu.menus.compare.compare_tables import CompareTablesMenu
+
+    table1 = Table(tables.cms, "cms", source_type="cms", s1_category_id=1)
+    table2 = Table(tables.db, "db", source_type="db")
+    ctx = SimpleNamespace(menu_ctrlr=SimpleNamespace(menus=None))
+    menu = CompareTablesMenu(
+        ctx, "Benchmark", table1=table1, table2=table2, workers=workers  # type: ignore[arg-type]
+    )
+    menu._col_name_t1, menu._col_name_t2 = "Provider Address", "address"
+    menu.select_columns = lambda: None  # type: ignore[method-assign]
+    with in_tmp_dir() as tmp, non_interactive():
+        menu.fuzz_col_vs_col()
+        [matches_file] = tmp.glob("matches_1_*.json")
+        matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    return len(tables.cms), {match["cms"][CCN_COL]: int(match["db"]["id"]) for match in matches}
+
+
+def run_stage(
+    name: str,
+    fn: StageFn,
+    tables: SyntheticTables,
+    truth: Dict[str, int],
+    *,
+    memory: bool = True,
+    candidates_only: bool = False,
+) -> BenchResult:
+    """Time a stage, then rerun it under tracemalloc for its peak memory if `memory` is set.
+
+    Stages that only produce candidates (`candidates_only`) get no precision.
+    """
+    start = perf_counter()
+    measured_rows, predicted = fn(tables)
+    seconds = perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn(tables)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+
+    precision, recall = score_predictions(predicted, truth)
+    if candidates_only:
+        precision = None
+    return BenchResult(name, len(tables.cms), measured_rows, seconds, peak_mb, precision, recall)
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = tuple(BENCH_SIZES),
+    *,
+    seed: int = 0,
+    sample: int = ROW_PATH_SAMPLE,
+    workers: int = 1,
+    memory: bool = True,
+) -> List[BenchResult]:
+    """Run every stage at every table size."""
+    results = []
+    for size in sizes:
+        tables = generate_tables(size, seed)
+        sample_truth = _sample_truth(tables, _sample(tables, sample))
+        results.append(
+            run_stage(
+                "filter_by_lead_digits",
+                lambda t: bench_filter_by_lead_digits(t, sample),
+                tables,
+                sample_truth,
+                memory=memory,
+                candidates_only=True,
+            )
+        )
+        results.append(
+            run_stage(
+                "fuzz_col_w_process",
+                lambda t: bench_fuzz_col_w_process(t, sample),
+                tables,
+                sample_truth,
+                memory=memory,
+            )
+        )
+        results.append(
+            run_stage(
+                "fuzz_col_vs_col",
+                lambda t: bench_fuzz_col_vs_col(t, workers),
+                tables,
+                tables.truth,
+                memory=memory,
+            )
+        )
+    return results
+
+
+def results_table(results: Sequence[BenchResult]) -> RichTable:
+    """Return the results as a rich table."""
+
+    def fmt(value: Optional[float], spec: str) -> str:
+        return "-" if value is None else format(value, spec)
+
+    table = RichTable(title="Compare benchmarks")
+    columns = ["Stage", "Rows", "Measured", "Seconds", "Rows/s", "Peak MB", "Precision", "Recall"]
+    for column in columns:
+        table.add_column(column, justify="left" if column == "Stage" else "right")
+    for result in results:
+        table.add_row(
+            result.stage,
+            f"{result.table_rows:,}",
+            f"{result.measured_rows:,}",
+            f"{result.seconds:.2f}",
+            f"{result.rows_per_sec:,.0f}",
+            fmt(result.peak_mb, ".1f"),
+            fmt(result.precision, ".3f"),
+            fmt(result.recall, ".3f"),
+        )
+    return table
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Run the benchmarks, print the results and optionally write them as JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark the compare subsystem.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCH_SIZES, help="Table sizes")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed")
+    parser.add_argument(
+        "--sample", type=int, default=ROW_PATH_SAMPLE, help="Rows run through row-by-row stages"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Workers for fuzz_col_vs_col")
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory measurement")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.sizes,
+        seed=args.seed,
+        sample=args.sample,
+        workers=args.workers,
+        memory=not args.no_memory,
+    )
+    console.print(results_table(results))
+    if args.output:
+        data = [{**asdict(result), "rows_per_sec": result.rows_per_sec} for result in results]
+        Path(args.output).write_text(json.dumps(data, indent=2), encoding="utf-8")
+        console.print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Headless matching of two sources, for scheduled batch jobs (`cms_etl match`)."""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from cms_etl.app_context import AppContext
+from cms_etl.compare.blocking import ZIP_LEVELS
+from cms_etl.compare.candidate_export import export_scorers
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.compare.match_engine import CONFIDENT_SCORE, MATCH_CUTOFF
+from cms_etl.compare.scoring import FieldSpec
+from cms_etl.db.adapters.config import DBConfig
+from cms_etl.menu.menus.compare.compare_tables import CompareTablesMenu
+from cms_etl.table.table import Table
+from cms_etl.utils import console
+
+SOURCE_KINDS = ("csv", "db", "cms")
+"""Prefixes of the source arguments."""
+
+SOURCE_HELP = "csv:PATH, db:TABLE or cms:DATASET_ID (a bare path is a CSV file)"
+
+
+def parse_source(spec: str) -> Tuple[str, str]:
+    """Split a source argument into its kind and value."""
+    kind, sep, value = spec.partition(":")
+    if sep and kind in SOURCE_KINDS:
+        return kind, value
+    return "csv", spec
+
+
+def parse_columns(spec: str) -> Tuple[str, str]:
+    """Split a `COL1=COL2` column mapping."""
+    col1, sep, col2 = spec.partition("=")
+    if not sep or not col1 or not col2:
+        raise argparse.ArgumentTypeError(f"Expected COL1=COL2, got '{spec}'")
+    return col1, col2
+
+
+def parse_field(spec: str) -> FieldSpec:
+    """Parse a `COL1=COL2[:SCORER[:WEIGHT]]` field to score alongside the match columns."""
+    columns, _, options = spec.partition(":")
+    col1, col2 = parse_columns(columns)
+    scorer, _, weight = options.partition(":")
+    if scorer and scorer not in export_scorers():
+        raise argparse.ArgumentTypeError(f"Unknown scorer '{scorer}'")
+    try:
+        return FieldSpec(col1, col2, scorer or "token_set", float(weight) if weight else 1.0)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"Invalid weight '{weight}'") from e
+
+
+def add_match_parser(subparsers) -> argparse.ArgumentParser:
+    """Add the `match` subcommand to the subparsers of the entry point."""
+    parser = subparsers.add_parser(
+        "match",
+        help="Match two sources without prompting.",
+        description=(
+            "Match the rows of source1 (the CMS side of the matches) against source2 "
+            "(the database side, with an 'id' column). Matches, the review queue and "
+            "a timing summary are written to the current directory. Rows that need a "
+            "reviewer are left in the queue for 'Review Queued Matches'."
+        ),
+    )
+    parser.add_argument("source1", help=f"Table1 source: {SOURCE_HELP}")
+    parser.add_argument("source2", help=f"Table2 source: {SOURCE_HELP}")
+    parser.add_argument(
+        "--on", required=True, type=parse_columns, metavar="COL1=COL2", help="Columns to match"
+    )
+    parser.add_argument(
+        "--field",
+        action="append",
+        default=[],
+        type=parse_field,
+        metavar="COL1=COL2[:SCORER[:WEIGHT]]",
+        help="Further column pair scored alongside the match columns (repeatable)",
+    )
+    parser.add_argument("--scorer", default="token_set", choices=export_scorers())
+    parser.add_argument(
+        "--cutoff", type=float, default=MATCH_CUTOFF, help="Minimum score of a candidate"
+    )
+    parser.add_argument(
+        "--confident",
+        type=float,
+        default=CONFIDENT_SCORE,
+        help="Score a candidate must exceed to be matched",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument(
+        "--top-k", type=int, default=0, help="Export the top K candidates of every row"
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=0,
+        help="Sorted-neighborhood window for rows without a zip block (default: n-gram index)",
+    )
+    parser.add_argument(
+        "--zip-level",
+        default="zip5",
+        choices=ZIP_LEVELS,
+        help="Block on the 5-digit zip or, for coarser blocks, its first three digits",
+    )
+    parser.add_argument(
+        "--category-id", type=int, default=None, help="CMS category id of CSV sources"
+    )
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite database of db: sources")
+    parser.add_argument(
+        "--db-blocks",
+        action="store_true",
+        help="Leave a db: source2 in the database and fetch its zip blocks as they are needed",
+    )
+    parser.add_argument("--metrics", metavar="PATH", help="Path of the timing summary JSON")
+    parser.add_argument("--resume", action="store_true", help="Resume an unfinished run")
+    return parser
+
+
+def load_source(
+    ctx: AppContext,
+    spec: str,
+    source_type: str,
+    category_id: Optional[int] = None,
+    *,
+    db_blocks: bool = False,
+) -> Table:
+    """Load a source argument into a table of the context.
+
+    CSV sources take the `source_type` of the side they are matched on. With
+    `db_blocks`, a database source is added with its columns only, for
+    `CompareTablesMenu` to fetch its blocks from the database.
+    Raises ValueError (or the loader's error) when the source cannot be loaded.
+    """
+    kind, value = parse_source(spec)
+    match kind:
+        case "csv":
+            path = os.path.abspath(value)
+            df = ctx.data_loader.load_csv(path)
+            metadata: Dict[str, Any] = {"source_type": source_type, "file_path": path}
+            if category_id is not None:
+                metadata["s1_category_id"] = category_id
+            return ctx.table_mgr.add_table(df, Path(path).stem, **metadata)
+        case "db":
+            db_keys = ctx.db_mgr.list_dbs()
+            if not db_keys:
+                raise ValueError(f"A database is required to load table '{value}'.")
+            db_df: Optional[pd.DataFrame]
+            if db_blocks:
+                db_df = pd.DataFrame(columns=ctx.db_mgr[db_keys[0]].list_columns(value))
+            else:
+                db_df = ctx.data_loader.load_from_db(value, db_keys[0])
+            if db_df is None:
+                raise ValueError(f"Failed to load table '{value}' from '{db_keys[0]}'.")
+            return ctx.table_mgr.add_table(
+                db_df, value, db_key=db_keys[0], db_table_name=value, source_type="db"
+            )
+        case _:  # cms
+            cms_loader = ctx.data_loader.cms_loader
+            category, url = cms_loader.find_dataset(value)
+            dataset = cms_loader.get_dataset(category, cms_loader.get_source_meta(url))
+            if dataset is None:
+                raise ValueError(f"Failed to load CMS dataset '{value}'.")
+            df, metadata = dataset
+            return ctx.table_mgr.add_table(df, value, "", **metadata)
+
+
+def run_batch_match(args: argparse.Namespace, db_cfg: Optional[DBConfig] = None) -> int:
+    """Run the `match` subcommand and return its exit code (0 on success, 1 on failure)."""
+    start = perf_counter()
+    try:
+        if args.cutoff > args.confident:
+            raise ValueError("The cutoff must not exceed the confident score.")
+        ctx = AppContext(db_cfg)
+        table1 = load_source(ctx, args.source1, "cms", args.category_id)
+        table2 = load_source(ctx, args.source2, "db", db_blocks=args.db_blocks)
+        load_seconds = perf_counter() - start
+
+        menu = CompareTablesMenu(
+            ctx,
+            "Match",
+            table1=table1,
+            table2=table2,
+            workers=args.workers,
+            extra_fields=args.field,
+            top_k=args.top_k,
+            scorer=args.scorer,
+            score_cutoff=args.cutoff,
+            confident_score=args.confident,
+            window=args.window,
+            zip_level=args.zip_level,
+            db_blocks=args.db_blocks,
+        )
+        menu.set_columns(*args.on)
+        run = menu.run_match(resume=args.resume)
+        matches_path = menu.write_run_matches(run, show=False)
+
+        metrics.add_time("load_sources", load_seconds)
+        metrics.add_time("total", perf_counter() - start)
+        metrics_path = metrics.write_json(args.metrics or f"match_metrics_{run.category_id}.json")
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        console.print(f"Match failed: {e}")
+        return 1
+
+    console.print(metrics.summary())
+    console.print(
+        f"Matched {run.matched} of {len(table1.df)} row(s) in {perf_counter() - start:.2f}s; "
+        f"{len(run.queue.pending)} queued for review in {run.queue.path}."
+    )
+    console.print(f"Matches: {matches_path}")
+    console.print(f"Timing summary: {metrics_path}")
+    return 0
@@ -0,0 +1,103 @@
+"""USPS-style address standardization for match keys."""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+SUFFIXES = {
+    "ALLEY": "ALY", "AVENUE": "AVE", "AVEN": "AVE", "AV": "AVE", "BOULEVARD": "BLVD",
+    "CIRCLE": "CIR", "COURT": "CT", "CROSSING": "XING", "DRIVE": "DR", "EXPRESSWAY": "EXPY",
+    "FREEWAY": "FWY", "HIGHWAY": "HWY", "LANE": "LN", "PARKWAY": "PKWY", "PLACE": "PL",
+    "PLAZA": "PLZ", "ROAD": "RD", "SQUARE": "SQ", "STREET": "ST", "STR": "ST",
+    "TERRACE": "TER", "TRAIL": "TRL", "TURNPIKE": "TPKE",
+}  # fmt: skip
+"""USPS street suffix abbreviations (Publication 28, appendix C1)."""
+
+DIRECTIONALS = {
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "NORTHEAST": "NE", "NORTHWEST": "NW", "SOUTHEAST": "SE", "SOUTHWEST": "SW",
+}  # fmt: skip
+"""USPS directional abbreviations."""
+
+UNITS = {
+    "APARTMENT": "APT", "BUILDING": "BLDG", "DEPARTMENT": "DEPT", "FLOOR": "FL",
+    "ROOM": "RM", "SUITE": "STE", "UNIT": "UNIT",
+}  # fmt: skip
+"""USPS secondary unit designator abbreviations (Publication 28, appendix C2)."""
+
+ABBREVIATIONS = {**SUFFIXES, **DIRECTIONALS, **UNITS}
+
+MEMO_SIZE = 1_000_000
+"""Maximum number of standardized strings remembered between calls."""
+
+_WORD_RE = re.compile(r"\b(" + "|".join(sorted(ABBREVIATIONS, key=len, reverse=True)) + r")\b")
+_PUNCT_RE = re.compile(r"[.,;:]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _standardize_strings(values: pd.Series) -> pd.Series:
+    """Standardize a Series of strings with vectorized regex replacements."""
+    text = values.str.upper().str.replace(_PUNCT_RE, " ", regex=True)
+    text = text.str.replace(_WORD_RE, lambda m: ABBREVIATIONS[m.group(1)], regex=True)
+    return text.str.replace(_SPACE_RE, " ", regex=True).str.strip()
+
+
+class AddressStandardizer:
+    """Standardize addresses, remembering the result for every distinct input string.
+
+    CMS columns repeat many values, so each call only standardizes the
+    distinct values it has not seen before.
+    """
+
+    def __init__(self, memo_size: int = MEMO_SIZE):
+        self.memo_size = memo_size
+        self._memo: Dict[str, str] = {}
+
+    def standardize(self, col: pd.Series) -> pd.Series:
+        """Return the standardized column as a string Series; missing values stay missing."""
+        codes, uniques = pd.factorize(col.astype("string"))
+        new = [value for value in uniques if value not in self._memo]
+        if new:
+            if len(self._memo) + len(new) > self.memo_size:
+                self._memo.clear()
+            self._memo.update(zip(new, _standardize_strings(pd.Series(new, dtype=object))))
+        # The trailing None is what the -1 code of missing values picks
+        values = np.array([self._memo[value] for value in uniques] + [None], dtype=object)
+        return pd.Series(values[codes], index=col.index, dtype="string")
+
+    def standardize_one(self, value: Optional[str]) -> str:
+        """Return a single standardized address ("" when missing)."""
+        if value is None or pd.isna(value):  # type: ignore[arg-type]
+            return ""
+        value = str(value)
+        if value not in self._memo:
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[value] = _standardize_strings(pd.Series([value], dtype=object)).iloc[0]
+        return self._memo[value]
+
+    def __len__(self):
+        return len(self._memo)
+
+
+standardizer = AddressStandardizer()
+"""Standardizer shared by the match keys and the row-by-row compare tools."""
+
+
+def is_address_column(name: object) -> bool:
+    """Return whether a column holds addresses, judging by its name."""
+    return "address" in str(name).lower()
+
+
+def standardize_addresses(col: pd.Series) -> pd.Series:
+    """Return the standardized addresses of a column."""
+    return standardizer.standardize(col)
+
+
+def standardize_address(value: Optional[str]) -> str:
+    """Return a standardized address."""
+    return standardizer.standardize_one(value)
@@ -0,0 +1,161 @@
+"""Blocking indexes that narrow the candidate rows of a comparison."""
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NEIGHBORHOOD_WINDOW = 20
+"""Default number of table2 rows around a row's sort position that it is compared with."""
+
+
+def normalize_block_key(value: object) -> str:
+    """Return the normalized blocking key for a single value."""
+    if value is None or pd.isna(value):  # type: ignore[call-overload]
+        return ""
+    return str(value).strip()
+
+
+def normalize_block_keys(col: pd.Series) -> pd.Series:
+    """Return the normalized blocking keys for a column."""
+    return col.astype("str").str.strip().where(col.notna(), "")
+
+
+ZIP_LEVELS = ("zip5", "zip3")
+"""Columns of a zip key frame, from the finest to the coarsest block."""
+
+_ZIP_PATTERN = r"^(\d{1,9})(?:\.0*)?(?:[-\s]?(\d{4}))?$"
+
+
+def canonical_zips(col: pd.Series) -> pd.Series:
+    """Return the canonical 5-digit zip of each value of a column.
+
+    Zips read as numbers get their leading zeros back (2134 and 2134.0 become
+    "02134"), and ZIP+4 values, with or without the dash, are cut to their
+    first five digits. Values that don't look like a zip keep their stripped
+    text, and missing values get an empty key.
+    """
+    text = normalize_block_keys(col)
+    parts = text.str.extract(_ZIP_PATTERN)
+    digits, plus4 = parts[0], parts[1]
+    # Up to five digits is a zip that lost its leading zeros, more is a ZIP+4 that did
+    short = digits.str.len().le(5)
+    zip5 = digits.str.zfill(5).where(short, digits.str.zfill(9)).str[:5]
+    return zip5.where(digits.notna() & (short | plus4.isna()), text).astype(object)
+
+
+def compute_zip_keys(col: pd.Series) -> pd.DataFrame:
+    """Return the zip keys of a column, aligned to its index.
+
+    - zip5: the canonical 5-digit zip, see `canonical_zips`.
+    - zip3: its first three digits (the sectional center), for coarse blocking;
+      empty when the value isn't a zip.
+    """
+    zip5 = canonical_zips(col)
+    is_zip = zip5.str.fullmatch(r"\d{5}").fillna(False).astype(bool)
+    return pd.DataFrame(
+        {"zip5": zip5, "zip3": zip5.str[:3].where(is_zip, "").astype(object)}, index=col.index
+    )
+
+
+def lead_block_keys(keys: pd.DataFrame) -> pd.Series:
+    """Return the leading house number or leading word of each row of a match key frame.
+
+    House numbers become `d:<number>` and leading words become `a:<letters>`,
+    mirroring `filter_by_lead_digits` and `filter_df_by_lead_alpha`.
+    Rows with neither get an empty key.
+    """
+    house_nums = "d:" + keys["house_num"].astype(pd.StringDtype())
+    lead_alpha = "a:" + keys["lead_alpha"].astype(pd.StringDtype())
+    return house_nums.fillna(lead_alpha).fillna("").astype(object)
+
+
+class BlockIndex:
+    """Map the normalized values of a DataFrame column to the positions of its rows.
+
+    The index is built once per comparison so that each source row can look up
+    its candidate block instead of refiltering the whole DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, key_col: str, *, keys: Optional[pd.Series] = None):
+        self.df = df
+        self.key_col = key_col
+        if keys is None:
+            keys = normalize_block_keys(df[key_col])
+        groups = keys.groupby(keys.to_numpy(), sort=False).indices
+        self._blocks: Dict[str, np.ndarray] = {
+            str(key): np.asarray(positions) for key, positions in groups.items() if key
+        }
+
+    def positions(self, key: object) -> np.ndarray:
+        """Return the row positions for a blocking key."""
+        return self._blocks.get(normalize_block_key(key), np.empty(0, dtype=np.intp))
+
+    def get_block(self, key: object) -> pd.DataFrame | None:
+        """Return the rows of the DataFrame that share the blocking key."""
+        positions = self.positions(key)
+        if positions.size == 0:
+            return None
+        return self.df.iloc[positions]
+
+    def keys(self) -> Iterator[str]:
+        """Iterate over the blocking keys."""
+        return iter(self._blocks)
+
+    def __contains__(self, key: object) -> bool:
+        return normalize_block_key(key) in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+def neighborhood_keys(keys: pd.DataFrame) -> pd.Series:
+    """Return the sorted-neighborhood key of each row of a match key frame.
+
+    The key is the processed street (the value without its house number)
+    followed by the zero-padded house number, so rows on the same street sort
+    together and in house number order. Rows without a processed value get
+    an empty key.
+    """
+    street = keys["processed"].astype("str").str.replace(r"^\d+\s*", "", regex=True)
+    house_num = keys["house_num"].astype(pd.StringDtype()).str.zfill(18).fillna("")
+    return (street + "|" + house_num).where(keys["processed"].ne(""), "").astype(object)
+
+
+class SortedNeighborhood:
+    """The rows of a table sorted on their neighborhood keys, looked up by sliding window.
+
+    A key's window is the `window` rows around where it sorts in, so a row
+    whose zip is missing or wrong is still compared with the rows on its
+    street without an all-pairs scan.
+    """
+
+    def __init__(self, keys: pd.Series, window: int = NEIGHBORHOOD_WINDOW):
+        if window < 1:
+            raise ValueError("The window must hold at least one row.")
+        self.window = window
+        values = keys.to_numpy(dtype=object)
+        present = np.flatnonzero(values != "")
+        sorted_keys = values[present].astype(str)
+        order = np.argsort(sorted_keys, kind="stable")
+        self._keys = sorted_keys[order]
+        self._positions = present[order]
+
+    def window_starts(self, keys: Sequence[str] | np.ndarray) -> np.ndarray:
+        """Return the start of the window of each key in the sorted rows."""
+        points = np.searchsorted(self._keys, np.asarray(keys, dtype=str))
+        last_start = max(len(self._keys) - self.window, 0)
+        return np.clip(points - self.window // 2, 0, last_start)
+
+    def positions_at(self, start: int) -> np.ndarray:
+        """Return the row positions of the window starting at `start`."""
+        return self._positions[start : start + self.window]
+
+    def positions(self, key: str) -> np.ndarray:
+        """Return the row positions of the window around a key."""
+        return self.positions_at(int(self.window_starts([key])[0]))
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,139 @@
+"""Columnar export of the top candidates of a match run, for auditing and threshold tuning."""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rapidfuzz import process
+
+from cms_etl.compare.compare_tools import get_algo_dict
+from cms_etl.compare.match_engine import CONFIDENT_SCORE, MATCH_CUTOFF, MatchDecision
+
+CANDIDATE_TOP_K = 5
+"""Default number of candidates exported per source row."""
+
+_NOT_SCORES = {"partial_ratio_alignment"}  # returns an alignment, not a score
+
+
+def export_scorers() -> List[str]:
+    """Return the names of the registered scorers that can be exported."""
+    return [name for name in get_algo_dict() if name not in _NOT_SCORES]
+
+
+def candidate_frame(
+    decisions: Iterable[MatchDecision],
+    src_values: Sequence[str],
+    cand_values: Sequence[str],
+    scorers: Optional[Sequence[str]] = None,
+    src_index: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Return one row per (source row, top candidate) pair of the decisions, best first.
+
+    `src_values` and `cand_values` are the processed values the decisions
+    were scored on; every scorer in `scorers` (by default all of them) is run
+    on each pair in one `cpdist` call. `src_index` maps the decision
+    positions to the `src_pos` written out, e.g. when df1 was a slice.
+    """
+    scorers = list(export_scorers() if scorers is None else scorers)
+    algos = get_algo_dict()
+    unknown = [name for name in scorers if name not in algos or name in _NOT_SCORES]
+    if unknown:
+        raise ValueError(f"Unknown scorer(s): {', '.join(unknown)}")
+
+    src_pos, rank, cand_pos, score, status, tier = [], [], [], [], [], []
+    for decision in decisions:
+        for i, (pos, value) in enumerate(decision.top):
+            src_pos.append(decision.src_pos)
+            rank.append(i)
+            cand_pos.append(pos)
+            score.append(value)
+            status.append(decision.status)
+            tier.append(decision.tier)
+
+    frame = pd.DataFrame(
+        {
+            "src_pos": np.asarray(src_pos, dtype=np.int64),
+            "rank": np.asarray(rank, dtype=np.int16),
+            "cand_pos": np.asarray(cand_pos, dtype=np.int64),
+            "score": np.asarray(score, dtype=np.float32),
+            "status": pd.Categorical(status, categories=["match", "ambiguous", "none"]),
+            "tier": pd.Categorical(tier, categories=["exact", "fuzzy"]),
+        }
+    )
+    queries = [src_values[pos] for pos in src_pos]
+    choices = [cand_values[pos] for pos in cand_pos]
+    for name in scorers:
+        # rapidfuzz takes the scalar type as dtype, which its stubs don't allow
+        frame[name] = process.cpdist(  # type: ignore[call-overload]
+            queries, choices, scorer=algos[name], processor=None, dtype=np.float32
+        )
+    if src_index is not None:
+        frame["src_pos"] = np.asarray(src_index, dtype=np.int64)[frame["src_pos"].to_numpy()]
+    return frame
+
+
+def write_candidates(
+    frame: pd.DataFrame, path: str | Path, metadata: Optional[Dict[str, Any]] = None
+) -> Path:
+    """Write a candidate frame to a Parquet file, replacing it atomically.
+
+    `metadata` (e.g. the match columns and top k) is stored in the file's schema.
+    """
+    path = Path(path)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[b"cms_etl"] = json.dumps(metadata or {}).encode("utf-8")
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    pq.write_table(table.replace_schema_metadata(schema_metadata), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_candidates(path: str | Path) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Read a candidate file written by `write_candidates` and its metadata."""
+    table = pq.read_table(path)
+    metadata = json.loads((table.schema.metadata or {}).get(b"cms_etl", b"{}"))
+    return table.to_pandas(), metadata
+
+
+def replay_decisions(
+    frame: pd.DataFrame,
+    column: str = "score",
+    *,
+    score_cutoff: float = MATCH_CUTOFF,
+    confident_score: float = CONFIDENT_SCORE,
+) -> pd.DataFrame:
+    """Decide every source row of a candidate frame again from one score column.
+
+    Applies the `classify_scores` rule with other thresholds, or to another
+    scorer's column, without rescoring. Only the exported candidates are
+    considered, so a small top k can hide runner-ups of other scorers.
+    Returns the `status` and `best` table2 position of each `src_pos`.
+    """
+    scores = frame.loc[frame[column] >= score_cutoff, ["src_pos", "rank", "cand_pos", column]]
+    scores = scores.sort_values(["src_pos", column, "rank"], ascending=[True, False, True])
+    grouped = scores.groupby("src_pos", sort=False)
+    first = grouped.nth(0).set_index("src_pos")
+    second = grouped.nth(1).set_index("src_pos")[column].reindex(first.index)
+
+    best = first[column]
+    match = (best > confident_score) & (second.isna() | (second < confident_score))
+    ambiguous = (best > confident_score) & (second > confident_score)
+    result = pd.DataFrame(
+        {
+            "status": np.select([match, ambiguous], ["match", "ambiguous"], "none"),
+            "best": first["cand_pos"].where(match).astype(pd.Int64Dtype()),
+        },
+        index=first.index,
+    )
+    all_rows = pd.Index(frame["src_pos"].unique(), name="src_pos").sort_values()
+    result = result.reindex(all_rows)
+    result["status"] = result["status"].fillna("none")
+    return result
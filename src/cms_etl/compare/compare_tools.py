@@ -3,30 +3,49 @@
 from __future__ import annotations
 
 import re
-from typing import TYPE_CHECKING, Callable, Dict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
 
 import pandas as pd
 from rapidfuzz import fuzz, process
 from rapidfuzz.utils import default_process
 from rich.columns import Columns
 
+from cms_etl.compare.address import is_address_column
+from cms_etl.compare.decision_cache import DecisionCache, field_key, scorer_key
+from cms_etl.compare.instrumentation import metrics, timed
+from cms_etl.compare.match_keys import compute_match_keys, process_value, standardize_value
+from cms_etl.compare.ngram_index import NGRAM_TOP_N, NGramIndex
 from cms_etl.utils import console
 
 if TYPE_CHECKING:
     pass
 
+MATCH_CUTOFF = 80
+"""Minimum score for a candidate to be considered at all."""
 
-def filter_by_lead_digits(df: pd.DataFrame, col: str, compare_str: str) -> pd.DataFrame | None:
+CONFIDENT_SCORE = 86
+"""Score a candidate must exceed to be accepted without a tie-break."""
+
+
+@timed("filter_by_lead_digits")
+def filter_by_lead_digits(
+    df: pd.DataFrame, col: str, compare_str: str, keys: Optional[pd.DataFrame] = None
+) -> pd.DataFrame | None:
     """Return a DataFrame containing the rows
     where the leading digits of the address column
     match the leading digits of the compare string.
+
+    Pass the cached `Table.match_keys` of the column as `keys` to skip the regex extraction.
     """
     try:
         lead_digits = re.match(r"^(\d+)", compare_str.strip())
         if not lead_digits:
-            alpha_match = filter_df_by_lead_alpha(df, col, compare_str)
+            alpha_match = filter_df_by_lead_alpha(df, col, compare_str, keys)
             # print(alpha_match)
             return alpha_match
+        if keys is not None:
+            house_nums = keys.loc[df.index, "house_num"]
+            return df[house_nums.eq(int(lead_digits.group())).fillna(False).to_numpy(dtype=bool)]
         return df[
             df[col]
             .astype(str)
@@ -43,6 +62,7 @@ def filter_by_lead_digits(df: pd.DataFrame, col: str, compare_str: str) -> pd.Da
     return None
 
 
+@timed("filter_by_value")
 def filter_by_value(df: pd.DataFrame, col: str, value: object) -> pd.DataFrame | None:
     """Return a DataFrame containing the rows
     where the value of the address column
@@ -55,20 +75,54 @@ def filter_by_value(df: pd.DataFrame, col: str, value: object) -> pd.DataFrame |
     return None
 
 
-def filter_df_by_lead_alpha(df: pd.DataFrame, col: str, compare_str: str) -> pd.DataFrame | None:
+@timed("filter_by_ngrams")
+def filter_by_ngrams(
+    df: pd.DataFrame,
+    index: NGramIndex,
+    compare_str: str,
+    top_n: int = NGRAM_TOP_N,
+    *,
+    address: bool = True,
+) -> pd.DataFrame | None:
+    """Return the `top_n` rows sharing the most character n-grams with the compare string.
+
+    `index` must be built over the processed match keys of the column, in `df` row order;
+    `address` says whether they are the keys of an address column (see `is_address_column`).
+    """
+    positions = index.top_n(process_value(compare_str, address=address), top_n)
+    if positions.size == 0:
+        return None
+    return df.iloc[positions]
+
+
+@timed("filter_df_by_lead_alpha")
+def filter_df_by_lead_alpha(
+    df: pd.DataFrame, col: str, compare_str: str, keys: Optional[pd.DataFrame] = None
+) -> pd.DataFrame | None:
     """Return a DataFrame containing the rows
     where the leading characters of the address column
     are letters and match the leading characters of the compare string.
+
+    Pass the cached `Table.match_keys` of the column as `keys` to skip the regex extraction.
     """
-    df = df.copy(deep=True)
+    if keys is not None:
+        # The keys hold the leading letters of the standardized value
+        comp_lead_alpha = re.match(
+            r"^[a-zA-Z]+", standardize_value(compare_str, address=is_address_column(col))
+        )
+        if not comp_lead_alpha:
+            return None
+        lead_alpha = keys.loc[df.index, "lead_alpha"]
+        return df[lead_alpha.eq(comp_lead_alpha.group()).fillna(False).to_numpy(dtype=bool)]
     comp_lead_alpha = re.match(r"^[a-zA-Z]+", compare_str.strip())
     if not comp_lead_alpha:
         return None
+    df = df.copy(deep=True)
     return df[
         df[col]
         .astype(str)
         .str.extract(
-            r"^[a-zA-Z]+"
+            r"^([a-zA-Z]+)"
         )  # Extract leading letters ^: start of string, [a-zA-Z]: any letter, +: one or more
         .eq(comp_lead_alpha.group())
         .any(axis=1)
@@ -84,7 +138,10 @@ def fuzz_against_col(df: pd.DataFrame, col: str, compare_str: str, fuzz_type: st
     compare_str = compare_str.lower().strip()
 
     fuzzy_func = get_algo_dict().get(fuzz_type, fuzz.ratio)
-    fuzzed_col = df[col].apply(lambda x: fuzzy_func(x, compare_str, processor=default_process))
+    metrics.observe("candidate_block", len(df))
+    metrics.count("scorer_calls", len(df))
+    with metrics.stage("fuzz_against_col"):
+        fuzzed_col = df[col].apply(lambda x: fuzzy_func(x, compare_str, processor=default_process))
 
     matches = df[fuzzed_col.gt(80)]
     if matches.empty:
@@ -106,67 +163,126 @@ def fuzz_against_col(df: pd.DataFrame, col: str, compare_str: str, fuzz_type: st
 
 
 def fuzz_col_w_process(
-    df: pd.DataFrame, source_row: pd.Series, col: str, src_str: str, fuzz_type: str
+    df: pd.DataFrame,
+    source_row: pd.Series,
+    col: str,
+    src_str: str,
+    fuzz_type: str,
+    keys: Optional[pd.DataFrame] = None,
+    cache: Optional[DecisionCache] = None,
 ) -> dict | None:
     """Return a DataFrame containing the rows
-    where the address column matches the compare string"""
+    where the address column matches the compare string
+
+    Pass the cached `Table.match_keys` of the column as `keys` to skip reprocessing it.
+    With a decision `cache`, a candidate the reviewer accepted for this source
+    before is returned without scoring, rejected candidates are dropped, and
+    the choice made at the prompt is recorded.
+    """
+    processed_choices = keys.loc[df.index, "processed"].tolist() if keys is not None else None
     # add incr index to df
     df = df.reset_index(drop=True)
 
-    processed_src_str = default_process(src_str.strip())
+    # Decisions are keyed as a single-field run of `CompareTablesMenu` keys them
+    address = is_address_column(col)
+    decision_scorer = scorer_key([field_key(fuzz_type)], MATCH_CUTOFF, CONFIDENT_SCORE)
+    src_key = ""
+    known: Dict[str, bool] = {}
+    cand_keys: List[str] = []
+    if cache is not None:
+        src_key = process_value(src_str, address=address)
+        cand_keys = (
+            processed_choices
+            if processed_choices is not None
+            else compute_match_keys(df[col], address=address)["processed"].tolist()
+        )
+        known = cache.decisions(src_key, decision_scorer)
+        accepted = [i for i, cand in enumerate(cand_keys) if known.get(cand)]
+        if accepted:
+            metrics.count("decisions_cached")
+            return df.iloc[accepted[0]].to_dict()
+
+    if processed_choices is not None:
+        processed_src_str = process_value(src_str, address=address)
+    else:
+        processed_src_str = default_process(src_str.strip())
     scorer = get_algo_dict().get(fuzz_type, fuzz.ratio)
 
-    fuzzy_match = process.extract(
-        processed_src_str,
-        df[col].values.tolist(),
-        scorer=scorer,
-        processor=default_process,
-        score_cutoff=80,
-    )
+    metrics.observe("candidate_block", len(df))
+    metrics.count("scorer_calls", len(df))
+    with metrics.stage("process.extract"):
+        fuzzy_match = process.extract(
+            processed_src_str,
+            processed_choices if processed_choices is not None else df[col].values.tolist(),
+            scorer=scorer,
+            processor=None if processed_choices is not None else default_process,
+            score_cutoff=MATCH_CUTOFF,
+        )
+    if known:
+        # Candidates the reviewer rejected for this source are out of the running
+        fuzzy_match = [match for match in fuzzy_match if cand_keys[match[2]] not in known]
 
     if not fuzzy_match:
         return None
 
-    if fuzzy_match[0][1] > 86 and (len(fuzzy_match) == 1 or fuzzy_match[1][1] < 86):
+    if fuzzy_match[0][1] > CONFIDENT_SCORE and (
+        len(fuzzy_match) == 1 or fuzzy_match[1][1] < CONFIDENT_SCORE
+    ):
         try:
-            match = df[df[col].eq(fuzzy_match[0][0])]
-            # console.log(match)
-            for _, row in match.iterrows():
-                return row.to_dict()
+            return df.iloc[fuzzy_match[0][2]].to_dict()
         except (IndexError, ValueError) as e:
             console.log(f"Invalid index. Please try again. Error: {e}")
-    elif fuzzy_match[0][1] > 86 and fuzzy_match[1][1] > 86:
-        console.clear()
-        console.rule("Multiple matches found. Please select one.")
-        console.print(f"[bold]Source string: {src_str}[/bold]", justify="center")
-        console.print(source_row, justify="center", style="bold on blue")
-        console.print("\n")
-        columns = []
-        idx_choice = None
-        try:
-            for i, match in enumerate(fuzzy_match):
-                columns.append(f"{i+1}. {match}\n{df.loc[match[2]]}")
-            console.print(Columns(columns, padding=(2, 2)), justify="center")
-            idx_choice = console.input(
-                "Enter the index of the row you want to select (nothing to reject all): "
+    elif fuzzy_match[0][1] > CONFIDENT_SCORE and fuzzy_match[1][1] > CONFIDENT_SCORE:
+        candidates = df.iloc[[match[2] for match in fuzzy_match]]
+        choice = prompt_candidate_index(
+            candidates, [match[1] for match in fuzzy_match], source_row, col, src_str
+        )
+        if cache is not None:
+            cache.record(
+                src_key, [cand_keys[match[2]] for match in fuzzy_match], decision_scorer, choice
             )
-        except IndexError as e:
-            console.log(f"Invalid index. {e}")
-        except ValueError as e:
-            console.log(f"Invalid value. {e}")
+        if choice is None:
+            return None
+        return candidates.iloc[choice].to_dict()
+    return None
 
-        if idx_choice is None:
+
+def prompt_candidate_index(
+    candidates: pd.DataFrame,
+    scores: Sequence[float],
+    source_row: pd.Series,
+    col: str,
+    src_str: str,
+) -> int | None:
+    """Prompt the user to pick one of several candidates that scored above the threshold.
+
+    An invalid index is asked for again. Return the position of the chosen
+    candidate row, or None if all are rejected.
+    """
+    metrics.count("prompts")
+    console.clear()
+    console.rule("Multiple matches found. Please select one.")
+    console.print(f"[bold]Source string: {src_str}[/bold]", justify="center")
+    console.print(source_row, justify="center", style="bold on blue")
+    console.print("\n")
+    columns = []
+    for i, score in enumerate(scores):
+        columns.append(f"{i+1}. {(candidates.iloc[i][col], score)}\n{candidates.iloc[i]}")
+    console.print(Columns(columns, padding=(2, 2)), justify="center")
+    while True:
+        idx_choice = console.input(
+            "Enter the index of the row you want to select (nothing to reject all): "
+        )
+        if not idx_choice:
             return None
 
         try:
-            chosen = df[df[col].eq(fuzzy_match[int(idx_choice) - 1][0])]
-            # return dict of the chosen row
-            for _, row in chosen.iterrows():
-                return row.to_dict()
+            choice = int(idx_choice) - 1
+            if not 0 <= choice < len(scores):
+                raise IndexError(idx_choice)
+            return choice
         except (IndexError, ValueError) as e:
             console.log(f"Invalid index. Please try again. Error: {e}")
-        return None
-    return None
 
 
 def get_algo_dict() -> Dict[str, Callable]:
@@ -0,0 +1,116 @@
+"""Zip blocks of a database table, fetched on demand instead of loading the whole table."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+import pandas as pd
+
+from cms_etl.compare.blocking import canonical_zips
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.utils import console
+
+if TYPE_CHECKING:
+    from cms_etl.db.adapters import DatabaseAdapter
+
+DB_BATCH_ZIPS = 500
+"""Zips looked up per query, well below the bound parameter limit of SQLite (999)."""
+
+DB_CACHE_ROWS = 100_000
+"""Rows of fetched blocks kept in the LRU cache."""
+
+
+class DBBlockSource:
+    """The zip blocks of a database table, fetched with batched `IN` queries and cached LRU.
+
+    Matching against it leaves table2 in the database: each chunk of table1
+    rows fetches the blocks of its own zips only, so memory is bounded by the
+    blocks in use and the `cache_rows` of the cache rather than by the table.
+    Blocks are looked up by canonical 5-digit zip (see `canonical_zips`), which
+    finds zip columns of 5-digit text or of integers; ZIP+4 text is not found.
+    """
+
+    def __init__(
+        self,
+        adapter: DatabaseAdapter,
+        table: str,
+        zip_col: str,
+        *,
+        batch_size: int = DB_BATCH_ZIPS,
+        cache_rows: int = DB_CACHE_ROWS,
+    ):
+        self.adapter = adapter
+        self.table = table
+        self.zip_col = zip_col
+        self.batch_size = batch_size
+        self.cache_rows = cache_rows
+        self.columns: List[str] = adapter.list_columns(table)
+        if zip_col not in self.columns:
+            raise ValueError(f"Column '{zip_col}' not found in table '{table}'.")
+        if not adapter.is_indexed(table, zip_col):
+            console.log(
+                f"'{table}.{zip_col}' is not indexed; every block query will scan the table."
+            )
+        self._blocks: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._cached_rows = 0
+
+    def empty_frame(self) -> pd.DataFrame:
+        """Return an empty frame with the columns of the table."""
+        return pd.DataFrame(columns=self.columns)
+
+    def fetch(self, zips: Iterable[str]) -> pd.DataFrame:
+        """Return the rows of the blocks of the zips, block by block in first-seen order.
+
+        Blocks in the cache are reused, and the rest are fetched `batch_size` zips
+        per query. The result has a fresh range index.
+        """
+        wanted = [zip_key for zip_key in dict.fromkeys(zips) if zip_key]
+        blocks: Dict[str, pd.DataFrame] = {}
+        missing = []
+        for zip_key in wanted:
+            if zip_key in self._blocks:
+                self._blocks.move_to_end(zip_key)
+                blocks[zip_key] = self._blocks[zip_key]
+            else:
+                missing.append(zip_key)
+        metrics.count("db_block_hits", len(wanted) - len(missing))
+        metrics.count("db_block_misses", len(missing))
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start : start + self.batch_size]
+            with metrics.stage("db_fetch"):
+                rows = self.adapter.select_in(self.table, self.zip_col, batch, self.columns)
+            metrics.count("db_queries")
+            metrics.count("db_rows_fetched", len(rows))
+            groups = rows.groupby(canonical_zips(rows[self.zip_col]).to_numpy(), sort=False)
+            positions = groups.indices
+            for zip_key in batch:
+                # Zips without rows are cached too, so they aren't looked up again
+                block = rows.iloc[positions.get(zip_key, [])]
+                blocks[zip_key] = block
+                self._cache(zip_key, block)
+
+        frames = [blocks[zip_key] for zip_key in wanted if len(blocks[zip_key])]
+        if not frames:
+            return self.empty_frame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _cache(self, zip_key: str, block: pd.DataFrame):
+        """Cache a block, evicting the least recently used ones beyond `cache_rows` rows."""
+        self._blocks[zip_key] = block
+        self._cached_rows += len(block)
+        while self._cached_rows > self.cache_rows and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self._cached_rows -= len(evicted)
+
+    @property
+    def cached_rows(self) -> int:
+        """Return the number of rows held by the cache."""
+        return self._cached_rows
+
+    def __contains__(self, zip_key: str) -> bool:
+        return zip_key in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
@@ -0,0 +1,116 @@
+"""Persistent cache of reviewer decisions, keyed by processed match key pair and scorer."""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DECISION_CACHE_PATH = "match_decisions.sqlite"
+"""Default cache file, shared by every match run started from the same directory."""
+
+FIELD_SEP = " | "
+"""Joins the processed keys of several fields into one key; processing drops '|'."""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    src TEXT NOT NULL,
+    cand TEXT NOT NULL,
+    scorer TEXT NOT NULL,
+    accepted INTEGER NOT NULL,
+    decided_at TEXT NOT NULL,
+    PRIMARY KEY (src, scorer, cand)
+) WITHOUT ROWID
+"""
+
+
+def pair_keys(fields: Sequence[Iterable[str]]) -> List[str]:
+    """Return one key per row from the processed match keys of each field, in field order."""
+    return [FIELD_SEP.join(values) for values in zip(*fields)]
+
+
+def field_key(
+    scorer: str, weight: float = 1.0, missing: str = "skip", min_score: Optional[float] = None
+) -> str:
+    """Return how a field is scored, as it appears in a `scorer_key`."""
+    bound = "" if min_score is None else f">{min_score:g}"
+    return f"{scorer}*{weight:g}/{missing}{bound}"
+
+
+def scorer_key(fields: Sequence[str], score_cutoff: float, confident_score: float) -> str:
+    """Return the `scorer` of a run's decisions, e.g. "token_set*2/skip,ratio*1/skip@80-86".
+
+    It holds the `field_key` of every field and the run's thresholds, so
+    decisions are only reused by runs that score and accept candidates the
+    same way, whether row by row or in blocks.
+    """
+    return f"{','.join(fields)}@{score_cutoff:g}-{confident_score:g}"
+
+
+class DecisionCache:
+    """Accepted and rejected (source, candidate) pairs decided by a reviewer.
+
+    Keys are processed match keys, so the same pair is recognized whatever the
+    table, row order or formatting of the run; candidates with the same key
+    share a decision. `scorer` is the `scorer_key` of the run that decided it.
+    Decisions are committed as they are recorded.
+    """
+
+    def __init__(self, path: str | Path = DECISION_CACHE_PATH):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def decisions(self, src: str, scorer: str) -> Dict[str, bool]:
+        """Return whether each candidate decided for the source was accepted."""
+        rows = self._conn.execute(
+            "SELECT cand, accepted FROM decisions WHERE src = ? AND scorer = ?", (src, scorer)
+        )
+        return {cand: bool(accepted) for cand, accepted in rows}
+
+    def cached_choice(
+        self, src: str, cands: Sequence[str], scorer: str
+    ) -> Tuple[bool, Optional[int]]:
+        """Return whether the choice among `cands` is settled, and the index of the accepted one.
+
+        It is settled when one of them was accepted, or all of them were rejected
+        (the choice is then None).
+        """
+        known = self.decisions(src, scorer)
+        for i, cand in enumerate(cands):
+            if known.get(cand):
+                return True, i
+        return bool(cands) and all(cand in known for cand in cands), None
+
+    def accepted_pairs(self, scorer: str) -> Dict[str, str]:
+        """Return the accepted candidate of each source, the latest when there are several."""
+        rows = self._conn.execute(
+            "SELECT src, cand FROM decisions WHERE scorer = ? AND accepted = 1 ORDER BY decided_at",
+            (scorer,),
+        )
+        return dict(rows.fetchall())
+
+    def record(self, src: str, cands: Sequence[str], scorer: str, choice: Optional[int]):
+        """Record that the candidate at `choice` was accepted and the others rejected."""
+        chosen = None if choice is None else cands[choice]
+        now = datetime.now(timezone.utc).isoformat()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?)",
+            [(src, cand, scorer, int(cand == chosen), now) for cand in dict.fromkeys(cands)],
+        )
+        self._conn.commit()
+
+    def close(self):
+        """Close the cache file."""
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,170 @@
+"""Fuzzy duplicate clustering within zip and house number blocks."""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, cast
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from cms_etl.compare.compare_tools import get_algo_dict
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.compare.match_engine import build_match_keys
+from cms_etl.compare.match_keys import compute_match_keys
+from cms_etl.compare.ngram_index import NGRAM_TOP_N, NGramIndex
+
+DEDUPE_THRESHOLD = 90
+"""Minimum score for two rows to be considered duplicates."""
+
+MAX_BLOCK_SIZE = 2000
+"""Blocks larger than this are scored against n-gram neighbours instead of pairwise."""
+
+
+class UnionFind:
+    """Disjoint sets over the positions 0..n-1, with union by size and path halving."""
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n, dtype=np.intp)
+        self.size = np.ones(n, dtype=np.intp)
+
+    def find(self, i: int) -> int:
+        """Return the root of the set holding `i`."""
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return int(i)
+
+    def union(self, i: int, j: int):
+        """Merge the sets holding `i` and `j`."""
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+    def labels(self) -> np.ndarray:
+        """Return the root of every position."""
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent
+            parent = grandparent
+
+
+def _block_pairs(
+    values: List[str], positions: np.ndarray, scorer, threshold: float
+) -> List[np.ndarray]:
+    """Return the (i, j) position pairs of a block scoring at or above the threshold."""
+    if len(positions) <= MAX_BLOCK_SIZE:
+        # rapidfuzz expects the scalar type as dtype, not the np.dtype its stubs ask for
+        scores = process.cdist(  # type: ignore[call-overload]
+            values, values, scorer=scorer, processor=None, score_cutoff=threshold, dtype=np.float32
+        )
+        rows, cols = np.nonzero(np.triu(scores, k=1))
+        return [np.column_stack([positions[rows], positions[cols]])]
+
+    # Oversized blocks: only score each row against its n-gram neighbours
+    index = NGramIndex.build(values)
+    pairs = []
+    for row, value in enumerate(values):
+        neighbours = index.top_n(value, NGRAM_TOP_N)
+        neighbours = neighbours[neighbours != row]
+        if neighbours.size == 0:
+            continue
+        scores = process.cdist(
+            [value],
+            [values[i] for i in neighbours],
+            scorer=scorer,
+            processor=None,
+            score_cutoff=threshold,
+        )[0]
+        hits = neighbours[scores >= threshold]
+        pairs.append(np.column_stack([np.full(hits.size, positions[row]), positions[hits]]))
+    if not pairs:
+        return []
+    # Both rows of a pair can find each other, so each pair is put in (i, j) order once
+    return [np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)]
+
+
+def duplicate_pairs(
+    df: pd.DataFrame,
+    col: str,
+    *,
+    block_col: Optional[str] = None,
+    keys: Optional[pd.DataFrame] = None,
+    threshold: float = DEDUPE_THRESHOLD,
+    fuzz_type: str = "token_set",
+) -> np.ndarray:
+    """Return the (i, j) row position pairs, i < j, whose values score at or above `threshold`.
+
+    Rows are only compared within their block: the normalized `block_col`
+    (e.g. zip) value and the leading house number or word of the column.
+    Blocks over `MAX_BLOCK_SIZE` rows compare each row to its n-gram
+    neighbours only, so the work stays sub-quadratic however the data is
+    distributed. Pass the cached `Table.match_keys` of a text column as `keys`;
+    otherwise they are computed from the values as strings.
+    """
+    keys = compute_match_keys(df[col].astype("string")) if keys is None else keys
+    block_keys = build_match_keys(df, keys, block_col, lead_filter=True)
+    block_keys = block_keys.where(keys["processed"].ne(""), "")
+    scorer = get_algo_dict().get(fuzz_type, fuzz.ratio)
+    processed = keys["processed"].tolist()
+
+    pairs: List[np.ndarray] = [np.empty((0, 2), dtype=np.intp)]
+    blocks = cast(
+        Dict[str, np.ndarray], block_keys.groupby(block_keys.to_numpy(), sort=False).indices
+    )
+    with metrics.stage("dedupe_scoring"):
+        for key, positions in blocks.items():
+            if not key or len(positions) < 2:
+                continue
+            metrics.observe("dedupe_block", len(positions), len(positions))
+            values = [processed[i] for i in positions]
+            pairs.extend(_block_pairs(values, positions, scorer, threshold))
+    return np.concatenate(pairs).astype(np.intp)
+
+
+def cluster_ids(n_rows: int, pairs: np.ndarray) -> pd.Series:
+    """Union the pairs and return the cluster id of each row position.
+
+    Clusters are numbered from 1 in order of their first row; rows without a
+    duplicate get a missing id.
+    """
+    sets = UnionFind(n_rows)
+    for i, j in pairs:
+        sets.union(int(i), int(j))
+    labels = sets.labels()
+    in_cluster = sets.size[labels] > 1
+    roots = labels[in_cluster]
+    # pd.factorize numbers the roots in order of appearance, i.e. of their first row
+    codes, _ = pd.factorize(roots)
+    ids = pd.Series(pd.NA, index=range(n_rows), dtype=pd.Int64Dtype())
+    ids[in_cluster] = codes + 1
+    return ids
+
+
+def find_duplicate_clusters(
+    df: pd.DataFrame,
+    col: str,
+    *,
+    block_col: Optional[str] = None,
+    keys: Optional[pd.DataFrame] = None,
+    threshold: float = DEDUPE_THRESHOLD,
+    fuzz_type: str = "token_set",
+) -> pd.Series:
+    """Return the duplicate cluster id of each row, aligned to the DataFrame's index.
+
+    See `duplicate_pairs` for the blocking and `cluster_ids` for the numbering.
+    """
+    pairs = duplicate_pairs(
+        df, col, block_col=block_col, keys=keys, threshold=threshold, fuzz_type=fuzz_type
+    )
+    metrics.count("dedupe_pairs", len(pairs))
+    ids = cluster_ids(len(df), pairs)
+    ids.index = df.index
+    return ids
@@ -0,0 +1,142 @@
+"""Row fingerprints that let a match run skip CMS rows that did not change."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cms_etl.compare.match_output import RowStatus
+from cms_etl.compare.review_queue import ReviewItem
+
+
+def find_ccn_col(columns: Iterable[str]) -> Optional[str]:
+    """Return the CMS Certification Number column, if there is one."""
+    for col in columns:
+        name = str(col).lower()
+        if "ccn" in name or "certification number" in name:
+            return col
+    return None
+
+
+def row_keys(ccns: pd.Series) -> pd.Series:
+    """Return a store key per row: the stripped CCN, suffixed with `#n` on its nth repeat.
+
+    Rows without a CCN get an empty key and are never carried forward.
+    """
+    text = ccns.astype("string").str.strip().fillna("")
+    repeat = text.groupby(text).cumcount()
+    keys = text.where(repeat.eq(0), text + "#" + repeat.astype("str"))
+    return keys.where(text.ne(""), "").astype(object)
+
+
+def row_fingerprints(df: pd.DataFrame, cols: Sequence[str]) -> pd.Series:
+    """Return a content hash of the given columns of each row as a hex string."""
+    values = df[list(cols)].astype("string").apply(lambda col: col.str.strip()).fillna("")
+    hashes = pd.util.hash_pandas_object(values, index=False)
+    return pd.Series([f"{h:016x}" for h in hashes], index=df.index, dtype=object)
+
+
+def table_digest(name: str, df: pd.DataFrame, cols: Sequence[str]) -> str:
+    """Return a digest of a table's identity and content: its name, row count and `cols` values."""
+    values = df[list(cols)].astype("string").fillna("")
+    digest = hashlib.sha256(f"{name}|{len(df)}|".encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+@dataclass
+class FingerprintStore:
+    """Fingerprint and decision of every table1 row matched by previous runs, keyed by CCN.
+
+    `columns` names the match columns the store was built for, and `table2` is
+    the digest of the table the rows were matched against (see `table_digest`);
+    a store loaded for different columns or a changed table2 starts empty, since
+    its hashes and decisions no longer apply.
+    Queued rows are stored as "queued" until a review resolves them, and are
+    matched again on the next run until then.
+    """
+
+    path: Path
+    columns: List[str]
+    rows: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    table2: str = ""
+
+    @classmethod
+    def load(
+        cls,
+        path: str | Path,
+        columns: Optional[Sequence[str]] = None,
+        table2: Optional[str] = None,
+    ) -> FingerprintStore:
+        """Load the store at `path`, or start an empty one if it is missing or stale."""
+        path = Path(path)
+        if not path.exists():
+            return cls(path, list(columns or []), table2=table2 or "")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        stale_columns = columns is not None and data["columns"] != list(columns)
+        stale_table2 = table2 is not None and data.get("table2", "") != table2
+        if stale_columns or stale_table2:
+            return cls(path, list(columns or data["columns"]), table2=table2 or "")
+        return cls(path, data["columns"], data["rows"], data.get("table2", ""))
+
+    def unchanged(self, keys: Iterable[str], hashes: Iterable[str]) -> np.ndarray:
+        """Return a mask of the rows whose decision can be carried forward."""
+        return np.array(
+            [
+                bool(key)
+                and (entry := self.rows.get(key)) is not None
+                and entry["hash"] == hsh
+                and entry["status"] != "queued"
+                for key, hsh in zip(keys, hashes)
+            ],
+            dtype=bool,
+        )
+
+    def prior(self, key: str) -> Dict[str, Any]:
+        """Return the stored decision for a row."""
+        return self.rows[key]
+
+    def record(
+        self,
+        key: str,
+        hsh: str,
+        pos: int,
+        status: RowStatus,
+        match: Optional[Dict[str, Any]] = None,
+    ):
+        """Record the decision made for the row at table1 position `pos`."""
+        if key:
+            self.rows[key] = {"hash": hsh, "pos": pos, "status": status, "match": match}
+
+    def resolve(self, items: Iterable[ReviewItem]):
+        """Record the outcome of reviewed items whose rows are stored as queued."""
+        queued = {
+            entry["pos"]: entry for entry in self.rows.values() if entry["status"] == "queued"
+        }
+        for item in items:
+            entry = queued.get(item.src_pos)
+            if entry is None or item.status == "pending":
+                continue
+            entry["status"] = "match" if item.chosen is not None else "none"
+            entry["match"] = item.chosen
+
+    def prune(self, keys: Iterable[str]):
+        """Drop the rows that are no longer in the table."""
+        keep = set(keys)
+        self.rows = {key: entry for key, entry in self.rows.items() if key in keep}
+
+    def save(self):
+        """Write the store to its path, replacing the file atomically."""
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            data = {"columns": self.columns, "table2": self.table2, "rows": self.rows}
+            f.write(json.dumps(data, default=str))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,183 @@
+"""Cheap per-stage timers and counters for match runs."""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, ParamSpec, TypeVar
+
+from rich.console import Group
+from rich.table import Table as RichTable
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def size_bucket(value: int) -> int:
+    """Return the power-of-two bucket a size falls in (0, 1, 2, 4, 8, ...)."""
+    return 0 if value <= 0 else 1 << (value.bit_length() - 1)
+
+
+def bucket_label(bucket: int) -> str:
+    """Return the range of sizes in a bucket."""
+    if bucket <= 1:
+        return str(bucket)
+    return f"{bucket}-{2 * bucket - 1}"
+
+
+@dataclass
+class StageStats:
+    """Call count and total time of a stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class MatchMetrics:
+    """Stage timings, counters and size histograms of a match run.
+
+    Recording is a `perf_counter` call and a few dict updates, so it is left on.
+    """
+
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    counters: Counter[str] = field(default_factory=Counter)
+    histograms: Dict[str, Counter[int]] = field(default_factory=dict)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.stages.clear()
+        self.counters.clear()
+        self.histograms.clear()
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1):
+        """Add time spent in a stage."""
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.calls += calls
+        stats.seconds += seconds
+
+    def stage(self, stage: str) -> _StageTimer:
+        """Return a context manager timing the block it wraps as one call of `stage`."""
+        return _StageTimer(self, stage)
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter."""
+        self.counters[name] += n
+
+    def observe(self, name: str, size: int, n: int = 1):
+        """Record a size `n` times in the power-of-two histogram `name`."""
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Counter()
+        hist[size_bucket(size)] += n
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the metrics as JSON-serializable data."""
+        return {
+            "stages": {
+                name: {
+                    "calls": stats.calls,
+                    "seconds": stats.seconds,
+                    "mean_ms": stats.seconds / stats.calls * 1000 if stats.calls else 0.0,
+                }
+                for name, stats in self.stages.items()
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {
+                name: {bucket_label(bucket): hist[bucket] for bucket in sorted(hist)}
+                for name, hist in self.histograms.items()
+            },
+        }
+
+    def write_json(self, path: str | Path) -> Path:
+        """Write the metrics to a JSON file, replacing it atomically."""
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(), indent=2))
+        os.replace(tmp_path, path)
+        return path
+
+    def summary(self) -> Group:
+        """Return the metrics as rich tables."""
+        data = self.to_dict()
+        stages = RichTable(title="Match stages")
+        for column in ["Stage", "Calls", "Seconds", "Mean ms"]:
+            stages.add_column(column, justify="left" if column == "Stage" else "right")
+        for name, stats in data["stages"].items():
+            stages.add_row(
+                name, f"{stats['calls']:,}", f"{stats['seconds']:.3f}", f"{stats['mean_ms']:.3f}"
+            )
+
+        counters = RichTable(title="Match counters")
+        counters.add_column("Counter")
+        counters.add_column("Count", justify="right")
+        for name, count in data["counters"].items():
+            counters.add_row(name, f"{count:,}")
+
+        tables = [stages, counters]
+        for name, hist in data["histograms"].items():
+            table = RichTable(title=f"{name} histogram")
+            table.add_column("Size")
+            table.add_column("Count", justify="right")
+            for label, count in hist.items():
+                table.add_row(label, f"{count:,}")
+            tables.append(table)
+        return Group(*tables)
+
+
+class _StageTimer:
+    """Context manager adding the time of its block to a stage."""
+
+    __slots__ = ("_metrics", "_stage", "_start")
+
+    def __init__(self, metrics: MatchMetrics, stage: str):
+        self._metrics = metrics
+        self._stage = stage
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.add_time(self._stage, perf_counter() - self._start)
+
+
+metrics = MatchMetrics()
+"""Metrics of the current match run."""
+
+_nested_seconds: List[float] = []
+"""Time spent in the nested `timed` calls of each `timed` call in progress."""
+
+
+def timed(stage: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorate a function so each call is recorded as a call of `stage` in `metrics`.
+
+    Only the self time of a call is recorded: the time of the `timed` functions
+    it calls goes to their own stages, so it isn't counted twice.
+    """
+
+    def decorator(fn: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(fn)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            _nested_seconds.append(0.0)
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = perf_counter() - start
+                metrics.add_time(stage, seconds - _nested_seconds.pop())
+                if _nested_seconds:
+                    _nested_seconds[-1] += seconds
+
+        return wrapper
+
+    return decorator
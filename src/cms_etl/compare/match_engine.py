@@ -0,0 +1,789 @@
+"""Batch fuzzy matching engine that scores whole blocks of rows at once."""
+
+from __future__ import annotations
+
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, cast
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from cms_etl.compare.blocking import (
+    BlockIndex,
+    ZIP_LEVELS,
+    SortedNeighborhood,
+    canonical_zips,
+    compute_zip_keys,
+    lead_block_keys,
+    neighborhood_keys,
+)
+from cms_etl.compare.compare_tools import CONFIDENT_SCORE, MATCH_CUTOFF, get_algo_dict
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.compare.match_keys import compute_match_keys
+from cms_etl.compare.ngram_index import NGRAM_TOP_N, NGramIndex
+from cms_etl.compare.scoring import FieldSpec, combined_pair_scores, combined_scores
+
+PARALLEL_MIN_ROWS = 500
+"""Below this many source rows to score, matching runs serially."""
+
+TASK_CHUNK_SIZE = 512
+"""Maximum number of source rows scored in one block task."""
+
+type MatchStatus = Literal["match", "ambiguous", "none"]
+type MatchTier = Literal["exact", "fuzzy"]
+
+
+@dataclass
+class MatchDecision:
+    """The outcome of matching one table1 row against its candidate block.
+
+    `candidates` holds `(table2 position, score)` pairs at or above the cutoff,
+    ordered from best to worst. `tier` tells whether the row was resolved by
+    the exact pre-pass or went through fuzzy scoring. When several fields are
+    scored, `fields` holds the per-field scores of each candidate. When asked
+    for, `top` holds the `(table2 position, score)` pairs of the best
+    candidates whatever their score, for auditing.
+    """
+
+    src_pos: int
+    status: MatchStatus
+    candidates: List[Tuple[int, float]] = field(default_factory=list)
+    tier: MatchTier = "fuzzy"
+    fields: List[Tuple[float, ...]] = field(default_factory=list)
+    top: List[Tuple[int, float]] = field(default_factory=list)
+
+    @property
+    def best(self) -> Optional[int]:
+        """Return the table2 position of the accepted match."""
+        if self.status != "match":
+            return None
+        return self.candidates[0][0]
+
+
+def classify_scores(
+    scores: Sequence[float], confident_score: float = CONFIDENT_SCORE
+) -> MatchStatus:
+    """Classify candidate scores (sorted best first) the way `fuzz_col_w_process` does."""
+    if not scores:
+        return "none"
+    if scores[0] > confident_score and (len(scores) == 1 or scores[1] < confident_score):
+        return "match"
+    if scores[0] > confident_score and scores[1] > confident_score:
+        return "ambiguous"
+    return "none"
+
+
+def score_block(
+    queries: Sequence[str],
+    choices: Sequence[str],
+    scorer: Callable,
+    *,
+    score_cutoff: float = MATCH_CUTOFF,
+) -> np.ndarray:
+    """Return the score matrix of already processed queries against choices."""
+    # rapidfuzz wants the scalar type as dtype, where its stubs expect a np.dtype
+    return process.cdist(  # type: ignore[call-overload]
+        queries,
+        choices,
+        scorer=scorer,
+        processor=None,
+        score_cutoff=score_cutoff,
+        dtype=np.float64,
+    )
+
+
+def decide_row(
+    src_pos: int,
+    scores: np.ndarray,
+    positions: np.ndarray,
+    score_cutoff: float = MATCH_CUTOFF,
+    field_scores: Optional[np.ndarray] = None,
+    top_k: int = 0,
+    confident_score: float = CONFIDENT_SCORE,
+) -> MatchDecision:
+    """Turn one row of a score matrix into a decision.
+
+    `field_scores` are the (field, candidate) scores the row was combined from.
+    With `top_k`, the best `top_k` candidates are kept in `top` too.
+    Ties keep block order, matching the ordering of `process.extract`.
+    """
+    order = np.argsort(-scores, kind="stable")
+    keep = order[scores[order] >= score_cutoff]
+    candidates = [(int(positions[i]), float(scores[i])) for i in keep]
+    fields = []
+    if field_scores is not None:
+        fields = [tuple(float(score) for score in field_scores[:, i]) for i in keep]
+    return MatchDecision(
+        src_pos,
+        classify_scores([score for _, score in candidates], confident_score),
+        candidates,
+        fields=fields,
+        top=[(int(positions[i]), float(scores[i])) for i in order[:top_k]],
+    )
+
+
+def build_match_keys(
+    df: pd.DataFrame,
+    keys: pd.DataFrame,
+    block_col: Optional[str],
+    *,
+    lead_filter: bool,
+    zips: Optional[pd.Series] = None,
+) -> pd.Series:
+    """Return the composite blocking key of each row from its match keys.
+
+    `zips` are the precomputed zip keys of `block_col`, see `compute_zip_keys`;
+    by default its canonical 5-digit zips. Rows that cannot be blocked get an empty key.
+    """
+    block_keys = pd.Series("*", index=df.index)
+    if block_col is not None:
+        zip_keys = canonical_zips(df[block_col]) if zips is None else zips
+        block_keys = zip_keys.where(zip_keys.eq(""), block_keys + "|" + zip_keys)
+    if lead_filter:
+        lead_keys = lead_block_keys(keys)
+        block_keys = block_keys.where(
+            block_keys.eq("") | lead_keys.eq(""), block_keys + "|" + lead_keys
+        )
+        block_keys = block_keys.where(lead_keys.ne(""), "")
+    return block_keys
+
+
+def build_exact_keys(
+    df: pd.DataFrame,
+    keys: pd.DataFrame,
+    block_col: Optional[str],
+    zips: Optional[pd.Series] = None,
+) -> pd.Series:
+    """Return the normalized `zip|address` join key of each row.
+
+    `zips` are the precomputed zip keys of `block_col`, as for `build_match_keys`.
+    Rows without a processed value, or without a zip when blocking on one, get an empty key.
+    """
+    exact_keys = keys["processed"].astype("str")
+    if block_col is not None:
+        zip_keys = canonical_zips(df[block_col]) if zips is None else zips
+        exact_keys = (zip_keys + "|" + exact_keys).where(zip_keys.ne(""), "")
+    return exact_keys.where(keys["processed"].ne(""), "")
+
+
+def exact_index(cand_keys: pd.Series) -> pd.Series:
+    """Return the position of each candidate key held by exactly one candidate row."""
+    cand = pd.Series(np.arange(len(cand_keys)), index=cand_keys.to_numpy())
+    return cand[(cand.index != "") & ~cand.index.duplicated(keep=False)]
+
+
+def lookup_exact(src_keys: pd.Series, index: pd.Series) -> np.ndarray:
+    """Return the candidate position of each source key in an `exact_index`, or -1."""
+    hits = pd.Series(src_keys.to_numpy()).map(index)
+    return hits.fillna(-1).to_numpy(dtype=np.intp)
+
+
+def exact_hits(src_keys: pd.Series, cand_keys: pd.Series) -> np.ndarray:
+    """Hash join the keys and return the unique candidate position of each source row.
+
+    Rows with no hit, or with several identical candidates, get -1.
+    """
+    return lookup_exact(src_keys, exact_index(cand_keys))
+
+
+def tier_counts(decisions: Iterable[MatchDecision]) -> Dict[str, int]:
+    """Count the rows resolved by each tier, and the rows left ambiguous or unmatched."""
+    counts = dict.fromkeys(["exact", "fuzzy", "ambiguous", "none"], 0)
+    for decision in decisions:
+        counts[decision.tier if decision.status == "match" else decision.status] += 1
+    return counts
+
+
+@dataclass
+class BlockTask:
+    """A block of processed source rows and the candidate rows they are scored against.
+
+    `src_fields` and `cand_fields` hold the processed values of any further
+    fields scored alongside the blocked column.
+    """
+
+    src_positions: np.ndarray
+    src_queries: List[str]
+    cand_positions: np.ndarray
+    cand_choices: List[str]
+    src_fields: List[List[str]] = field(default_factory=list)
+    cand_fields: List[List[str]] = field(default_factory=list)
+
+    @property
+    def cost(self) -> int:
+        """Return the number of cells in the block's score matrices."""
+        return len(self.src_queries) * len(self.cand_choices) * (1 + len(self.src_fields))
+
+
+def score_tasks(
+    tasks: Sequence[BlockTask],
+    specs: Sequence[FieldSpec],
+    top_k: int = 0,
+    score_cutoff: float = MATCH_CUTOFF,
+    confident_score: float = CONFIDENT_SCORE,
+) -> List[MatchDecision]:
+    """Score a batch of block tasks on the weighted fields of `specs` and return their decisions.
+
+    A single field without a `min_score` is scored with its cutoff applied
+    inside `cdist`, unless the `top_k` candidates below the cutoff are wanted.
+    """
+    single = len(specs) == 1 and specs[0].min_score is None
+    scorer = get_algo_dict().get(specs[0].scorer, fuzz.ratio)
+    decisions = []
+    for task in tasks:
+        if single:
+            scores = score_block(
+                task.src_queries,
+                task.cand_choices,
+                scorer,
+                score_cutoff=0 if top_k else score_cutoff,
+            )
+            field_scores = None
+        else:
+            scores, field_scores = combined_scores(
+                [task.src_queries, *task.src_fields],
+                [task.cand_choices, *task.cand_fields],
+                specs,
+                score_cutoff=score_cutoff,
+            )
+        for row, src_pos in enumerate(task.src_positions):
+            decisions.append(
+                decide_row(
+                    int(src_pos),
+                    scores[row],
+                    task.cand_positions,
+                    score_cutoff,
+                    field_scores=None if field_scores is None else field_scores[:, row],
+                    top_k=top_k,
+                    confident_score=confident_score,
+                )
+            )
+    return decisions
+
+
+def shard_tasks(tasks: Sequence[BlockTask], n_shards: int) -> List[List[BlockTask]]:
+    """Spread tasks over shards so each shard has a similar amount of scoring work.
+
+    The assignment only depends on the tasks, so results merge deterministically.
+    """
+    shards: List[List[BlockTask]] = [[] for _ in range(n_shards)]
+    loads = [0] * n_shards
+    for task in sorted(tasks, key=lambda t: t.cost, reverse=True):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(task)
+        loads[lightest] += task.cost
+    return [shard for shard in shards if shard]
+
+
+@dataclass
+class CandidateBlocks:
+    """The df2 side of a comparison, indexed once and shared by every chunk of df1 rows.
+
+    `block_index` maps the blocking keys of `build_match_keys` to df2
+    positions, and `exact` the join keys of `build_exact_keys` (see
+    `exact_index`). `field_values` are the processed values of any further fields.
+    """
+
+    keys: pd.DataFrame
+    processed: List[str]
+    block_index: BlockIndex
+    exact: pd.Series
+    lead_filter: bool = False
+    zips: Optional[pd.Series] = None
+    field_values: List[List[str]] = field(default_factory=list)
+    ngram_index: Optional[NGramIndex] = None
+    neighborhood: Optional[SortedNeighborhood] = None
+
+    @classmethod
+    def build(
+        cls,
+        df2: pd.DataFrame,
+        col2: str,
+        *,
+        block_col: Optional[str] = None,
+        lead_filter: bool = False,
+        keys: Optional[pd.DataFrame] = None,
+        zips: Optional[pd.Series] = None,
+        field_values: Sequence[List[str]] = (),
+        ngram_index: Optional[NGramIndex] = None,
+        neighborhood: Optional[SortedNeighborhood] = None,
+    ) -> CandidateBlocks:
+        """Index the rows of df2.
+
+        `keys` are the (cached) match keys of col2 and `zips` the zip keys of
+        `block_col`; they are computed here when not given.
+        """
+        keys = compute_match_keys(df2[col2]) if keys is None else keys
+        if block_col is not None and zips is None:
+            zips = canonical_zips(df2[block_col])
+        block_keys = build_match_keys(df2, keys, block_col, lead_filter=lead_filter, zips=zips)
+        return cls(
+            keys,
+            keys["processed"].tolist(),
+            BlockIndex(df2, col2, keys=block_keys),
+            exact_index(build_exact_keys(df2, keys, block_col, zips)),
+            lead_filter,
+            zips,
+            [list(values) for values in field_values],
+            ngram_index,
+            neighborhood,
+        )
+
+    def block_tasks(
+        self,
+        df1: pd.DataFrame,
+        keys1: pd.DataFrame,
+        block_col: Optional[str] = None,
+        *,
+        zips: Optional[pd.Series] = None,
+        resolved: Optional[np.ndarray] = None,
+        top_n: int = NGRAM_TOP_N,
+        chunk_size: int = TASK_CHUNK_SIZE,
+        field_values: Sequence[Sequence[str]] = (),
+    ) -> List[BlockTask]:
+        """Group the rows of df1 into block tasks against their candidates, see `build_block_tasks`.
+
+        `field_values` are the processed df1 values of the further fields.
+        """
+        if block_col is not None and zips is None:
+            zips = canonical_zips(df1[block_col])
+        src_keys = build_match_keys(df1, keys1, block_col, lead_filter=self.lead_filter, zips=zips)
+        if resolved is not None:
+            src_keys.iloc[resolved] = ""
+
+        src_processed = keys1["processed"].tolist()
+        cand_processed = self.processed
+        ngram_index, neighborhood = self.ngram_index, self.neighborhood
+
+        fallback = np.zeros(len(df1), dtype=bool)
+        if ngram_index is not None or neighborhood is not None:
+            if zips is not None and self.zips is not None:
+                cand_zips = set(self.zips) - {""}
+                fallback = ~zips.isin(cand_zips).to_numpy()
+            elif not self.lead_filter:
+                fallback[:] = True
+            fallback &= keys1["processed"].ne("").to_numpy()
+            if resolved is not None:
+                fallback[resolved] = False
+            src_keys = src_keys.where(~fallback, "")
+
+        def make_task(src_positions: np.ndarray, cand_positions: np.ndarray) -> BlockTask:
+            return BlockTask(
+                src_positions,
+                [src_processed[i] for i in src_positions],
+                cand_positions,
+                [cand_processed[i] for i in cand_positions],
+                [[values1[i] for i in src_positions] for values1 in field_values],
+                [[values2[i] for i in cand_positions] for values2 in self.field_values],
+            )
+
+        tasks = []
+        src_groups = cast(Dict[str, np.ndarray], src_keys.groupby(src_keys.to_numpy()).indices)
+        for key, src_positions in src_groups.items():
+            cand_positions = self.block_index.positions(key) if key else None
+            if cand_positions is None or cand_positions.size == 0:
+                continue
+            for start in range(0, len(src_positions), chunk_size):
+                tasks.append(make_task(src_positions[start : start + chunk_size], cand_positions))
+
+        fallback_rows = np.flatnonzero(fallback)
+        windows: List[np.ndarray] = []
+        if neighborhood is not None:
+            metrics.count("rows_neighborhood_fallback", len(fallback_rows))
+            starts = neighborhood.window_starts(
+                neighborhood_keys(keys1).to_numpy(dtype=str)[fallback_rows]
+            )
+            if ngram_index is None:
+                # Rows the zip filter found nothing for are scored against the rows around
+                # them in sorted order; rows that sort into the same window share a task
+                windows_of = cast(Dict[int, np.ndarray], pd.Series(starts).groupby(starts).indices)
+                for start, rows in windows_of.items():
+                    cand_positions = neighborhood.positions_at(int(start))
+                    if cand_positions.size == 0:
+                        continue
+                    for i in range(0, len(rows), chunk_size):
+                        tasks.append(
+                            make_task(fallback_rows[rows[i : i + chunk_size]], cand_positions)
+                        )
+                return tasks
+            windows = [neighborhood.positions_at(int(start)) for start in starts]
+
+        if ngram_index is not None:
+            metrics.count("rows_ngram_fallback", len(fallback_rows))
+            # Rows the zip filter found nothing for are scored against their n-gram short list
+            for i, src_pos in enumerate(fallback_rows):
+                cand_positions = ngram_index.top_n(src_processed[src_pos], top_n)
+                if windows:
+                    extra = windows[i][~np.isin(windows[i], cand_positions)]
+                    cand_positions = np.concatenate([cand_positions, extra])
+                if cand_positions.size == 0:
+                    continue
+                tasks.append(make_task(np.array([src_pos]), cand_positions))
+        return tasks
+
+
+def build_block_tasks(
+    df1: pd.DataFrame,
+    df2: pd.DataFrame,
+    col1: str,
+    col2: str,
+    *,
+    block_cols: Optional[Tuple[str, str]] = None,
+    lead_filter: bool = False,
+    match_keys: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None,
+    resolved: Optional[np.ndarray] = None,
+    ngram_index: Optional[NGramIndex] = None,
+    top_n: int = NGRAM_TOP_N,
+    chunk_size: int = TASK_CHUNK_SIZE,
+    field_values: Sequence[Tuple[Sequence[str], Sequence[str]]] = (),
+    neighborhood: Optional[SortedNeighborhood] = None,
+    zips: Optional[Tuple[pd.Series, pd.Series]] = None,
+) -> List[BlockTask]:
+    """Group the rows of df1 into block tasks against their df2 candidates.
+
+    `match_keys` are the (cached) match key frames of col1 and col2, and
+    `zips` the zip keys of the block columns; they are computed here when not given.
+    `resolved` are df1 positions that were already decided and are left out.
+    With an `ngram_index` over the processed col2 values, rows whose zip has
+    no df2 rows, or every row of an unblocked comparison, are scored against
+    their `top_n` n-gram candidates instead of nothing or the whole table.
+    With a `neighborhood` over the col2 neighborhood keys, those rows are
+    scored against their sorted-neighborhood window instead, or as well when
+    both are given. Rows sharing a window share a task.
+    Source groups larger than `chunk_size` are split so that one huge block
+    (e.g. an unblocked comparison) can still be spread over several workers.
+    `field_values` are the processed (df1, df2) values of further fields to
+    score, copied into each task for its rows.
+    """
+    col1_block, col2_block = block_cols or (None, None)
+    keys1, keys2 = match_keys or (compute_match_keys(df1[col1]), compute_match_keys(df2[col2]))
+    zips1, zips2 = zips or (None, None)
+    candidates = CandidateBlocks.build(
+        df2,
+        col2,
+        block_col=col2_block,
+        lead_filter=lead_filter,
+        keys=keys2,
+        zips=zips2,
+        field_values=[list(values2) for _, values2 in field_values],
+        ngram_index=ngram_index,
+        neighborhood=neighborhood,
+    )
+    return candidates.block_tasks(
+        df1,
+        keys1,
+        col1_block,
+        zips=zips1,
+        resolved=resolved,
+        top_n=top_n,
+        chunk_size=chunk_size,
+        field_values=[values1 for values1, _ in field_values],
+    )
+
+
+class BlockMatcher:
+    """Matches chunks of df1 rows against df2 rows that are indexed once.
+
+    `index` builds the blocking indexes of the df2 side, and every `match`
+    call after it scores a chunk of df1 rows against them, so a run that
+    matches table1 chunk by chunk pays for table2 once. Parallel scoring
+    uses a single process pool for the life of the matcher; use it as a
+    context manager, or call `close`, to shut the pool down.
+
+    `total_rows` is the number of df1 rows the `match` calls score in all.
+    Whether the pool is worth starting is decided once from it, so the small
+    chunks of a large run are scored in parallel too; by default each call
+    decides from its own df1. The other options are those of `match_blocks`.
+    """
+
+    def __init__(
+        self,
+        col1: str,
+        col2: str,
+        *,
+        block_cols: Optional[Tuple[str, str]] = None,
+        lead_filter: bool = False,
+        fuzz_type: str = "token_set",
+        exact_first: bool = True,
+        top_n: int = NGRAM_TOP_N,
+        zip_level: str = "zip5",
+        fields: Optional[Sequence[FieldSpec]] = None,
+        top_k: int = 0,
+        score_cutoff: float = MATCH_CUTOFF,
+        confident_score: float = CONFIDENT_SCORE,
+        workers: int = 1,
+        min_parallel_rows: int = PARALLEL_MIN_ROWS,
+        total_rows: Optional[int] = None,
+    ):
+        self.col1 = col1
+        self.col2 = col2
+        self.block_cols = block_cols
+        self.lead_filter = lead_filter
+        self.exact_first = exact_first
+        self.top_n = top_n
+        self.specs = list(fields or [FieldSpec(col1, col2, fuzz_type)])
+        if (self.specs[0].col1, self.specs[0].col2) != (col1, col2):
+            raise ValueError(f"The first field must be ({col1!r}, {col2!r})")
+        if zip_level not in ZIP_LEVELS:
+            raise ValueError(f"Unknown zip level {zip_level!r}, expected one of {ZIP_LEVELS}")
+        self.zip_level = zip_level
+        self.top_k = top_k
+        self.score_cutoff = score_cutoff
+        self.confident_score = confident_score
+        self.workers = workers
+        self.min_parallel_rows = min_parallel_rows
+        self.total_rows = total_rows
+        self.candidates: Optional[CandidateBlocks] = None
+        self._executor: Optional[futures.ProcessPoolExecutor] = None
+
+    def index(
+        self,
+        df2: pd.DataFrame,
+        *,
+        match_keys: Optional[pd.DataFrame] = None,
+        zip_keys: Optional[pd.DataFrame] = None,
+        field_keys: Optional[Sequence[pd.DataFrame]] = None,
+        ngram_index: Optional[NGramIndex] = None,
+        neighborhood: Optional[SortedNeighborhood] = None,
+    ):
+        """Index the df2 rows that the next `match` calls score against.
+
+        Pass the cached `Table.match_keys` of col2, the `Table.zip_keys` of its
+        block column and the match keys of the further fields to avoid
+        recomputing them. See `match_blocks` for `ngram_index` and `neighborhood`.
+        """
+        col2_block = self.block_cols[1] if self.block_cols is not None else None
+        zips = None
+        if col2_block is not None:
+            zips = (compute_zip_keys(df2[col2_block]) if zip_keys is None else zip_keys)[
+                self.zip_level
+            ]
+        other_keys = field_keys or [compute_match_keys(df2[spec.col2]) for spec in self.specs[1:]]
+        with metrics.stage("blocking"):
+            self.candidates = CandidateBlocks.build(
+                df2,
+                self.col2,
+                block_col=col2_block,
+                lead_filter=self.lead_filter,
+                keys=match_keys,
+                zips=zips,
+                field_values=[keys["processed"].tolist() for keys in other_keys],
+                ngram_index=ngram_index,
+                neighborhood=neighborhood,
+            )
+
+    def match(
+        self,
+        df1: pd.DataFrame,
+        *,
+        match_keys: Optional[pd.DataFrame] = None,
+        zip_keys: Optional[pd.DataFrame] = None,
+        field_keys: Optional[Sequence[pd.DataFrame]] = None,
+    ) -> List[MatchDecision]:
+        """Match every row of df1 against the indexed df2 rows, one score matrix per block.
+
+        `match_keys`, `zip_keys` and `field_keys` are the df1 counterparts of
+        those of `index`. Returns one decision per df1 row, in df1 order, with
+        positions into df2. Raises ValueError when no df2 rows were indexed.
+        """
+        candidates = self.candidates
+        if candidates is None:
+            raise ValueError("No candidate rows indexed; call index() first.")
+        col1_block = self.block_cols[0] if self.block_cols is not None else None
+        specs, top_k = self.specs, self.top_k
+        score_cutoff, confident_score = self.score_cutoff, self.confident_score
+        keys1 = compute_match_keys(df1[self.col1]) if match_keys is None else match_keys
+        zips1 = None
+        if col1_block is not None:
+            zips1 = (compute_zip_keys(df1[col1_block]) if zip_keys is None else zip_keys)[
+                self.zip_level
+            ]
+        other_keys = field_keys or [compute_match_keys(df1[spec.col1]) for spec in specs[1:]]
+        field_values = [keys["processed"].tolist() for keys in other_keys]
+
+        decisions = [MatchDecision(pos, "none") for pos in range(len(df1))]
+        resolved = None
+        if self.exact_first:
+            with metrics.stage("exact_join"):
+                hits = lookup_exact(
+                    build_exact_keys(df1, keys1, col1_block, zips1), candidates.exact
+                )
+                resolved = np.flatnonzero(hits >= 0)
+                scores = np.full(len(resolved), 100.0)
+                pair_fields: List[List[Tuple[float, ...]]] = [[] for _ in resolved]
+                if field_values:
+                    # An exact address still has to agree on the other fields
+                    processed1 = keys1["processed"].tolist()
+                    src = [[processed1[pos] for pos in resolved]]
+                    cand = [[candidates.processed[hits[pos]] for pos in resolved]]
+                    for values1, values2 in zip(field_values, candidates.field_values):
+                        src.append([values1[pos] for pos in resolved])
+                        cand.append([values2[hits[pos]] for pos in resolved])
+                    scores, stacked = combined_pair_scores(
+                        src, cand, specs, score_cutoff=score_cutoff
+                    )
+                    pair_fields = [[tuple(float(score) for score in pair)] for pair in stacked.T]
+                for pos, score, pos_fields in zip(resolved, scores, pair_fields):
+                    if score > confident_score:
+                        best = [(int(hits[pos]), float(score))]
+                        decisions[pos] = MatchDecision(
+                            int(pos), "match", best, "exact", pos_fields, best if top_k else []
+                        )
+                resolved = resolved[scores > confident_score]
+
+        with metrics.stage("blocking"):
+            tasks = candidates.block_tasks(
+                df1,
+                keys1,
+                col1_block,
+                zips=zips1,
+                resolved=resolved,
+                top_n=self.top_n,
+                field_values=field_values,
+            )
+        unscored = len(df1) - (0 if resolved is None else len(resolved))
+        for task in tasks:
+            metrics.observe("candidate_block", len(task.cand_choices), len(task.src_queries))
+            metrics.count("scorer_calls", task.cost)
+            unscored -= len(task.src_queries)
+        metrics.count("rows_skipped_no_candidates", unscored)
+
+        with metrics.stage("scoring"):
+            if not self._parallel(len(df1)) or len(tasks) < 2:
+                results = [score_tasks(tasks, specs, top_k, score_cutoff, confident_score)]
+            else:
+                shards = shard_tasks(tasks, self.workers * 4)
+                n_shards = len(shards)
+                results = list(
+                    self._pool().map(
+                        score_tasks,
+                        shards,
+                        [specs] * n_shards,
+                        [top_k] * n_shards,
+                        [score_cutoff] * n_shards,
+                        [confident_score] * n_shards,
+                    )
+                )
+
+        for shard_decisions in results:
+            for decision in shard_decisions:
+                decisions[decision.src_pos] = decision
+        return decisions
+
+    def _parallel(self, n_rows: int) -> bool:
+        """Return whether rows are scored in the process pool, given the rows of this call."""
+        total = n_rows if self.total_rows is None else self.total_rows
+        return self.workers > 1 and total >= self.min_parallel_rows
+
+    def _pool(self) -> futures.ProcessPoolExecutor:
+        """Return the process pool, starting it on first use."""
+        if self._executor is None:
+            self._executor = futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def close(self):
+        """Shut the process pool down, if it was started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> BlockMatcher:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def match_blocks(
+    df1: pd.DataFrame,
+    df2: pd.DataFrame,
+    col1: str,
+    col2: str,
+    *,
+    block_cols: Optional[Tuple[str, str]] = None,
+    lead_filter: bool = False,
+    fuzz_type: str = "token_set",
+    match_keys: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None,
+    exact_first: bool = True,
+    ngram_index: Optional[NGramIndex] = None,
+    top_n: int = NGRAM_TOP_N,
+    neighborhood: Optional[SortedNeighborhood] = None,
+    zip_keys: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None,
+    zip_level: str = "zip5",
+    fields: Optional[Sequence[FieldSpec]] = None,
+    field_keys: Optional[Sequence[Tuple[pd.DataFrame, pd.DataFrame]]] = None,
+    top_k: int = 0,
+    score_cutoff: float = MATCH_CUTOFF,
+    confident_score: float = CONFIDENT_SCORE,
+    workers: int = 1,
+    min_parallel_rows: int = PARALLEL_MIN_ROWS,
+) -> List[MatchDecision]:
+    """Match every row of df1 against df2, one score matrix per block.
+
+    With `block_cols` the rows are blocked on the (zip) columns of both tables,
+    and with `lead_filter` they are further blocked on the leading house number
+    or word, as `filter_by_lead_digits` does in the row-by-row path.
+    Pass the cached `Table.match_keys` frames of both columns as `match_keys`,
+    and the cached `Table.zip_keys` frames of the block columns as `zip_keys`,
+    to avoid recomputing them. Zips are compared in their canonical 5-digit
+    form, or on their first three digits with `zip_level="zip3"` for coarser blocks.
+
+    With `exact_first`, rows whose normalized (zip, address) key equals the key
+    of exactly one df2 row are matched by a hash join, and only the rest are
+    scored.
+
+    Pass an `ngram_index` over the processed col2 values, or a sorted
+    `neighborhood` over the col2 neighborhood keys, to give rows that blocking
+    finds nothing for a short list of candidates, see `build_block_tasks`.
+
+    `fields` are the weighted field pairs to score, the first being (col1, col2);
+    by default that pair alone is scored with `fuzz_type`. Decisions are made
+    on the combined score, and exact hits must also pass the `min_score` of the
+    other fields. `field_keys` are the cached match key frames of the other
+    fields, like `match_keys`.
+
+    With `top_k`, each decision also keeps its `top_k` best candidates whatever
+    their score (see `candidate_export`); exact hits keep their single hit.
+
+    Candidates scoring below `score_cutoff` are dropped, and a match must
+    score above `confident_score`, see `classify_scores`.
+
+    With `workers` > 1 the blocks are sharded over a process pool, unless df1
+    has fewer than `min_parallel_rows` rows and isn't worth the pool startup.
+    To match df1 in chunks against the same df2, use a `BlockMatcher`.
+    Returns one decision per df1 row, in df1 order.
+    """
+    keys1, keys2 = match_keys or (None, None)
+    zip_keys1, zip_keys2 = zip_keys or (None, None)
+    with BlockMatcher(
+        col1,
+        col2,
+        block_cols=block_cols,
+        lead_filter=lead_filter,
+        fuzz_type=fuzz_type,
+        exact_first=exact_first,
+        top_n=top_n,
+        zip_level=zip_level,
+        fields=fields,
+        top_k=top_k,
+        score_cutoff=score_cutoff,
+        confident_score=confident_score,
+        workers=workers,
+        min_parallel_rows=min_parallel_rows,
+    ) as matcher:
+        matcher.index(
+            df2,
+            match_keys=keys2,
+            zip_keys=zip_keys2,
+            field_keys=[keys for _, keys in field_keys] if field_keys else None,
+            ngram_index=ngram_index,
+            neighborhood=neighborhood,
+        )
+        return matcher.match(
+            df1,
+            match_keys=keys1,
+            zip_keys=zip_keys1,
+            field_keys=[keys for keys, _ in field_keys] if field_keys else None,
+        )
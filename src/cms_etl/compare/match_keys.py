@@ -0,0 +1,66 @@
+"""Normalized match keys derived from a column."""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+import pandas as pd
+from rapidfuzz.utils import default_process
+
+from cms_etl.compare.address import is_address_column, standardize_address, standardize_addresses
+
+MATCH_KEY_COLS = ["standardized", "processed", "house_num", "lead_alpha"]
+"""Columns of a match key frame."""
+
+_NON_ALNUM_RE = re.compile(r"[\W_]")
+
+
+def process_strings(text: pd.Series) -> pd.Series:
+    """Return a string column as rapidfuzz's `default_process` returns each value.
+
+    Characters other than letters and digits become spaces, the result is
+    lowercased and stripped, and missing values become "".
+    """
+    processed = text.astype("string").str.replace(_NON_ALNUM_RE, " ", regex=True)
+    return processed.str.lower().str.strip().fillna("").astype(object)
+
+
+def compute_match_keys(col: pd.Series, *, address: Optional[bool] = None) -> pd.DataFrame:
+    """Return the match keys of a column, aligned to its index.
+
+    - standardized: the value with USPS suffix, directional and unit abbreviations
+      for an `address` column, otherwise the stripped value.
+    - processed: the standardized value as `default_process` returns it ("" when missing).
+    - house_num: the leading digits of the standardized value as an integer.
+    - lead_alpha: the leading letters of the standardized value, when it has no house number.
+
+    By default a column is an address column when its name says so (see `is_address_column`).
+    """
+    if address is None:
+        address = is_address_column(col.name)
+    text = standardize_addresses(col) if address else col.astype("string").str.strip()
+    digits = text.str.extract(r"^(\d+)", expand=False)
+    digits = digits.where(digits.str.len() <= 18)  # longer runs aren't house numbers
+    lead_alpha = text.str.extract(r"^([a-zA-Z]+)", expand=False)
+    return pd.DataFrame(
+        {
+            "standardized": text,
+            "processed": process_strings(text),
+            "house_num": pd.to_numeric(digits).astype(pd.Int64Dtype()),
+            "lead_alpha": lead_alpha,
+        },
+        index=col.index,
+    )
+
+
+def standardize_value(value: Optional[str], *, address: bool) -> str:
+    """Return a single value standardized as `compute_match_keys` standardizes its column."""
+    if not isinstance(value, str):
+        return ""
+    return standardize_address(value) if address else value.strip()
+
+
+def process_value(value: Optional[str], *, address: bool) -> str:
+    """Return the processed match key of a single value ("" when missing)."""
+    return default_process(standardize_value(value, address=address))
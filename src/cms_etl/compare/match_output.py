@@ -0,0 +1,187 @@
+"""Format and write the matches produced by a comparison."""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+from pathlib import Path
+from textwrap import indent
+from time import time
+from typing import IO, Any, Dict, Iterable, Iterator, Literal, Optional, Set, Tuple
+
+type RowStatus = Literal["match", "queued", "none"]
+
+
+def format_match(
+    src_row: Dict[str, Any],
+    match_row: Dict[str, Any],
+    source_types: Tuple[str, str],
+    category_id: Optional[int],
+) -> Dict[str, Any]:
+    """Return a match record keyed by the source type of each table."""
+    record = {source_types[0]: src_row, source_types[1]: match_row}
+    if category_id:
+        record["cms"]["category_id"] = category_id
+    return record
+
+
+def write_matches(
+    records: Iterable[Dict[str, Any]], category_id: Optional[int], directory: str | Path = "."
+) -> Path:
+    """Write match records to `matches_{category_id}_{timestamp}.json` and return its path.
+
+    Records are written one at a time, so they can come from a stream. A file
+    written in the same second is never overwritten: the new one gets a `_1`,
+    `_2`, ... suffix instead.
+    """
+    stamp = int(time())
+    for n in itertools.count():
+        suffix = f"_{n}" if n else ""
+        path = Path(directory) / f"matches_{category_id}_{stamp}{suffix}.json"
+        try:
+            f = open(path, "x", encoding="utf-8")  # pylint: disable=consider-using-with
+            break
+        except FileExistsError:
+            continue
+    with f:
+        f.write("[")
+        written = 0
+        for record in records:
+            record["cms"]["profile_id"] = record["db"]["id"]
+            f.write("," if written else "")
+            f.write("\n" + indent(json.dumps(record, indent=2, default=str), "  "))
+            written += 1
+        f.write("\n]" if written else "]")
+    return path
+
+
+class MatchStream:
+    """Append-only JSONL log of per-row match decisions with a resumable checkpoint.
+
+    Every processed table1 row gets a line. The checkpoint records the last
+    position whose decisions (and review queue) were saved, whether the run
+    completed, and the `digest` of the comparison that wrote the stream, so a
+    resumed run skips exactly the committed rows of the same comparison.
+    """
+
+    def __init__(self, path: str | Path, digest: str = ""):
+        self.path = Path(path)
+        self.digest = digest
+        self.checkpoint_path = self.path.with_suffix(".checkpoint.json")
+        self._file: Optional[IO[str]] = None
+
+    def load_checkpoint(self) -> Dict[str, Any] | None:
+        """Return the last checkpoint, if any."""
+        if not self.checkpoint_path.exists():
+            return None
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @property
+    def incomplete(self) -> bool:
+        """Check if the stream holds a run that did not finish."""
+        checkpoint = self.load_checkpoint()
+        return self.path.exists() and not (checkpoint and checkpoint.get("complete"))
+
+    def _lines(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the decisions in the stream, skipping a partially written last line."""
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def decided_positions(self) -> Set[int]:
+        """Return the table1 positions that already have a decision."""
+        return {line["src_pos"] for line in self._lines()}
+
+    def rollback(self) -> Set[int]:
+        """Drop the decisions written after the last checkpoint and return the positions kept.
+
+        Lines past the checkpoint belong to rows whose review queue items may
+        not have been saved, so those rows are decided again. Raises
+        ValueError when the checkpoint was written by another comparison.
+        """
+        checkpoint = self.load_checkpoint() or {}
+        if checkpoint and checkpoint.get("digest", "") != self.digest:
+            raise ValueError(
+                f"{self.path} was written by another comparison "
+                f"({checkpoint.get('digest')!r}, expected {self.digest!r})."
+            )
+        last_pos = checkpoint.get("last_pos", -1)
+        lines = list(self._lines())
+        kept = [line for line in lines if line["src_pos"] <= last_pos]
+        if len(kept) < len(lines) and self.path.exists():
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(line, default=str) + "\n" for line in kept)
+            os.replace(tmp_path, self.path)
+        return {line["src_pos"] for line in kept}
+
+    def matches(self) -> Iterator[Tuple[int, Dict[str, Any], Dict[str, Any]]]:
+        """Iterate over `(src_pos, source row, match row)` for the matched rows."""
+        for line in self._lines():
+            if line["status"] == "match":
+                yield line["src_pos"], line["source"], line["match"]
+
+    def open(self, resume: bool = False) -> MatchStream:
+        """Open the stream for writing, appending to its committed decisions when resuming."""
+        if resume and self.path.exists():
+            self._drop_partial_line()
+            self.rollback()
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self.checkpoint_path.unlink(missing_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")
+        return self
+
+    def _drop_partial_line(self):
+        """Truncate a last line that was cut off by a crash."""
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def write(
+        self,
+        src_pos: int,
+        status: RowStatus,
+        source: Optional[Dict[str, Any]] = None,
+        match: Optional[Dict[str, Any]] = None,
+    ):
+        """Append the decision for a table1 row."""
+        if self._file is None:
+            raise ValueError("MatchStream is not open.")
+        line: Dict[str, Any] = {"src_pos": src_pos, "status": status}
+        if status == "match":
+            line["source"], line["match"] = source, match
+        self._file.write(json.dumps(line, default=str) + "\n")
+
+    def checkpoint(self, last_pos: int, complete: bool = False):
+        """Flush the stream to disk and record the last processed table1 position.
+
+        Save anything the decisions refer to, like the review queue, first.
+        """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"last_pos": last_pos, "complete": complete, "digest": self.digest}))
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        """Close the stream."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> MatchStream:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
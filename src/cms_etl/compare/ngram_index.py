@@ -0,0 +1,141 @@
+"""Character n-gram inverted index for candidate generation."""
+
+from __future__ import annotations
+
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Set
+
+import numpy as np
+
+NGRAM_SIZE = 3
+"""Length of the character n-grams."""
+
+NGRAM_TOP_N = 25
+"""Default number of candidates returned per query."""
+
+
+def ngrams(text: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """Return the distinct n-grams of a processed string, padded with a space on both ends."""
+    if not text:
+        return set()
+    padded = f" {text} "
+    return {padded[i : i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+def values_digest(values: Iterable[str]) -> str:
+    """Return a digest of the indexed values, used to check a saved index still applies."""
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(value.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class NGramIndex:
+    """Map each n-gram to the positions of the values that contain it.
+
+    Values are expected to be processed already (e.g. the `processed` match
+    keys of a column), and positions are positions in that sequence.
+    Postings are stored in CSR form so the index can be saved with numpy.
+    """
+
+    def __init__(
+        self,
+        grams: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        *,
+        size: int,
+        digest: str,
+        n: int = NGRAM_SIZE,
+    ):
+        self.n = n
+        self.size = size
+        self.digest = digest
+        self._grams = grams
+        self._offsets = offsets
+        self._postings = postings
+        self._lookup: Dict[str, int] = {str(gram): i for i, gram in enumerate(grams)}
+
+    @classmethod
+    def build(cls, values: Sequence[str], n: int = NGRAM_SIZE) -> NGramIndex:
+        """Build the index over processed values."""
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for pos, value in enumerate(values):
+            for gram in ngrams(value, n):
+                postings[gram].append(pos)
+        grams = sorted(postings)
+        lengths = np.array([len(postings[gram]) for gram in grams], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        flat = np.fromiter(
+            (pos for gram in grams for pos in postings[gram]), dtype=np.intp, count=offsets[-1]
+        )
+        return cls(
+            np.array(grams, dtype=str),
+            offsets,
+            flat,
+            size=len(values),
+            digest=values_digest(values),
+            n=n,
+        )
+
+    def top_n(self, query: str, n: int = NGRAM_TOP_N) -> np.ndarray:
+        """Return the positions of the `n` values sharing the most n-grams with the query.
+
+        Ties are broken by position.
+        """
+        slices = [
+            self._postings[self._offsets[i] : self._offsets[i + 1]]
+            for gram in ngrams(query, self.n)
+            if (i := self._lookup.get(gram)) is not None
+        ]
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+        positions, counts = np.unique(np.concatenate(slices), return_counts=True)
+        order = np.lexsort((positions, -counts))[:n]
+        return positions[order]
+
+    def save(self, path: str | Path):
+        """Write the index to a `.npz` file."""
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                grams=self._grams,
+                offsets=self._offsets,
+                postings=self._postings,
+                meta=np.array([self.n, self.size], dtype=np.int64),
+                digest=np.array(self.digest),
+            )
+
+    @classmethod
+    def load(cls, path: str | Path) -> NGramIndex:
+        """Load an index written by `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            n, size = (int(val) for val in data["meta"])
+            return cls(
+                data["grams"],
+                data["offsets"],
+                data["postings"],
+                size=size,
+                digest=str(data["digest"]),
+                n=n,
+            )
+
+    @classmethod
+    def load_or_build(cls, path: str | Path, values: Sequence[str]) -> NGramIndex:
+        """Load the index saved at `path` if it was built over `values`, else build and save it."""
+        path = Path(path)
+        if path.exists():
+            try:
+                index = cls.load(path)
+                if index.size == len(values) and index.digest == values_digest(values):
+                    return index
+            except (OSError, ValueError, KeyError):
+                pass
+        index = cls.build(values)
+        index.save(path)
+        return index
+
+    def __len__(self):
+        return len(self._lookup)
@@ -0,0 +1,173 @@
+"""Queue of match decisions deferred for human review."""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
+
+import pandas as pd
+from rich.columns import Columns
+
+from cms_etl.compare.compare_tools import prompt_candidate_index
+from cms_etl.compare.decision_cache import DecisionCache
+from cms_etl.utils import console
+
+type ReviewKind = Literal["ambiguous", "line2"]
+type ReviewStatus = Literal["pending", "accepted", "rejected"]
+
+
+@dataclass
+class ReviewCandidate:
+    """A table2 row offered to the reviewer, and its decision cache key."""
+
+    pos: int
+    score: float
+    row: Dict[str, Any]
+    key: str = ""
+
+
+@dataclass
+class ReviewItem:
+    """A table1 row whose match needs a human decision.
+
+    - ambiguous: several candidates scored above the confidence threshold.
+    - line2: a candidate matched on line 1 but not on line 2 (or another scored field).
+
+    `src_key` is the decision cache key of the source row; items without keys are not cached.
+    """
+
+    kind: ReviewKind
+    src_pos: int
+    source: Dict[str, Any]
+    candidates: List[ReviewCandidate]
+    detail: str = ""
+    status: ReviewStatus = "pending"
+    choice: Optional[int] = None
+    src_key: str = ""
+
+    @property
+    def chosen(self) -> Optional[Dict[str, Any]]:
+        """Return the accepted candidate row."""
+        if self.status != "accepted" or self.choice is None:
+            return None
+        return self.candidates[self.choice].row
+
+
+@dataclass
+class ReviewQueue:
+    """A persisted queue of review items.
+
+    `metadata` carries what is needed to write the reviewed matches later:
+    the source types and match columns of both tables and the category id,
+    and the `scorer` key the decisions are cached under.
+    """
+
+    path: Path
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    items: List[ReviewItem] = field(default_factory=list)
+
+    def add(self, item: ReviewItem):
+        """Add an item to the queue."""
+        self.items.append(item)
+
+    def keep(self, positions: Set[int]):
+        """Drop the items of the table1 rows outside `positions`, e.g. rows decided again."""
+        self.items = [item for item in self.items if item.src_pos in positions]
+
+    @property
+    def pending(self) -> List[ReviewItem]:
+        """Return the items still waiting for a decision."""
+        return [item for item in self.items if item.status == "pending"]
+
+    def accepted(self) -> List[Tuple[int, Dict[str, Any], Dict[str, Any]]]:
+        """Return `(src_pos, source row, chosen row)` for accepted items, in table1 order."""
+        return sorted(
+            (
+                (item.src_pos, item.source, item.chosen)
+                for item in self.items
+                if item.chosen is not None
+            ),
+            key=lambda accepted: accepted[0],
+        )
+
+    def save(self):
+        """Write the queue to its path, replacing the file atomically."""
+        data = {"metadata": self.metadata, "items": [asdict(item) for item in self.items]}
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, indent=2, default=str))
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> ReviewQueue:
+        """Load a queue from a file."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        items = [
+            ReviewItem(
+                **{
+                    **item,
+                    "candidates": [ReviewCandidate(**cand) for cand in item["candidates"]],
+                }
+            )
+            for item in data["items"]
+        ]
+        return cls(Path(path), data["metadata"], items)
+
+    def review(self, cache: Optional[DecisionCache] = None) -> int:
+        """Work through the pending items interactively and return how many were decided.
+
+        The queue is saved after every decision so an interrupted session can resume.
+        With a decision `cache`, items whose pairs were decided before are settled
+        without prompting, and new decisions are recorded.
+        """
+        decided = 0
+        pending = self.pending
+        scorer = self.metadata.get("scorer", "")
+        for i, item in enumerate(pending, start=1):
+            keys = [cand.key for cand in item.candidates]
+            settled, choice = False, None
+            if cache is not None and item.src_key:
+                settled, choice = cache.cached_choice(item.src_key, keys, scorer)
+            if not settled:
+                console.rule(f"Review {i} of {len(pending)}")
+                match item.kind:
+                    case "ambiguous":
+                        choice = self._prompt_ambiguous(item)
+                    case "line2":
+                        choice = self._prompt_line2(item)
+                if cache is not None and item.src_key:
+                    cache.record(item.src_key, keys, scorer, choice)
+            item.status = "rejected" if choice is None else "accepted"
+            item.choice = choice
+            decided += 1
+            self.save()
+        return decided
+
+    def _prompt_ambiguous(self, item: ReviewItem) -> Optional[int]:
+        """Ask the reviewer to pick one of several candidates."""
+        col1, col2 = self.metadata["columns"]
+        return prompt_candidate_index(
+            pd.DataFrame([cand.row for cand in item.candidates]),
+            [cand.score for cand in item.candidates],
+            pd.Series(item.source),
+            col2,
+            item.source[col1],
+        )
+
+    def _prompt_line2(self, item: ReviewItem) -> Optional[int]:
+        """Ask the reviewer whether to keep a match that failed line 2 validation."""
+        console.clear()
+        console.rule(item.detail)
+        console.print(
+            Columns(
+                [str(pd.Series(item.source)), str(pd.Series(item.candidates[0].row))],
+                padding=(4, 2),
+            ),
+            justify="center",
+        )
+        choice = console.input("Enter 'y' to keep the match: ")
+        return 0 if choice.lower() == "y" else None
@@ -0,0 +1,131 @@
+"""Weighted scoring of several field pairs at once."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Literal, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from cms_etl.compare.compare_tools import get_algo_dict
+from cms_etl.compare.decision_cache import field_key
+
+type MissingPolicy = Literal["skip", "mismatch"]
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """A column pair compared with a scorer, and its weight in the combined score.
+
+    - missing: when only one side has a value, "skip" leaves the field out of
+      the combined score and "mismatch" scores it 0. Fields missing on both
+      sides are always left out.
+    - min_score: a candidate scoring at or below it on this field is never
+      accepted automatically. Its combined score is capped at the cutoff, and
+      held there when the first field clears the cutoff, so that it stays
+      a candidate for review.
+    """
+
+    col1: str
+    col2: str
+    scorer: str = "token_set"
+    weight: float = 1.0
+    missing: MissingPolicy = "skip"
+    min_score: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        """Return how the field is scored, as it appears in a decision cache `scorer_key`."""
+        return field_key(self.scorer, self.weight, self.missing, self.min_score)
+
+
+def combined_scores(
+    src_values: Sequence[Sequence[str]],
+    cand_values: Sequence[Sequence[str]],
+    specs: Sequence[FieldSpec],
+    *,
+    score_cutoff: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the combined score matrix of sources against candidates, and each field's matrix.
+
+    `src_values` and `cand_values` hold the processed values of each field,
+    in `specs` order. The combined score is the weighted mean of the fields
+    present on the pair, capped at (or held at) `score_cutoff` where a field
+    fails its `min_score`. Field matrices are stacked as (field, source, candidate).
+    """
+    algos = get_algo_dict()
+    # The stubs type dtype as a np.dtype, but rapidfuzz only accepts the scalar type
+    fields = np.stack(
+        [
+            process.cdist(  # type: ignore[call-overload]
+                queries,
+                choices,
+                scorer=algos.get(spec.scorer, fuzz.ratio),
+                processor=None,
+                dtype=np.float32,
+            )
+            for spec, queries, choices in zip(specs, src_values, cand_values)
+        ]
+    )
+    has_src, has_cand = _has_value(src_values)[:, :, None], _has_value(cand_values)[:, None, :]
+    return _combine(fields, has_src, has_cand, specs, score_cutoff), fields
+
+
+def combined_pair_scores(
+    src_values: Sequence[Sequence[str]],
+    cand_values: Sequence[Sequence[str]],
+    specs: Sequence[FieldSpec],
+    *,
+    score_cutoff: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Like `combined_scores`, but score each source only against the candidate at its position.
+
+    Field scores are stacked as (field, pair).
+    """
+    algos = get_algo_dict()
+    fields = np.stack(
+        [
+            process.cpdist(  # type: ignore[call-overload]
+                queries,
+                choices,
+                scorer=algos.get(spec.scorer, fuzz.ratio),
+                processor=None,
+                dtype=np.float32,
+            )
+            for spec, queries, choices in zip(specs, src_values, cand_values)
+        ]
+    )
+    has_src, has_cand = _has_value(src_values), _has_value(cand_values)
+    return _combine(fields, has_src, has_cand, specs, score_cutoff), fields
+
+
+def _has_value(values: Sequence[Sequence[str]]) -> np.ndarray:
+    """Return which values of each field are not empty, as a (field, value) array."""
+    return np.array([[bool(value) for value in field] for field in values], dtype=bool)
+
+
+def _combine(
+    fields: np.ndarray,
+    has_src: np.ndarray,
+    has_cand: np.ndarray,
+    specs: Sequence[FieldSpec],
+    score_cutoff: float,
+) -> np.ndarray:
+    """Weigh the stacked field scores into one score, filling in missing values in place."""
+    shape = fields.shape[1:]
+    total = np.zeros(shape)
+    weights = np.zeros(shape)
+    failed = np.zeros(shape, dtype=bool)
+    for spec, scores, src, cand in zip(specs, fields, has_src, has_cand):
+        scores[~(src & cand)] = 0.0
+        scores[~(src | cand)] = 100.0  # nothing on either side agrees
+        present = src & cand if spec.missing == "skip" else src | cand
+        total += np.where(present, spec.weight * scores, 0.0)
+        weights += np.where(present, spec.weight, 0.0)
+        if spec.min_score is not None:
+            failed |= present & (scores <= spec.min_score)
+    combined = np.divide(total, weights, out=np.zeros_like(total), where=weights > 0)
+    np.minimum(combined, score_cutoff, out=combined, where=failed)
+    combined[failed & (fields[0] >= score_cutoff)] = score_cutoff
+    return combined
@@ -0,0 +1,156 @@
+"""Seeded generator of CMS-like provider tables with a known ground truth."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+STREETS = [
+    "Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Washington", "Lake", "Hill", "Park",
+    "Church", "Mill", "River", "Spring", "Sunset", "Highland", "Meadow", "Forest", "Lincoln",
+    "Jefferson", "Franklin", "Walnut", "Chestnut", "Madison", "Ridge", "Valley", "Willow",
+    "Jackson", "Center", "Liberty",
+]  # fmt: skip
+SUFFIXES = [
+    ("Street", "St"), ("Avenue", "Ave"), ("Road", "Rd"), ("Drive", "Dr"),
+    ("Boulevard", "Blvd"), ("Lane", "Ln"), ("Court", "Ct"), ("Parkway", "Pkwy"),
+]  # fmt: skip
+DIRECTIONS = ["", "", "", "North", "South", "East", "West"]
+NAME_WORDS = [
+    "Sunny", "Green", "Golden", "Silver", "Pleasant", "Heritage", "Willow", "Cedar",
+    "Lakeview", "Riverside", "Meadow", "Harbor", "Summit", "Valley", "Crestview", "Brookside",
+]  # fmt: skip
+NAME_KINDS = [
+    ("Nursing Home", "NH"), ("Rehabilitation Center", "Rehab Ctr"),
+    ("Health Care Center", "HCC"), ("Care Center", "Care Ctr"), ("Senior Living", "Sr Living"),
+]  # fmt: skip
+LINE2_KINDS = [("Suite", "Ste"), ("Unit", "Unit"), ("Building", "Bldg")]
+
+CMS_COLUMNS = [
+    "CMS Certification Number (CCN)",
+    "Provider Name",
+    "Provider Address",
+    "Address Line 2",
+    "City/Town",
+    "State",
+    "ZIP Code",
+]
+DB_COLUMNS = ["id", "name", "address", "address2", "city", "state", "zip_code"]
+
+
+@dataclass
+class SyntheticTables:
+    """A CMS table, a profile (DB) table and the true profile id of each matched CCN."""
+
+    cms: pd.DataFrame
+    db: pd.DataFrame
+    truth: Dict[str, int]
+
+
+def typo(text: str, rng: np.random.Generator) -> str:
+    """Return the text with one letter dropped, doubled, swapped or replaced."""
+    letters = [i for i, char in enumerate(text) if char.isalpha()]
+    if len(letters) < 2:
+        return text
+    i = int(rng.choice(letters[:-1]))
+    match int(rng.integers(4)):
+        case 0:
+            return text[:i] + text[i + 1 :]
+        case 1:
+            return text[:i] + text[i] + text[i:]
+        case 2:
+            return text[:i] + text[i + 1] + text[i] + text[i + 2 :]
+        case _:
+            return text[:i] + chr(ord("a") + int(rng.integers(26))) + text[i + 1 :]
+
+
+def generate_tables(
+    n_rows: int,
+    seed: int = 0,
+    *,
+    match_rate: float = 0.8,
+    typo_rate: float = 0.1,
+    distractor_rate: float = 0.3,
+    rows_per_zip: int = 20,
+) -> SyntheticTables:
+    """Generate `n_rows` CMS providers and a DB table holding most of them.
+
+    - `match_rate` of the CMS rows have a DB profile, written with abbreviated
+      suffixes, name variants, suite variants and (at `typo_rate`) typos.
+    - `distractor_rate` DB rows per CMS row share its zip and street with a
+      different house number, or its house number with a different street.
+    - About `rows_per_zip` CMS rows share each zip code; some zips have leading
+      zeros, which some DB rows have lost, and some DB rows use ZIP+4.
+    The same arguments always produce the same tables.
+    """
+    rng = np.random.default_rng(seed)
+    n_zips = max(1, n_rows // rows_per_zip)
+    zips = np.char.zfill(rng.integers(501, 99951, size=n_zips).astype(str), 5)
+    ccns = np.char.zfill(rng.permutation(max(n_rows, 1) * 3)[:n_rows].astype(str), 6)
+
+    cms_rows: List[List[str]] = []
+    db_rows: List[List[str]] = []
+    truth_rows: List[int] = []
+    for i in range(n_rows):
+        zip_code = str(zips[rng.integers(n_zips)])
+        number = int(rng.integers(1, 9999))
+        direction = str(rng.choice(DIRECTIONS))
+        street = str(rng.choice(STREETS))
+        suffix_full, suffix_abbr = SUFFIXES[int(rng.integers(len(SUFFIXES)))]
+        kind_full, kind_abbr = NAME_KINDS[int(rng.integers(len(NAME_KINDS)))]
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {kind_full}"
+        line2_full, line2_abbr, unit = "", "", ""
+        if rng.random() < 0.2:
+            line2_full, line2_abbr = LINE2_KINDS[int(rng.integers(len(LINE2_KINDS)))]
+            unit = str(rng.integers(1, 500))
+        city = f"{rng.choice(NAME_WORDS)}{rng.choice(['ville', ' City', 'ton', ' Springs'])}"
+        state = str(rng.choice(["AL", "CA", "CT", "MA", "NJ", "NY", "OH", "TX", "VT"]))
+        street_full = " ".join(part for part in [direction, street, suffix_full] if part)
+        cms_rows.append(
+            [
+                str(ccns[i]),
+                name.upper(),
+                f"{number} {street_full}".upper(),
+                f"{line2_full} {unit}".upper() if unit else "",
+                city.upper(),
+                state,
+                zip_code,
+            ]
+        )
+
+        if rng.random() < match_rate:
+            suffix = suffix_abbr if rng.random() < 0.5 else suffix_full
+            db_street = " ".join(part for part in [direction[:1], street, suffix] if part)
+            if rng.random() < typo_rate:
+                db_street = typo(db_street, rng)
+            db_name = name.replace(kind_full, kind_abbr) if rng.random() < 0.3 else name
+            db_line2 = f"{line2_abbr if rng.random() < 0.3 else line2_full} {unit}" if unit else ""
+            db_zip = zip_code
+            if rng.random() < 0.05:
+                db_zip = zip_code.lstrip("0")
+            elif rng.random() < 0.05:
+                db_zip = f"{zip_code}-{rng.integers(1000, 9999)}"
+            db_rows.append([db_name, f"{number} {db_street}", db_line2, city, state, db_zip])
+            truth_rows.append(i)
+
+        if rng.random() < distractor_rate:
+            if rng.random() < 0.5:
+                other = f"{int(rng.integers(1, 9999))} {street_full}"
+            else:
+                other = f"{number} {rng.choice(STREETS)} {suffix_abbr}"
+            other_name = f"{rng.choice(NAME_WORDS)} {kind_full}"
+            db_rows.append([other_name, other, "", city, state, zip_code])
+            truth_rows.append(-1)
+
+    order = rng.permutation(len(db_rows))
+    db = pd.DataFrame([db_rows[j] for j in order], columns=DB_COLUMNS[1:])
+    db.insert(0, "id", np.arange(1, len(db) + 1))
+    truth = {
+        str(ccns[truth_rows[j]]): int(row_id)
+        for row_id, j in zip(db["id"], order)
+        if truth_rows[j] >= 0
+    }
+    return SyntheticTables(pd.DataFrame(cms_rows, columns=CMS_COLUMNS), db, truth)
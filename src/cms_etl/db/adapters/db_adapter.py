@@ -2,10 +2,10 @@
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Any, Literal, Sequence
+from typing import Any, Literal, Optional, Sequence
 
 import pandas as pd
-from sqlalchemy import Engine, Row, create_engine, exc
+from sqlalchemy import Engine, Row, bindparam, create_engine, exc, inspect, text
 
 from cms_etl.db.adapters.config import DBConfig
 
@@ -64,6 +64,38 @@ class DatabaseAdapter[T: DBConfig](ABC):
         """Return a DataFrame of the specified table."""
         return pd.read_sql_table(table, self.engine)
 
+    def list_columns(self, table: str) -> list[str]:
+        """Return the column names of a table, in table order."""
+        return [col["name"] for col in inspect(self.engine).get_columns(table)]
+
+    def is_indexed(self, table: str, col: str) -> bool:
+        """Return whether lookups on a column can use an index (it leads an index or the key)."""
+        inspector = inspect(self.engine)
+        indexes: list[Sequence[Optional[str]]] = [
+            index["column_names"] for index in inspector.get_indexes(table)
+        ]
+        indexes.append(inspector.get_pk_constraint(table)["constrained_columns"])
+        return any(cols and cols[0] == col for cols in indexes)
+
+    def select_in(
+        self,
+        table: str,
+        col: str,
+        values: Sequence[Any],
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Return the rows of a table whose column holds one of the values.
+
+        The values are bound as parameters of a single `IN` list.
+        """
+        quote = self.engine.dialect.identifier_preparer.quote
+        select = ", ".join(quote(name) for name in columns) if columns else "*"
+        query = text(
+            f"SELECT {select} FROM {quote(table)} WHERE {quote(col)} IN :values"
+        ).bindparams(bindparam("values", expanding=True))
+        with self.engine.connect() as c:
+            return pd.read_sql(query, c, params={"values": list(values)})
+
     def __getitem__(self, table: str) -> pd.DataFrame:
         """Return a DataFrame of the specified table."""
         return self.get_table(table)
@@ -1,10 +1,12 @@
 """Main module for the cms_etl application."""
 
 import argparse
-from typing import Any, Dict
+import sys
+from typing import Any, Dict, Optional, Sequence
 
 from cms_etl.app_context import AppContext
-from cms_etl.db.adapters.config import MySQLConfig
+from cms_etl.batch import add_match_parser, run_batch_match
+from cms_etl.db.adapters.config import DBConfig, MySQLConfig, SQLiteConfig
 
 # TODO: Add logging
 # TODO: Implement config file for database credentials
@@ -12,17 +14,19 @@ from cms_etl.db.adapters.config import MySQLConfig
 # TODO: PANDASGUI needs to be removed. Replace with web-based viewer?
 
 
-def main():
+def main(argv: Optional[Sequence[str]] = None):
     """
-    Main entry point for the interactive environment.
+    Main entry point for the interactive environment, or for the `match` batch job.
     """
     parser = argparse.ArgumentParser(description="Process database credentials.")
     parser.add_argument("--user", type=str, required=False, help="Database user")
     parser.add_argument("--password", type=str, required=False, help="Database password")
     parser.add_argument("--host", type=str, required=False, help="Database host")
     parser.add_argument("--db_name", type=str, required=False, help="Database name")
+    subparsers = parser.add_subparsers(dest="command")
+    add_match_parser(subparsers)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     db_creds: Dict[str, Any] = {
         "user": args.user,
@@ -33,8 +37,15 @@ def main():
 
     ctx = None
 
-    db_cfg = MySQLConfig(**db_creds) if all(db_creds.values()) else None
+    db_cfg: Optional[DBConfig] = MySQLConfig(**db_creds) if all(db_creds.values()) else None
+    if args.command == "match":
+        if args.sqlite:
+            db_cfg = SQLiteConfig(file_path=args.sqlite)
+        sys.exit(run_batch_match(args, db_cfg))
+
     ctx = AppContext(db_cfg)
+    # Warm the metadata cache while the menus load, so browsing CMS categories is instant
+    ctx.data_loader.cms_loader.prefetch_metas()
     ctx.menu_ctrlr.run_main_menu()
 
 
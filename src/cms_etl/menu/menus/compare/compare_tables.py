@@ -2,15 +2,51 @@
 
 from __future__ import annotations
 
+import hashlib
+import heapq
 import json
-from time import time
-from typing import TYPE_CHECKING, Optional
-
+import os
+import re
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
 import pandas as pd
-from rapidfuzz import fuzz
 from rich.columns import Columns
 
-from cms_etl.compare import compare_tools
+from cms_etl.compare.address import is_address_column
+from cms_etl.compare.blocking import SortedNeighborhood, compute_zip_keys, neighborhood_keys
+from cms_etl.compare.candidate_export import candidate_frame, write_candidates
+from cms_etl.compare.db_blocks import DBBlockSource
+from cms_etl.compare.decision_cache import (
+    DECISION_CACHE_PATH,
+    DecisionCache,
+    pair_keys,
+    scorer_key,
+)
+from cms_etl.compare.fingerprints import (
+    FingerprintStore,
+    find_ccn_col,
+    row_fingerprints,
+    row_keys,
+    table_digest,
+)
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.compare.match_engine import (
+    CONFIDENT_SCORE,
+    MATCH_CUTOFF,
+    BlockMatcher,
+    MatchDecision,
+    tier_counts,
+)
+from cms_etl.compare.match_keys import compute_match_keys
+from cms_etl.compare.match_output import MatchStream, RowStatus, format_match, write_matches
+from cms_etl.compare.ngram_index import NGramIndex
+from cms_etl.compare.review_queue import ReviewCandidate, ReviewItem, ReviewKind, ReviewQueue
+from cms_etl.compare.scoring import FieldSpec
 from cms_etl.menu import BaseMenu, MenuOption
 from cms_etl.utils import console
 
@@ -18,6 +54,48 @@ if TYPE_CHECKING:
     from cms_etl.app_context import AppContext
     from cms_etl.table.table import Table
 
+CHECKPOINT_ROWS = 5000
+"""Number of table1 rows matched between checkpoints."""
+
+ADDRESS_WEIGHT = 3.0
+"""Weight of the address line 1 score in the combined score of an address match."""
+
+LINE2_WEIGHT = 1.0
+"""Weight of the address line 2 score in the combined score of an address match."""
+
+
+def _row_dict(row: pd.Series) -> Dict[str, Any]:
+    """Return a table row as a dict keyed by column name."""
+    return {str(col): value for col, value in row.to_dict().items()}
+
+
+def _pair_keys(keys: pd.DataFrame, field_keys: Sequence[pd.DataFrame]) -> List[str]:
+    """Return the decision cache keys of the rows of a table, from their match keys."""
+    return pair_keys([keys["processed"], *(field["processed"] for field in field_keys)])
+
+
+@dataclass
+class RowFingerprints:
+    """The fingerprints of the table1 rows of a run, and the rows that keep their decision."""
+
+    store: FingerprintStore
+    row_ids: np.ndarray
+    hashes: np.ndarray
+    carried: np.ndarray
+    enabled: bool
+
+
+@dataclass
+class MatchRun:
+    """Where the decisions of a match run went, and how its rows were resolved."""
+
+    category_id: Optional[int]
+    source_types: Tuple[str, str]
+    stream: MatchStream
+    queue: ReviewQueue
+    tiers: Counter[str]
+    matched: int
+
 
 class CompareTablesMenu(BaseMenu):
     """Compare Table Menu."""
@@ -29,26 +107,66 @@ class CompareTablesMenu(BaseMenu):
         *,
         table1: Optional[Table] = None,
         table2: Optional[Table] = None,
+        workers: Optional[int] = None,
+        extra_fields: Sequence[FieldSpec] = (),
+        top_k: int = 0,
+        decision_cache: Optional[DecisionCache] = None,
+        scorer: str = "token_set",
+        score_cutoff: float = MATCH_CUTOFF,
+        confident_score: float = CONFIDENT_SCORE,
+        window: int = 0,
+        zip_level: str = "zip5",
+        db_blocks: bool = False,
     ):
         super().__init__(ctx, title)
         self.table1: Table | None = table1
         self.table2: Table | None = table2
+        self.workers: int = workers or os.cpu_count() or 1
+        self.extra_fields: List[FieldSpec] = list(extra_fields)
+        self.top_k: int = top_k
+        self.scorer: str = scorer
+        self.score_cutoff: float = score_cutoff
+        self.confident_score: float = confident_score
+        self.window: int = window
+        self.zip_level: str = zip_level
+        self.db_blocks: bool = db_blocks
         self._col_name_t1: str = ""
         self._col_name_t2: str = ""
+        self._fields: List[FieldSpec] = []
+        self._decision_cache: DecisionCache | None = decision_cache
+        self._scorer_key: str = ""
+        self._src_keys: List[str] = []
+        self._cand_keys: List[str] = []
+        self._table2_rows: pd.DataFrame | None = None
+
+    @property
+    def decision_cache(self) -> DecisionCache:
+        """Return the cache of reviewer decisions, opening the default file on first use."""
+        if self._decision_cache is None:
+            self._decision_cache = DecisionCache(DECISION_CACHE_PATH)
+        return self._decision_cache
 
     def _set_options(self):
         """Set menu options."""
         base_options = [
             MenuOption(name="Select Tables for Comparison", action=self.select_tables),
+            MenuOption(name=f"Set Worker Count ({self.workers})", action=self.set_workers),
+            MenuOption(name=f"Set Candidate Export (top {self.top_k})", action=self.set_top_k),
+            MenuOption(
+                name=f"Set Sorted-Neighborhood Window ({self.window or 'off'})",
+                action=self.set_window,
+            ),
         ]
 
         conditional_options = [MenuOption(name="Fuzzy Match Columns", action=self.fuzz_col_vs_col)]
+        review = [MenuOption(name="Review Queued Matches", action=self.review_queued_matches)]
 
         back = [MenuOption(name="Back", action=self.back)]
         self.options = []
-        self.options.append(*base_options)
+        self.options.extend(base_options)
         if self.table1 and self.table2:
             self.options.append(*conditional_options)
+        self.options.extend(review)
         self.options.append(*back)
 
     def select_tables(self):
@@ -115,138 +233,772 @@ class CompareTablesMenu(BaseMenu):
         self._select_column(1)
         self._select_column(2)
 
-    def fuzz_col_vs_col(self):
-        """Fuzzy match columns."""
-        if not self.table1 or not self.table2:
-            console.print("Tables not selected.")
+    def set_columns(self, col1: str, col2: str):
+        """Set the columns to compare without prompting."""
+        self._col_name_t1 = col1
+        self._col_name_t2 = col2
+
+    def set_workers(self):
+        """Set the number of worker processes used for matching."""
+        choice = console.input(f"Enter the number of workers ({self.workers}): ")
+        try:
+            self.workers = max(1, int(choice)) if choice else self.workers
+        except ValueError:
+            console.print("Invalid choice.")
             return
-        self.select_columns()
+        console.print(f"Matching will use {self.workers} worker(s).")
+        cur_menu = self.ctx.menu_ctrlr.menu_stack.peek()
+        cur_menu[2]["workers"] = self.workers
 
-        matches = []
-        are_addrs = "address" in self._col_name_t1.lower() or "address" in self._col_name_t2.lower()
-        for _, row in self.table1.df.iterrows():
-            try:
-                if are_addrs:
-                    t1_col_list = list(self.table1.df.columns)
-                    t1_addr_line2_col = t1_col_list.index(self._col_name_t1) + 1
-                    t2_col_list = list(self.table2.df.columns)
-                    t2_addr_line2_col_idx = t2_col_list.index(self._col_name_t2) + 1
-                    t2_addr_line2_col = t2_col_list[t2_addr_line2_col_idx]
-                    t1_zip_col = [
-                        col for col in t1_col_list if "zip" in col.lower() and "code" in col.lower()
-                    ][0]
-                    t2_zip_col = [
-                        col for col in t2_col_list if "zip" in col.lower() and "code" in col.lower()
-                    ][0]
-
-                    filtered = compare_tools.filter_by_value(
-                        self.table2.df.copy(deep=True), t2_zip_col, str(row[t1_zip_col])
-                    )
+    def set_top_k(self):
+        """Set how many candidates per row are exported by a match run (0 to export none)."""
+        choice = console.input(f"Enter the number of candidates to export per row ({self.top_k}): ")
+        try:
+            self.top_k = max(0, int(choice)) if choice else self.top_k
+        except ValueError:
+            console.print("Invalid choice.")
+            return
+        if self.top_k:
+            console.print(f"Match runs will export the top {self.top_k} candidate(s) per row.")
+        else:
+            console.print("Match runs will not export candidates.")
+        cur_menu = self.ctx.menu_ctrlr.menu_stack.peek()
+        cur_menu[2]["top_k"] = self.top_k
 
-                    if filtered is None or filtered.empty:
-                        continue
+    def set_window(self):
+        """Set the sorted-neighborhood window used for rows that zip blocking finds nothing for.
 
-                    filtered = compare_tools.filter_by_lead_digits(
-                        filtered, self._col_name_t2, row[self._col_name_t1]
-                    )
+        0 uses the n-gram index instead.
+        """
+        choice = console.input(f"Enter the sorted-neighborhood window, 0 for off ({self.window}): ")
+        try:
+            self.window = max(0, int(choice)) if choice else self.window
+        except ValueError:
+            console.print("Invalid choice.")
+            return
+        if self.window:
+            console.print(f"Rows without a zip block will be compared with {self.window} row(s).")
+        else:
+            console.print("Rows without a zip block will use the n-gram index.")
+        cur_menu = self.ctx.menu_ctrlr.menu_stack.peek()
+        cur_menu[2]["window"] = self.window
 
-                    if filtered is None or filtered.empty:
-                        continue
+    def review_queued_matches(self):
+        """Review the decisions deferred by a previous match run and write the run's matches."""
+        queue_path = console.input(f"Enter review queue file path relative to {os.getcwd()}: ")
+        try:
+            queue = ReviewQueue.load(queue_path)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            console.print(f"Failed to load review queue: {e}")
+            return
+        stream = MatchStream(queue.metadata.get("stream", ""))
+        self._review_queue(queue, stream.matches() if stream.path.is_file() else iter([]))
+
+    def _review_queue(self, queue: ReviewQueue, matches: Iterable[Tuple[int, dict, dict]]):
+        """Run a review session over the queue and write its accepted matches with `matches`."""
+        console.print(f"{len(queue.pending)} decision(s) pending review in {queue.path}")
+        if queue.pending:
+            queue.review(self.decision_cache)
+        if queue.metadata.get("fingerprints"):
+            store = FingerprintStore.load(queue.metadata["fingerprints"])
+            store.resolve(queue.items)
+            store.save()
+        self._write_matches(
+            heapq.merge(matches, queue.accepted(), key=lambda match: match[0]),
+            tuple(queue.metadata["source_types"]),
+            queue.metadata["category_id"],
+        )
 
-                    match = compare_tools.fuzz_col_w_process(
-                        filtered.copy(),
-                        row,
-                        self._col_name_t2,
-                        row[self._col_name_t1],
-                        "token_set",
+    def _write_matches(
+        self,
+        matches: Iterable[Tuple[int, dict, dict]],
+        source_types: Tuple[str, str],
+        cat_id: Optional[int],
+        show: bool = True,
+    ) -> Path:
+        """Display and write matches given as `(src_pos, source row, match row)` tuples.
+
+        The time spent displaying them is left out of the `write_matches` stage.
+        """
+        shown = 0.0
+
+        def records():
+            nonlocal shown
+            for _, src_row, match_row in matches:
+                if show:
+                    start = perf_counter()
+                    console.rule()
+                    console.print(
+                        Columns(
+                            [
+                                str(pd.Series(src_row)),
+                                "|\n|\n|\n|\n|\n|\n|\n|\n|\n",
+                                str(pd.Series(match_row)),
+                            ],
+                            padding=(6, 6),
+                        ),
+                        style="white on blue",
+                        justify="center",
                     )
+                    shown += perf_counter() - start
+                yield format_match(src_row, match_row, source_types, cat_id)
+
+        start = perf_counter()
+        path = write_matches(records(), cat_id)
+        metrics.add_time("write_matches", perf_counter() - start - shown)
+        console.print(f"Matches written to {path}")
+        return path
+
+    def write_run_matches(self, run: MatchRun, *, show: bool = True) -> Path:
+        """Write the matches of a run, leaving its queued decisions for a later review."""
+        return self._write_matches(run.stream.matches(), run.source_types, run.category_id, show)
+
+    def fuzz_col_vs_col(self):
+        """Fuzzy match columns, then offer to review the queued decisions.
+
+        See `run_match` for how rows are decided.
+        """
+        if not self.table1 or not self.table2:
+            console.print("Tables not selected.")
+            return
+        self.select_columns()
+        stream = self._match_stream(self._run_digest())
+        resume = (
+            stream.incomplete
+            and console.input("Resume the unfinished match run? (y/n): ").lower() == "y"
+        )
+        run = self.run_match(resume=resume)
+        self._finish_run(run.queue, run.stream, run.source_types, run.category_id)
+        self._report_metrics(run.category_id)
+
+    def run_match(self, *, resume: bool = False) -> MatchRun:
+        """Match the selected columns of table1 against table2, without prompting.
+
+        Unambiguous rows are decided automatically, and rows with several strong
+        candidates, or that fail line 2 validation, are queued for review.
+        Decisions are streamed to `decisions_{cat_id}_{digest}.jsonl` and
+        checkpointed every `CHECKPOINT_ROWS` rows; with `resume`, the rows decided
+        up to the last checkpoint of an unfinished run are skipped. Rows unchanged
+        since the last run keep their decision (see `_carry_forward`), and pairs a
+        reviewer accepted before are matched without scoring.
+
+        With `db_blocks`, each chunk fetches only the zip blocks of table2 it is
+        scored on (see `DBBlockSource`). With `top_k`, the best candidates of the
+        scored rows are exported to `candidates_{cat_id}.parquet`.
+        Raises ValueError when the tables or columns are not selected, or the
+        run can't be matched against database blocks.
+        """
+        if not self.table1 or not self.table2:
+            raise ValueError("Tables not selected.")
+        for table, col in ((self.table1, self._col_name_t1), (self.table2, self._col_name_t2)):
+            if col not in table.df.columns:
+                raise ValueError(f"Column '{col}' not found in table '{table.name}'.")
+        metrics.reset()
+
+        cat_id = self._category_id()
+        source_types = (self.table1.metadata["source_type"], self.table2.metadata["source_type"])
+        block_cols, are_addrs, fingerprint_cols = self._match_fields()
+        digest = self._run_digest()
+        stream = self._match_stream(digest)
+        resume = resume and stream.incomplete
+        queue, done = self._open_queue(stream, digest, cat_id, source_types, resume=resume)
+        db_source = self._db_block_source(block_cols) if self.db_blocks else None
+        prints = self._carry_forward(cat_id, fingerprint_cols, block_cols)
+        if prints.enabled:
+            queue.metadata["fingerprints"] = str(prints.store.path)
+
+        with metrics.stage("match_keys"):
+            keys1 = self.table1.match_keys(self._col_name_t1)
+            field_keys1 = [self.table1.match_keys(spec.col1) for spec in self._fields[1:]]
+            # Canonical zips, computed once per table and shared by every blocking stage
+            zip_keys1 = self.table1.zip_keys(block_cols[0]) if block_cols is not None else None
+            # With db_blocks, table2 only holds the columns until a chunk fetches its blocks
+            keys2, zip_keys2, field_keys2 = self._table2_keys(block_cols)
+        self._scorer_key = scorer_key(
+            [spec.key for spec in self._fields], self.score_cutoff, self.confident_score
+        )
+        queue.metadata["scorer"] = self._scorer_key
+        with metrics.stage("decision_cache"):
+            self._src_keys = _pair_keys(keys1, field_keys1)
+            self._cand_keys = _pair_keys(keys2, field_keys2)
+            accepted = self.decision_cache.accepted_pairs(self._scorer_key)
+            # With db_blocks the candidates are looked up in the rows each chunk fetches
+            cached = np.full(len(self.table1.df), -1, dtype=np.intp)
+            if db_source is None:
+                cached = self._cached_matches(accepted, np.arange(len(self.table1.df)))
+        todo = np.array(
+            [pos for pos in range(len(self.table1.df)) if pos not in done], dtype=np.intp
+        )
+        metrics.count("rows_skipped_resumed", len(done))
+        metrics.count("rows_skipped_unchanged", int(prints.carried[todo].sum()))
+        # Rows left to score by the whole run, which decides once whether to use the pool
+        total_rows = int(np.count_nonzero(~prints.carried[todo] & (cached[todo] < 0)))
+        matcher = BlockMatcher(
+            self._col_name_t1,
+            self._col_name_t2,
+            block_cols=block_cols,
+            lead_filter=are_addrs,
+            fuzz_type=self.scorer,
+            zip_level=self.zip_level,
+            fields=self._fields,
+            top_k=self.top_k,
+            score_cutoff=self.score_cutoff,
+            confident_score=self.confident_score,
+            workers=self.workers,
+            total_rows=total_rows,
+        )
+        if db_source is None:
+            # Table2 is blocked once, and every chunk is scored against the same index
+            ngram_index, neighborhood = self._unblocked_index(keys2)
+            matcher.index(
+                self.table2.df,
+                match_keys=keys2,
+                zip_keys=zip_keys2,
+                field_keys=field_keys2,
+                ngram_index=ngram_index,
+                neighborhood=neighborhood,
+            )
 
-                    if match:
-                        t1_addr_line2 = (
-                            str(row.iloc[t1_addr_line2_col]).strip()
-                            if row.iloc[t1_addr_line2_col]
-                            else ""
-                        )
-
-                        t2_addr_line2 = (
-                            str(match[t2_addr_line2_col]).strip()
-                            if match[t2_addr_line2_col] not in [" ", "  ", "   "]
-                            and match[t2_addr_line2_col] is not None
-                            else ""
-                        )
-
-                        fuzz_line2 = fuzz.token_set_ratio(
-                            t1_addr_line2,
-                            t2_addr_line2,
-                            processor=compare_tools.default_process,
-                        )
-
-                        if fuzz_line2 > 86 or (t1_addr_line2 == t2_addr_line2):
-                            matches.append([row.to_dict(), match])
-                        else:
-                            self.clear()
-                            console.rule(
-                                f"Line 2 validation failed: `'{row[self._col_name_t1]}' [bold]'{t1_addr_line2}'[/bold]` vs. `'{match.get(self._col_name_t2)}' [bold]'{t2_addr_line2}'[/bold]`"
+        matched = 0
+        tiers: Counter[str] = Counter()
+        candidates: List[pd.DataFrame] = []
+        with stream.open(resume=resume), matcher:
+            for start in range(0, len(todo), CHECKPOINT_ROWS):
+                chunk = todo[start : start + CHECKPOINT_ROWS]
+                pending = chunk[~prints.carried[chunk]]
+                if db_source is not None and zip_keys1 is not None:
+                    keys2 = self._fetch_blocks(
+                        db_source, matcher, block_cols, zip_keys1["zip5"].iloc[pending]
+                    )
+                    with metrics.stage("decision_cache"):
+                        cached[pending] = self._cached_matches(accepted, pending)
+                to_score = pending[cached[pending] < 0]
+                metrics.count("rows_skipped_cached", len(pending) - len(to_score))
+                decisions: Dict[int, MatchDecision] = {}
+                if len(to_score):
+                    scored = self._score_chunk(matcher, to_score, keys1, zip_keys1, field_keys1)
+                    decisions = dict(zip(to_score.tolist(), scored))
+                    tiers.update(tier_counts(scored))
+                    if self.top_k:
+                        with metrics.stage("candidate_export"):
+                            candidates.append(
+                                candidate_frame(
+                                    scored,
+                                    keys1["processed"].iloc[to_score].tolist(),
+                                    keys2["processed"].tolist(),
+                                    src_index=to_score,
+                                )
                             )
-                            console.print(
-                                Columns([str(row), str(pd.Series(match))], padding=(4, 2)),
-                                justify="center",
+
+                with metrics.stage("record_decisions"):
+                    for src_pos in chunk.tolist():
+                        try:
+                            status = self._record_row(
+                                src_pos,
+                                decisions.get(src_pos),
+                                int(cached[src_pos]),
+                                prints,
+                                stream,
+                                queue,
                             )
-                            choice = console.input("Enter 'y' to keep the match: ")
-                            if choice.lower() == "y":
-                                matches.append([row.to_dict(), match])
-
-                else:
-                    match = compare_tools.fuzz_col_w_process(
-                        self.table2.df,
-                        row,
-                        self._col_name_t2,
-                        row[self._col_name_t1],
-                        "token_set",
-                    )
-                    if match:
-                        matches.append([row.to_dict(), match])
-            except (ValueError, IndexError, KeyError, Exception) as e:
-                console.print(f"Error in compare_tables.fuzz_col_vs_col: {e}")
-                raise e
-
-        # console.print(matches)
-        for match in matches:
-            console.rule()
-            console.print(
-                Columns(
-                    [
-                        str(pd.Series(match[0])),
-                        "|\n|\n|\n|\n|\n|\n|\n|\n|\n",
-                        str(pd.Series(match[1])),
-                    ],
-                    padding=(6, 6),
+                            matched += status == "match"
+                        except (ValueError, IndexError, KeyError, Exception) as e:
+                            console.print(f"Error in compare_tables.fuzz_col_vs_col: {e}")
+                            raise e
+
+                with metrics.stage("checkpoint"):
+                    # The checkpoint commits the chunk's queued rows, so the queue is saved
+                    # first, and fingerprints never get ahead of the committed rows
+                    queue.save()
+                    stream.checkpoint(int(chunk[-1]))
+                    if prints.enabled:
+                        prints.store.save()
+            stream.checkpoint(len(self.table1.df) - 1, complete=True)
+        self._table2_rows = None
+
+        if prints.enabled:
+            prints.store.prune(prints.row_ids)
+            prints.store.save()
+        self._print_summary(prints, tiers, matched)
+        if candidates:
+            self._export_candidates(candidates, cat_id)
+        return MatchRun(cat_id, source_types, stream, queue, tiers, matched)
+
+    def _open_queue(
+        self,
+        stream: MatchStream,
+        digest: str,
+        cat_id: Optional[int],
+        source_types: Tuple[str, str],
+        *,
+        resume: bool = False,
+    ) -> Tuple[ReviewQueue, Set[int]]:
+        """Return the review queue of a run and the table1 rows it already decided.
+
+        With `resume`, the decisions past the last checkpoint of the stream are
+        dropped, and the queue keeps the rows decided up to it.
+        """
+        queue_path = Path(f"review_{cat_id}_{digest}.json")
+        # Decisions past the last checkpoint are dropped and their rows decided again
+        done = stream.rollback() if resume else set()
+        if resume and queue_path.exists():
+            queue = ReviewQueue.load(queue_path)
+            queue.keep(done)
+            return queue, done
+        queue = ReviewQueue(
+            queue_path,
+            metadata={
+                "source_types": list(source_types),
+                "category_id": cat_id,
+                "columns": [self._col_name_t1, self._col_name_t2],
+                "stream": str(stream.path),
+                "digest": digest,
+            },
+        )
+        return queue, done
+
+    def _carry_forward(
+        self,
+        cat_id: Optional[int],
+        fingerprint_cols: List[str],
+        block_cols: Optional[Tuple[str, str]],
+    ) -> RowFingerprints:
+        """Return the fingerprints of the table1 rows, and which rows keep their decision.
+
+        Rows whose CCN and match columns are unchanged since the last run keep
+        their decision, as long as table2 is unchanged too. Without a CCN column
+        no row does, nor with `db_blocks`: a table2 left in its database can't
+        be checked for changes without reading all of it.
+        """
+        if self.table1 is None:
+            raise ValueError("Tables not selected.")
+        ccn_col = None if self.db_blocks else find_ccn_col(self.table1.df.columns)
+        store = FingerprintStore.load(
+            Path(f"fingerprints_{cat_id}.json"),
+            [*fingerprint_cols, self._col_name_t2],
+            self._table2_digest(block_cols) if ccn_col else None,
+        )
+        if not ccn_col:
+            row_ids = np.full(len(self.table1.df), "", dtype=object)
+            carried = np.zeros(len(self.table1.df), dtype=bool)
+            return RowFingerprints(store, row_ids, row_ids, carried, False)
+        with metrics.stage("fingerprints"):
+            row_ids = row_keys(self.table1.df[ccn_col]).to_numpy()
+            hashes = row_fingerprints(self.table1.df, fingerprint_cols).to_numpy()
+            carried = store.unchanged(row_ids, hashes)
+        return RowFingerprints(store, row_ids, hashes, carried, True)
+
+    def _unblocked_index(
+        self, keys2: pd.DataFrame
+    ) -> Tuple[Optional[NGramIndex], Optional[SortedNeighborhood]]:
+        """Return the index giving candidates to the rows whose zip has no table2 rows.
+
+        With `window` set, that is the table2 rows that sort next to them,
+        otherwise an n-gram index over the table2 column, kept on disk.
+        """
+        if self.table2 is None:
+            raise ValueError("Tables not selected.")
+        if self.window:
+            with metrics.stage("neighborhood_index"):
+                return None, SortedNeighborhood(neighborhood_keys(keys2), self.window)
+        index_name = re.sub(r"\W+", "_", f"{self.table2.name}_{self._col_name_t2}")
+        with metrics.stage("ngram_index"):
+            return (
+                NGramIndex.load_or_build(
+                    Path(f"ngrams_{index_name}.npz"), keys2["processed"].tolist()
                 ),
-                style="white on blue",
-                justify="center",
+                None,
             )
 
-        matches_list = []
-        for match in matches:
-            matches_list.append(
+    def _fetch_blocks(
+        self,
+        db_source: DBBlockSource,
+        matcher: BlockMatcher,
+        block_cols: Optional[Tuple[str, str]],
+        zips: pd.Series,
+    ) -> pd.DataFrame:
+        """Fetch the table2 blocks of a chunk's zips, the only rows it is scored on.
+
+        The matcher is indexed on them, and the decisions of the chunk point
+        into them. Return the match keys of the fetched rows.
+        """
+        rows2 = db_source.fetch(zips)
+        with metrics.stage("match_keys"):
+            keys2, zip_keys2, field_keys2 = self._table2_keys(block_cols, rows2)
+            self._cand_keys = _pair_keys(keys2, field_keys2)
+        matcher.index(rows2, match_keys=keys2, zip_keys=zip_keys2, field_keys=field_keys2)
+        self._table2_rows = rows2
+        return keys2
+
+    def _score_chunk(
+        self,
+        matcher: BlockMatcher,
+        to_score: np.ndarray,
+        keys1: pd.DataFrame,
+        zip_keys1: Optional[pd.DataFrame],
+        field_keys1: Sequence[pd.DataFrame],
+    ) -> List[MatchDecision]:
+        """Score the table1 rows at `to_score` against the indexed table2 rows.
+
+        `keys1`, `zip_keys1` and `field_keys1` are the keys of all of table1.
+        Return one decision per row, in `to_score` order.
+        """
+        if self.table1 is None:
+            raise ValueError("Tables not selected.")
+        # Score every zip/house number block of the rows left to match
+        return matcher.match(
+            self.table1.df.iloc[to_score],
+            match_keys=keys1.iloc[to_score],
+            zip_keys=None if zip_keys1 is None else zip_keys1.iloc[to_score],
+            field_keys=[field1.iloc[to_score] for field1 in field_keys1],
+        )
+
+    def _record_row(
+        self,
+        src_pos: int,
+        decision: Optional[MatchDecision],
+        cached: int,
+        prints: RowFingerprints,
+        stream: MatchStream,
+        queue: ReviewQueue,
+    ) -> RowStatus:
+        """Stream and fingerprint the decision for a table1 row of a chunk.
+
+        The row was scored into `decision`, kept its decision from the last run,
+        or else matches the table2 row at `cached`, accepted in an earlier review.
+        Return the status of the row.
+        """
+        if self.table1 is None:
+            raise ValueError("Tables not selected.")
+        row = self.table1.df.iloc[src_pos]
+        status: RowStatus
+        if decision is not None:
+            status, match = self._record_decision(decision, src_pos, row, stream, queue)
+        elif prints.carried[src_pos]:
+            prior = prints.store.prior(prints.row_ids[src_pos])
+            status, match = prior["status"], prior["match"]
+            stream.write(src_pos, status, _row_dict(row), match)
+        else:
+            # A reviewer accepted this pair in an earlier run
+            status = "match"
+            match = _row_dict(self._rows2().iloc[cached])
+            stream.write(src_pos, status, _row_dict(row), match)
+        prints.store.record(prints.row_ids[src_pos], prints.hashes[src_pos], src_pos, status, match)
+        return status
+
+    def _print_summary(self, prints: RowFingerprints, tiers: Counter[str], matched: int):
+        """Print how the rows of a run were resolved, and count them in the metrics."""
+        if prints.enabled:
+            console.print(
+                f"{int(prints.carried.sum())} unchanged row(s) kept their previous decision."
+            )
+        elif self.db_blocks:
+            console.print(
+                "Every row was matched again: decisions aren't carried forward "
+                "when matching against database blocks."
+            )
+        console.print(
+            f"Resolved {tiers['exact']} row(s) by exact match and {tiers['fuzzy']} by fuzzy match; "
+            f"{tiers['ambiguous']} ambiguous, {tiers['none']} without a match."
+        )
+        console.print(f"{matched} row(s) matched automatically.")
+        for tier, count in tiers.items():
+            metrics.count(f"rows_{tier}", count)
+
+    def _export_candidates(self, candidates: List[pd.DataFrame], cat_id: Optional[int]):
+        """Write the best candidates of the rows scored in the run to Parquet."""
+        with metrics.stage("candidate_export"):
+            path = write_candidates(
+                pd.concat(candidates, ignore_index=True),
+                f"candidates_{cat_id}.parquet",
                 {
-                    self.table1.metadata["source_type"]: match[0],
-                    self.table2.metadata["source_type"]: match[1],
-                }
+                    "columns": [self._col_name_t1, self._col_name_t2],
+                    "top_k": self.top_k,
+                    "fields": [asdict(spec) for spec in self._fields],
+                    "score_cutoff": self.score_cutoff,
+                    "confident_score": self.confident_score,
+                },
             )
-            for table in [self.table1, self.table2]:
-                if table.metadata.get("s1_category_id"):
-                    matches_list[-1]["cms"]["category_id"] = table.metadata["s1_category_id"]
+        console.print(f"Top {self.top_k} candidates per row written to {path}")
 
-        console.print(matches_list)
-        cat_id = self.table1.metadata.get("s1_category_id") or self.table2.metadata.get(
+    def _category_id(self) -> Optional[int]:
+        """Return the CMS category id of the compared tables."""
+        if not self.table1 or not self.table2:
+            return None
+        return self.table1.metadata.get("s1_category_id") or self.table2.metadata.get(
             "s1_category_id"
         )
-        # write matches to file:
-        with open(f"matches_{cat_id}_{int(time())}.json", "w", encoding="utf-8") as f:
-            for i, mat in enumerate(matches_list):
-                mat["cms"]["profile_id"] = mat["db"]["id"]
-                matches_list[i] = mat
-            f.write(json.dumps(matches_list, indent=2))
-
-        console.print("Matches written to matches.json")
+
+    def _match_fields(self) -> Tuple[Optional[Tuple[str, str]], bool, List[str]]:
+        """Set the fields scored by a run of the selected columns.
+
+        An address column is weighted by `ADDRESS_WEIGHT` and scored together
+        with the line 2 column next to it, and its rows are blocked on the zip
+        code columns of both tables.
+        Return the block columns, whether the columns are addresses, and the
+        table1 columns whose fingerprint decides if a row changed.
+        """
+        if not self.table1 or not self.table2:
+            raise ValueError("Tables not selected.")
+        are_addrs = is_address_column(self._col_name_t1) or is_address_column(self._col_name_t2)
+        block_cols: Optional[Tuple[str, str]] = None
+        fingerprint_cols = [self._col_name_t1]
+        self._fields = [FieldSpec(self._col_name_t1, self._col_name_t2, self.scorer)]
+        if are_addrs:
+            t1_col_list = list(self.table1.df.columns)
+            t2_col_list = list(self.table2.df.columns)
+            t1_line2_cols = t1_col_list[t1_col_list.index(self._col_name_t1) + 1 :][:1]
+            t2_line2_cols = t2_col_list[t2_col_list.index(self._col_name_t2) + 1 :][:1]
+            self._fields = [
+                FieldSpec(self._col_name_t1, self._col_name_t2, self.scorer, ADDRESS_WEIGHT)
+            ]
+            if t1_line2_cols and t2_line2_cols:
+                # Line 2 on one side only is a disagreement, and must agree for a match
+                self._fields.append(
+                    FieldSpec(
+                        t1_line2_cols[0],
+                        t2_line2_cols[0],
+                        self.scorer,
+                        LINE2_WEIGHT,
+                        missing="mismatch",
+                        min_score=self.confident_score,
+                    )
+                )
+            t1_zip_col = [
+                col for col in t1_col_list if "zip" in col.lower() and "code" in col.lower()
+            ][0]
+            t2_zip_col = [
+                col for col in t2_col_list if "zip" in col.lower() and "code" in col.lower()
+            ][0]
+            block_cols = (t1_zip_col, t2_zip_col)
+            fingerprint_cols.extend(t1_line2_cols)
+            fingerprint_cols.append(t1_zip_col)
+        self._fields.extend(self.extra_fields)
+        fingerprint_cols.extend(spec.col1 for spec in self.extra_fields)
+        return block_cols, are_addrs, fingerprint_cols
+
+    def _run_digest(self) -> str:
+        """Return a short digest of the compared tables, columns and scoring settings.
+
+        The files of a run are named by it, so a run never resumes or
+        overwrites the stream and review queue of another comparison.
+        """
+        if not self.table1 or not self.table2:
+            raise ValueError("Tables not selected.")
+        self._match_fields()
+        settings = {
+            "tables": [self.table1.name, self.table2.name],
+            "columns": [self._col_name_t1, self._col_name_t2],
+            "fields": [asdict(spec) for spec in self._fields],
+            "score_cutoff": self.score_cutoff,
+            "confident_score": self.confident_score,
+            "zip_level": self.zip_level,
+            "window": self.window,
+            "db_blocks": self.db_blocks,
+        }
+        data = json.dumps(settings, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(data).hexdigest()[:12]
+
+    def _match_stream(self, digest: str) -> MatchStream:
+        """Return the decision stream of the comparison with a digest."""
+        return MatchStream(f"decisions_{self._category_id()}_{digest}.jsonl", digest)
+
+    def _finish_run(
+        self,
+        queue: ReviewQueue,
+        stream: MatchStream,
+        source_types: Tuple[str, str],
+        cat_id: Optional[int],
+    ):
+        """Offer to review the queued decisions, then write the matches of the run."""
+        if not queue.items:
+            self._write_matches(stream.matches(), source_types, cat_id)
+            return
+
+        console.print(f"{len(queue.pending)} decision(s) queued for review in {queue.path}")
+        if queue.pending and console.input("Review them now? (y/n): ").lower() != "y":
+            self._write_matches(stream.matches(), source_types, cat_id)
+            console.print("Use 'Review Queued Matches' to review the queued decisions later.")
+            return
+        self._review_queue(queue, stream.matches())
+
+    def _report_metrics(self, cat_id: Optional[int]):
+        """Print the stage timings and counters of the run and write them to JSON."""
+        console.print(metrics.summary())
+        path = metrics.write_json(f"match_metrics_{cat_id}.json")
+        console.print(f"Match metrics written to {path}")
+
+    def _record_decision(
+        self,
+        decision: MatchDecision,
+        src_pos: int,
+        row: pd.Series,
+        stream: MatchStream,
+        queue: ReviewQueue,
+    ) -> Tuple[RowStatus, Optional[dict]]:
+        """Stream the decision for a table1 row, queueing it when it needs a reviewer.
+
+        Rows whose candidates were all decided by a reviewer before are settled
+        from the decision cache instead of being queued.
+        Return the status of the row and the table2 row it matched, if any.
+        """
+        if self.table2 is None:
+            return "none", None
+        kind: ReviewKind | None = None
+        candidates, detail = decision.candidates, ""
+        if decision.status == "ambiguous":
+            kind = "ambiguous"
+        elif failure := self._field_failure(decision):
+            kind, (held, detail) = "line2", failure
+            candidates = decision.candidates[held : held + 1]
+        if kind is not None:
+            review_candidates = self._review_candidates(candidates)
+            src_key = self._src_keys[src_pos] if self._src_keys else ""
+            settled, choice = False, None
+            if src_key:
+                settled, choice = self.decision_cache.cached_choice(
+                    src_key, [cand.key for cand in review_candidates], self._scorer_key
+                )
+            if not settled:
+                queue.add(
+                    ReviewItem(
+                        kind, src_pos, _row_dict(row), review_candidates, detail, src_key=src_key
+                    )
+                )
+                stream.write(src_pos, "queued")
+                metrics.count(f"rows_queued_{kind}")
+                return "queued", None
+
+            metrics.count("rows_settled_cached")
+            if choice is None:
+                stream.write(src_pos, "none")
+                return "none", None
+            match = review_candidates[choice].row
+            stream.write(src_pos, "match", _row_dict(row), match)
+            return "match", match
+
+        if decision.best is None:
+            stream.write(src_pos, "none")
+            return "none", None
+
+        match = _row_dict(self._rows2().iloc[decision.best])
+        stream.write(src_pos, "match", _row_dict(row), match)
+        return "match", match
+
+    def _field_failure(self, decision: MatchDecision) -> Tuple[int, str] | None:
+        """Return the first candidate held back for matching line 1 but not the rest, and why.
+
+        A held back candidate is capped at the cutoff, so a candidate weaker on
+        line 1 can outrank it; the row goes to review even then. Candidates tied
+        on line 1 with the match are left to the other fields to settle.
+        """
+        if decision.status == "ambiguous" or not decision.fields:
+            return None
+        line1 = self.confident_score
+        if decision.status == "match":
+            line1 = max(line1, decision.fields[0][0])
+        for i, fields in enumerate(decision.fields):
+            failed = any(
+                spec.min_score is not None and score <= spec.min_score
+                for spec, score in zip(self._fields, fields)
+            )
+            if fields[0] > line1 and failed:
+                scores = ", ".join(
+                    f"'{spec.col1}' vs. '{spec.col2}' [bold]{score:.0f}[/bold]"
+                    for spec, score in zip(self._fields, fields)
+                )
+                return i, f"Field validation failed: {scores}"
+        return None
+
+    def _db_block_source(self, block_cols: Optional[Tuple[str, str]]) -> DBBlockSource:
+        """Return the source of the zip blocks of table2, left in its database.
+
+        Raises ValueError when table2 isn't a database table or the run can't be blocked.
+        """
+        if self.table2 is None or "db_table_name" not in self.table2.metadata:
+            raise ValueError("Matching against database blocks needs a database table2.")
+        if block_cols is None:
+            raise ValueError("Matching against database blocks needs zip columns to block on.")
+        if self.zip_level != "zip5" or self.top_k:
+            raise ValueError(
+                "Matching against database blocks supports neither zip3 blocks "
+                "nor the candidate export."
+            )
+        adapter = self.ctx.db_mgr[self.table2.metadata["db_key"]]
+        return DBBlockSource(adapter, self.table2.metadata["db_table_name"], block_cols[1])
+
+    def _table2_digest(self, block_cols: Optional[Tuple[str, str]]) -> str:
+        """Return the digest of table2 that decides whether stored decisions still hold."""
+        if self.table2 is None:
+            raise ValueError("Tables not selected.")
+        cols = [spec.col2 for spec in self._fields]
+        if block_cols is not None:
+            cols.append(block_cols[1])
+        with metrics.stage("fingerprints"):
+            return table_digest(self.table2.name, self.table2.df, cols)
+
+    def _table2_keys(
+        self, block_cols: Optional[Tuple[str, str]], rows: Optional[pd.DataFrame] = None
+    ) -> Tuple[pd.DataFrame, Optional[pd.DataFrame], List[pd.DataFrame]]:
+        """Return the match keys, zip keys and further field keys of the table2 side.
+
+        They are the cached keys of table2, or computed for the `rows` of table2
+        fetched from its database.
+        """
+        if self.table2 is None:
+            raise ValueError("Tables not selected.")
+        if rows is None:
+            return (
+                self.table2.match_keys(self._col_name_t2),
+                self.table2.zip_keys(block_cols[1]) if block_cols is not None else None,
+                [self.table2.match_keys(spec.col2) for spec in self._fields[1:]],
+            )
+        return (
+            compute_match_keys(rows[self._col_name_t2]),
+            compute_zip_keys(rows[block_cols[1]]) if block_cols is not None else None,
+            [compute_match_keys(rows[spec.col2]) for spec in self._fields[1:]],
+        )
+
+    def _rows2(self) -> pd.DataFrame:
+        """Return the table2 rows the decisions being recorded point into."""
+        if self._table2_rows is not None:
+            return self._table2_rows
+        if self.table2 is None:
+            raise ValueError("Tables not selected.")
+        return self.table2.df
+
+    def _review_candidates(self, candidates: List[Tuple[int, float]]) -> List[ReviewCandidate]:
+        """Return the table2 rows of the candidates for the review queue."""
+        if self.table2 is None:
+            return []
+        return [
+            ReviewCandidate(
+                pos,
+                score,
+                _row_dict(self._rows2().iloc[pos]),
+                self._cand_keys[pos] if self._cand_keys else "",
+            )
+            for pos, score in candidates
+        ]
+
+    def _cached_matches(self, accepted: Dict[str, str], src_positions: np.ndarray) -> np.ndarray:
+        """Return the table2 position of the candidate accepted before for the table1 rows at
+        `src_positions`, or -1.
+
+        `accepted` holds the pairs accepted under the scorer key of the run. Only
+        candidates among the table2 rows of `_cand_keys` count: all of table2, or
+        the rows fetched for a chunk with db_blocks.
+        """
+        cached = np.full(len(src_positions), -1, dtype=np.intp)
+        if not accepted:
+            return cached
+        wanted = set(accepted.values())
+        positions: Dict[str, int] = {}
+        for pos, key in enumerate(self._cand_keys):
+            if key in wanted:
+                positions.setdefault(key, pos)
+        for i, src_pos in enumerate(src_positions):
+            cand = accepted.get(self._src_keys[src_pos])
+            if cand in positions:
+                cached[i] = positions[cand]
+        return cached
@@ -402,10 +402,17 @@ class EditTableMenu(BaseMenu):
         render_table(self.table, to="html")
 
     def find_duplicates(self):
-        """Find duplicates in a column."""
+        """Cluster the near-duplicates of a column, blocking on the zip code column if any."""
         table_cols = self.table.list_columns()
         col = self._select_column(table_cols)
         if col:
-            cmd = self.cmds.FindColumnDuplicatesCommand(self.table, col)
+            zip_cols = [c for c in table_cols if "zip" in c.lower() and "code" in c.lower()]
+            cmd = self.cmds.FindColumnDuplicatesCommand(
+                self.table, col, zip_col=zip_cols[0] if zip_cols else None
+            )
             self.cmd_mgr.exec_cmd(cmd)
-            console.print(f"Duplicates found in column '{col}'.")
+            n_clusters = self.table.df[cmd.cluster_col].nunique()
+            console.print(
+                f"Found {n_clusters} cluster(s) of duplicates in column '{col}' "
+                f"({len(self.table.df)} row(s)), ids in column '{cmd.cluster_col}'."
+            )
@@ -1,12 +1,8 @@
 """Table Loader menu."""
 
 import os
-from concurrent import futures
-
-import requests
 
 from cms_etl.menu import BaseMenu, MenuOption
-from cms_etl.models.cms_meta_res import CMSMetaResponse
 from cms_etl.utils import Pick, console, select_from_list
 
 
@@ -22,6 +18,10 @@ class LoadDataMenu(BaseMenu):
                 name="Load Table from CMS Source",
                 action=self.load_from_cms_source,
             ),
+            MenuOption(
+                name="Download CMS Category",
+                action=self.download_cms_category,
+            ),
             MenuOption(name="Back", action=self.back),
         ]
 
@@ -107,15 +107,8 @@ class LoadDataMenu(BaseMenu):
         if category is None or not isinstance(category, str):
             return
 
-        source_meta_urls = self.ctx.data_loader.cms_loader.get_cat_sources(category)
-
-        def get_source_meta(url: str):
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            return CMSMetaResponse(**response.json())
-
-        with futures.ThreadPoolExecutor() as executor:
-            source_metas = list(executor.map(get_source_meta, source_meta_urls))
+        cms_loader = self.ctx.data_loader.cms_loader
+        source_metas = cms_loader.get_category_metas(category)
 
         source_names: list[str] = [source.title for source in source_metas]
 
@@ -159,3 +152,27 @@ class LoadDataMenu(BaseMenu):
         except Exception as e:
             console.print(f"An error occurred: {e}")
             raise e
+
+    def download_cms_category(self):
+        """Download the CSVs of every source in a CMS category, several at a time."""
+        category = select_from_list(
+            Pick.one,
+            list(self.ctx.data_loader.cms_loader.get_categories()),
+            title="CMS Categories",
+            prompt="\nChoose category: ",
+        )
+
+        if category is None or not isinstance(category, str):
+            return
+
+        cms_loader = self.ctx.data_loader.cms_loader
+        source_metas = cms_loader.get_category_metas(category)
+
+        results = cms_loader.download_datasets(source_metas)
+        for title, result in results.items():
+            if isinstance(result, Exception):
+                console.print(f"Failed to download '{title}': {result}")
+            else:
+                console.print(f"'{title}': {result}")
+        failed = sum(isinstance(result, Exception) for result in results.values())
+        console.print(f"{len(results) - failed} of {len(results)} dataset(s) up to date.")
@@ -36,6 +36,7 @@ class CommandManager:
     def exec_cmd(self, command: Command, track: bool = True):
         """Execute a command. Set track to False to prevent the command from being tracked."""
         command.execute()
+        self.table.invalidate_match_keys()
         if track:
             self._commands.push(command)
             self._redo_stack.clear()
@@ -45,12 +46,14 @@ class CommandManager:
         command = self._redo_stack.pop()
         self._commands.push(command)
         command.execute()
+        self.table.invalidate_match_keys()
 
     def undo(self):
         """Undo the last command."""
         command = self._commands.pop()
         self._redo_stack.push(command)
         command.undo()
+        self.table.invalidate_match_keys()
 
     @property
     def can_undo(self):
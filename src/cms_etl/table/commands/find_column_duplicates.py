@@ -1,29 +1,63 @@
-"""Command to find duplicate columns in a DataFrame."""
+"""Command to find fuzzy duplicate rows of a column in a DataFrame."""
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+from cms_etl.compare.dedupe import DEDUPE_THRESHOLD, find_duplicate_clusters
 from cms_etl.table.base_command import Command
-from cms_etl.utils import console, get_cmd_args, isolate_addr_head
+from cms_etl.utils import console, get_cmd_args
 
 
 @dataclass
 class FindColumnDuplicatesCommand(Command):
-    """Command to find duplicate columns in a DataFrame."""
+    """Command to cluster the near-duplicate values of a column.
+
+    Rows are compared within their `zip_col` and house number block, and
+    rows scoring at least `threshold` are joined into clusters. The cluster
+    id is added as `cluster_col`; with `only_duplicates`, the table is
+    narrowed to the clustered rows, grouped by cluster.
+    """
 
     col_name: str
+    zip_col: Optional[str] = field(default=None, kw_only=True)
+    threshold: float = field(default=DEDUPE_THRESHOLD, kw_only=True)
+    cluster_col: str = field(default="duplicate_cluster", kw_only=True)
+    only_duplicates: bool = field(default=True, kw_only=True)
 
     def __post_init__(self):
         self._cmd_args = get_cmd_args(self)
-        self._og_df = self.table.df.copy(deep=True)
+        self._og_df: Optional[pd.DataFrame] = None
 
     def execute(self):
         """Execute the command."""
-        self.table.df = self.table.df[
-            self.table.df[self.col_name].apply(isolate_addr_head).duplicated(keep=False)
-        ].copy(deep=True)
+        # Keep a reference to the frame for undo; it is never modified below
+        self._og_df = self.table.df
+        col = self._og_df[self.col_name]
+        ids = find_duplicate_clusters(
+            self._og_df,
+            self.col_name,
+            block_col=self.zip_col,
+            keys=self.table.match_keys(self.col_name) if is_string_dtype(col) else None,
+            threshold=self.threshold,
+        )
+        if self.only_duplicates:
+            positions = np.flatnonzero(ids.notna().to_numpy())
+            positions = positions[np.argsort(ids.iloc[positions].to_numpy(), kind="stable")]
+            ids = ids.iloc[positions]
+            df = self._og_df.iloc[positions].copy(deep=False)
+        else:
+            # A deep copy, so later edits of the table can't reach the frame kept for undo
+            df = self._og_df.copy(deep=True)
+        df[self.cluster_col] = ids.array
+        self.table.df = df
 
     def undo(self):
         """Undo the command."""
-        self.table.df = self._og_df.copy(deep=True)
+        if self._og_df is not None:
+            self.table.df = self._og_df
         console.print(f"Undone: {json.dumps(self.serialize(), indent=4)}")
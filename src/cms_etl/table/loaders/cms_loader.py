@@ -1,18 +1,46 @@
 """Load CMS data from the CMS API."""
 
 import json
-import os
+import threading
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Any, Dict, List, Sequence, Tuple
 
 import pandas as pd
 import pkg_resources
 import requests
 
 from cms_etl.models.cms_meta_res import CMSMetaResponse
+from cms_etl.table.loaders.csv_cache import read_cached_csv
+from cms_etl.table.loaders.download_cache import DownloadManager
+from cms_etl.table.loaders.meta_cache import CMSMetaClient
 from cms_etl.utils import console
 
 
+DATE_DTYPES = ("date", "datetime")
+"""Dtypes of a source profile parsed as dates rather than passed to `read_csv` as dtypes."""
+
+
+def read_profile(source_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the `read_csv` arguments of a source entry of the sources file.
+
+    An entry may declare `usecols`, the columns to read, and `dtypes`, a map
+    of column to a pandas dtype ("string", "Int64", "category", ...) or to
+    "date"; e.g. `{"usecols": ["CCN", "Zip"], "dtypes": {"Zip": "string"}}`.
+    Entries without them read every column with inferred types.
+    """
+    kwargs: Dict[str, Any] = {}
+    if source_entry.get("usecols"):
+        kwargs["usecols"] = list(source_entry["usecols"])
+    dtypes: Dict[str, str] = dict(source_entry.get("dtypes") or {})
+    dates = [col for col, dtype in dtypes.items() if dtype in DATE_DTYPES]
+    if dates:
+        kwargs["parse_dates"] = dates
+    dtypes = {col: dtype for col, dtype in dtypes.items() if dtype not in DATE_DTYPES}
+    if dtypes:
+        kwargs["dtype"] = dtypes
+    return kwargs
+
+
 class CMSSourceLoader:
     """Load CMS data from the CMS API"""
 
@@ -24,6 +52,8 @@ class CMSSourceLoader:
             encoding="utf-8",
         ) as f:
             self.source_dict: dict = json.load(f)
+        self._downloads: DownloadManager | None = None
+        self._meta: CMSMetaClient | None = None
 
     def get_dataset_url(self, category: str, source: str) -> str:
         """Get the URL for a dataset."""
@@ -33,6 +63,35 @@ class CMSSourceLoader:
         else:
             raise ValueError(f"URL not found for {category} - {source}")
 
+    def get_source_meta(self, url: str) -> CMSMetaResponse:
+        """Get the metadata of a dataset from its metastore URL, cached for a day."""
+        return self.meta.get(url)
+
+    def get_category_metas(self, category: str) -> List[CMSMetaResponse]:
+        """Get the metadata of every source of a category, fetching stale ones concurrently."""
+        return self.meta.get_many(self.get_cat_sources(category))
+
+    def prefetch_metas(self) -> threading.Thread:
+        """Fetch the metadata of the sources of every category on a background thread."""
+        return self.meta.prefetch(
+            url for category in self.get_categories() for url in self.get_cat_sources(category)
+        )
+
+    def get_read_profile(self, category: str, dataset_id: str) -> Dict[str, Any]:
+        """Return the `read_csv` arguments the sources file declares for a dataset."""
+        for url, entry in self.source_dict[category]["sources"].items():
+            if _dataset_id(url) == dataset_id:
+                return read_profile(entry)
+        return {}
+
+    def find_dataset(self, dataset_id: str) -> Tuple[str, str]:
+        """Return the category and metastore URL of a dataset listed in the sources file."""
+        for category, entry in self.source_dict.items():
+            for url in entry["sources"]:
+                if _dataset_id(url) == dataset_id:
+                    return category, url
+        raise KeyError(f"Dataset '{dataset_id}' not found in the CMS sources.")
+
     def get_dataset(
         self, category: str, source: CMSMetaResponse
     ) -> Tuple[pd.DataFrame, Dict[str, str | int]] | None:
@@ -43,30 +102,20 @@ class CMSSourceLoader:
         console.print(f"CSV URL: {csv_url}")
         csv_filename = csv_url.split("/")[-1]
 
-        # if csv is not in ./data/cms_cache, download it
-        cache_dir = pkg_resources.resource_filename("cms_etl", "data/cms_cache")
-        if not os.path.exists(cache_dir):
-            try:
-                Path(cache_dir).mkdir(parents=True, exist_ok=True)
-            except OSError as e:
-                console.print(f"Error creating cache directory: {e}")
-
-        if csv_filename not in os.listdir(cache_dir):
-            try:
-                with requests.get(csv_url, stream=True, timeout=5) as r:
-                    r.raise_for_status()
-                    with open(
-                        f"{cache_dir}/{csv_filename}",
-                        "wb",
-                    ) as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-            except requests.HTTPError as e:
-                console.print(f"HTTP Error: {e}")
+        # download the csv into ./data/cms_cache, unless the cached copy is current
+        try:
+            csv_path = self.downloads.fetch(csv_url, source.modified)
+        except (requests.RequestException, ValueError, OSError) as e:
+            console.print(f"Download failed: {e}")
+            csv_path = self.downloads.path(csv_url)
+            if not self.downloads.manifest.verify(csv_path):
+                return None
+            console.print("Using the previously downloaded copy.")
 
         try:
-            console.print(f"Reading csv: {cache_dir}/{csv_filename}")
-            df = pd.read_csv(f"{cache_dir}/{csv_filename}", low_memory=False)
+            console.print(f"Reading csv: {csv_path}")
+            # Parsed once; later loads read the typed Parquet copy until the csv or profile changes
+            df = read_cached_csv(csv_path, **self.get_read_profile(category, source.identifier))
         except pd.errors.ParserError as e:
             console.print("Error parsing csv.", e)
             return None
@@ -79,6 +128,36 @@ class CMSSourceLoader:
             "url": csv_url,
         }
 
+    @property
+    def cache_dir(self) -> str:
+        """Return the CMS cache directory."""
+        return pkg_resources.resource_filename("cms_etl", "data/cms_cache")
+
+    @property
+    def downloads(self) -> DownloadManager:
+        """Return the download manager of the CMS cache directory, creating it on first use."""
+        if self._downloads is None:
+            self._downloads = DownloadManager(self.cache_dir)
+        return self._downloads
+
+    @property
+    def meta(self) -> CMSMetaClient:
+        """Return the metadata client of the CMS cache directory, creating it on first use."""
+        if self._meta is None:
+            self._meta = CMSMetaClient(self.cache_dir)
+        return self._meta
+
+    def download_datasets(self, sources: Sequence[CMSMetaResponse]) -> Dict[str, Path | Exception]:
+        """Download the CSVs of several datasets concurrently, skipping current copies.
+
+        Returns the cache path of each dataset by title, or the error its download failed with.
+        """
+        urls = [source.distribution[0].downloadURL for source in sources]
+        results = self.downloads.fetch_many(
+            (url, source.modified) for url, source in zip(urls, sources)
+        )
+        return {source.title: results[url] for url, source in zip(urls, sources)}
+
     def get_cat_sources(self, category: str) -> list[str]:
         """Get the sources for a category."""
         return self.source_dict[category]["sources"]
@@ -90,3 +169,8 @@ class CMSSourceLoader:
     def get_category_id(self, category: str) -> int:
         """Get the category ID for a category."""
         return self.source_dict[category]["s1_category_id"]
+
+
+def _dataset_id(url: str) -> str:
+    """Return the dataset ID of a metastore URL: its last path segment."""
+    return url.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
@@ -0,0 +1,97 @@
+"""Typed Parquet cache of parsed CSV files, kept next to each CSV."""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cms_etl.utils import console
+
+CSV_CACHE_VERSION = 1
+"""Bumped whenever the cached frames would differ, so older cache files are rewritten."""
+
+_ARROW_OBJECT_TYPES = {"string", "empty", "boolean"}
+"""`infer_dtype` results of object columns that Arrow stores as they are."""
+
+
+def cache_path(csv_path: str | Path) -> Path:
+    """Return the path of the cache file of a CSV, e.g. `data.csv.parquet` for `data.csv`."""
+    csv_path = Path(csv_path)
+    return csv_path.with_name(f"{csv_path.name}.parquet")
+
+
+def csv_stamp(csv_path: str | Path, read_kwargs: Dict[str, Any]) -> str:
+    """Return the stamp a cache file of the CSV must carry to be used.
+
+    It holds the CSV's size and mtime and the `read_csv` arguments it was parsed with.
+    """
+    stat = Path(csv_path).stat()
+    return json.dumps(
+        {
+            "version": CSV_CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "read_csv": read_kwargs,
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+def arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Return the frame with the object columns Arrow can't store (mixed types) as strings.
+
+    Missing values stay missing.
+    """
+    for col in df.select_dtypes(include="object").columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) not in _ARROW_OBJECT_TYPES:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def read_cached_csv(csv_path: str | Path, **read_kwargs) -> pd.DataFrame:
+    """Return a parsed CSV, from its Parquet cache when the CSV hasn't changed since.
+
+    On a miss the CSV is parsed with `read_kwargs` (`low_memory=False` by
+    default) and the cache is rewritten, so later loads skip parsing and type
+    inference. The column types are those `read_csv` inferred; columns of mixed
+    types are read back as strings. Raises what `read_csv` raises.
+    """
+    csv_path = Path(csv_path)
+    read_kwargs = {"low_memory": False, **read_kwargs}
+    stamp = csv_stamp(csv_path, read_kwargs)
+    parquet_path = cache_path(csv_path)
+    if parquet_path.exists():
+        try:
+            table = pq.read_table(parquet_path)
+            if (table.schema.metadata or {}).get(b"cms_etl_csv") == stamp.encode("utf-8"):
+                return _from_arrow(table)
+        except (pa.ArrowException, OSError) as e:
+            console.log(f"Ignoring unreadable cache file {parquet_path}: {e}")
+
+    df = arrow_safe(pd.read_csv(csv_path, **read_kwargs))
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[b"cms_etl_csv"] = stamp.encode("utf-8")
+        tmp_path = parquet_path.with_suffix(".parquet.tmp")
+        pq.write_table(table.replace_schema_metadata(schema_metadata), tmp_path)
+        os.replace(tmp_path, parquet_path)
+    except (pa.ArrowException, OSError) as e:
+        console.log(f"Failed to write cache file {parquet_path}: {e}")
+    return df
+
+
+def _from_arrow(table: pa.Table) -> pd.DataFrame:
+    """Convert a cached table to the frame `read_csv` returned, NaN for missing strings."""
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    for col in df.select_dtypes(include="object").columns:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
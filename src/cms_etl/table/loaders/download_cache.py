@@ -0,0 +1,451 @@
+"""Conditional downloads into the CMS cache directory, tracked by a manifest."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent import futures
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from rich.progress import DownloadColumn, Progress, TaskID, TransferSpeedColumn
+
+from cms_etl.utils import console
+
+MANIFEST_NAME = "manifest.json"
+"""Name of the manifest file in the cache directory."""
+
+DOWNLOAD_CHUNK = 1 << 16
+"""Bytes read per chunk when hashing a file."""
+
+MIN_CHUNK = 1 << 16
+"""Smallest chunk a download body is read in."""
+
+MAX_CHUNK = 1 << 22
+"""Largest chunk a download body is read in."""
+
+CHUNK_FAST_SECONDS = 0.05
+"""Chunks read faster than this double the chunk size."""
+
+CHUNK_SLOW_SECONDS = 0.5
+"""Chunks read slower than this halve the chunk size."""
+
+DOWNLOAD_TIMEOUT = (5, 60)
+"""Connect and read timeouts of a download, in seconds."""
+
+DOWNLOAD_RETRIES = 3
+"""Times an interrupted download is resumed before giving up."""
+
+DOWNLOAD_BACKOFF = 1.0
+"""Seconds waited before the first retry; each further retry waits twice as long."""
+
+DOWNLOAD_WORKERS = 4
+"""Datasets downloaded at the same time."""
+
+type ProgressCallback = Callable[[int, Optional[int]], None]
+
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    ValueError,
+)
+"""Errors of an attempt that are worth resuming after."""
+
+
+@dataclass
+class ManifestEntry:
+    """Where a cached file was downloaded from, and what was downloaded.
+
+    `modified` is the dataset's `CMSMetaResponse.modified` at download time,
+    and `etag`/`last_modified` are the response headers used to make the
+    next request conditional. `mtime_ns` is the file's mtime once written,
+    so an untouched file is trusted without hashing it again.
+    """
+
+    url: str
+    modified: str = ""
+    etag: str = ""
+    last_modified: str = ""
+    size: int = 0
+    sha256: str = ""
+    mtime_ns: int = 0
+
+
+def file_sha256(path: str | Path) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    """The manifest entries of the files of a cache directory, by file name.
+
+    A partial download has an entry under its ".part" name, holding the
+    validator it can be resumed with. Entries are saved as they change, and
+    can be changed from several threads.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = {
+                        name: ManifestEntry(**entry) for name, entry in json.load(f).items()
+                    }
+            except (ValueError, TypeError) as e:
+                # Files without a valid entry are downloaded again
+                console.log(f"Ignoring unreadable manifest {self.path}: {e}")
+
+    def get(self, filename: str) -> Optional[ManifestEntry]:
+        """Return the entry of a cached file, if it has one."""
+        return self._entries.get(filename)
+
+    def set(self, filename: str, entry: ManifestEntry):
+        """Record the entry of a cached file and save the manifest."""
+        with self._lock:
+            self._entries[filename] = entry
+            self._save()
+
+    def drop(self, filename: str):
+        """Forget the entry of a file, if it has one, and save the manifest."""
+        with self._lock:
+            if self._entries.pop(filename, None) is not None:
+                self._save()
+
+    def save(self):
+        """Write the manifest, replacing it atomically."""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: asdict(entry) for name, entry in self._entries.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def verify(self, path: str | Path) -> bool:
+        """Return whether a cached file is complete and unchanged since it was downloaded.
+
+        Files touched since are hashed and checked against the recorded checksum.
+        """
+        path = Path(path)
+        entry = self.get(path.name)
+        if entry is None or not path.exists():
+            return False
+        stat = path.stat()
+        if stat.st_size != entry.size:
+            return False
+        return stat.st_mtime_ns == entry.mtime_ns or file_sha256(path) == entry.sha256
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ChunkReader(Protocol):
+    """A body read `amt` bytes at a time, like a binary file or a urllib3 response."""
+
+    def read(self, amt: int, /) -> bytes: ...
+
+
+def adaptive_chunks(
+    raw: ChunkReader, min_size: int = MIN_CHUNK, max_size: int = MAX_CHUNK
+) -> Iterator[bytes]:
+    """Yield a response body in chunks sized to the link.
+
+    The chunk size doubles while chunks arrive quickly and halves when they
+    are slow, so fast links make few large writes and slow ones still report
+    progress often.
+    """
+    size = min_size
+    while True:
+        start = perf_counter()
+        chunk = raw.read(size)
+        if not chunk:
+            return
+        yield chunk
+        elapsed = perf_counter() - start
+        if elapsed < CHUNK_FAST_SECONDS:
+            size = min(size * 2, max_size)
+        elif elapsed > CHUNK_SLOW_SECONDS:
+            size = max(size // 2, min_size)
+
+
+def download(
+    url: str,
+    dest: str | Path,
+    manifest: DownloadManifest,
+    *,
+    modified: str = "",
+    session: Optional[requests.Session] = None,
+    retries: int = DOWNLOAD_RETRIES,
+    backoff: float = DOWNLOAD_BACKOFF,
+    on_progress: Optional[ProgressCallback] = None,
+) -> bool:
+    """Download a URL to `dest` unless the cached copy is current.
+
+    Nothing is requested when the copy verifies and the dataset's `modified`
+    date matches the manifest. Otherwise the request is conditional on the
+    recorded ETag and Last-Modified, so an unchanged file costs a 304. The body
+    is written to `dest` + ".part" and renamed over `dest` only once its length
+    is checked, and its size and checksum are recorded in the manifest.
+
+    Connection errors and truncated bodies are retried `retries` times, waiting
+    `backoff` seconds and twice that each time. Every attempt resumes the
+    ".part" file with a Range request, made conditional on the validator the
+    part was started with, so a file that changed meanwhile starts over; the
+    part is also kept for the next call when the retries run out.
+    `on_progress` is called with the bytes written so far and the total, if known.
+
+    Returns whether the file was downloaded. Raises `requests.RequestException`
+    on HTTP and connection errors, and ValueError on a body shorter than its
+    Content-Length; `dest` is left as it was.
+    """
+    dest = Path(dest)
+    entry = manifest.get(dest.name)
+    current = entry is not None and entry.url == url and manifest.verify(dest)
+    if current and modified and entry is not None and entry.modified == modified:
+        return False
+
+    http = session or requests.Session()
+    attempt = 0
+    try:
+        while True:
+            try:
+                return _fetch(url, dest, manifest, http, modified, current, on_progress)
+            except _TRANSIENT_ERRORS as e:
+                if attempt >= retries:
+                    raise
+                console.log(f"Download of {url} interrupted ({e}), retrying...")
+                time.sleep(backoff * 2**attempt)
+                attempt += 1
+    finally:
+        if session is None:
+            http.close()
+
+
+def _fetch(
+    url: str,
+    dest: Path,
+    manifest: DownloadManifest,
+    http: requests.Session,
+    modified: str,
+    current: bool,
+    on_progress: Optional[ProgressCallback],
+) -> bool:
+    """Make one download attempt, resuming the part file when there is one."""
+    part_path = dest.with_name(f"{dest.name}.part")
+    part = manifest.get(part_path.name)
+    validator = ""
+    if part is not None and part.url == url:
+        validator = part.etag or part.last_modified
+    offset = part_path.stat().st_size if validator and part_path.exists() else 0
+
+    # Ranges count the bytes as sent, so ask for them unencoded
+    headers = {"Accept-Encoding": "identity"}
+    entry = manifest.get(dest.name)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif current and entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+    with http.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        if r.status_code == 304 and current and entry is not None:
+            entry.modified = modified or entry.modified
+            manifest.set(dest.name, entry)
+            return False
+        resumed = r.status_code == 206
+        if r.status_code == 416 or (
+            resumed and not r.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+        ):
+            # The part is no prefix of the file on the server; start over
+            part_path.unlink(missing_ok=True)
+            manifest.drop(part_path.name)
+            raise ValueError(f"Stale partial download of {url} discarded")
+        r.raise_for_status()
+        if not resumed:
+            offset = 0  # a full body: the file changed, or ranges aren't supported
+        etag, last_modified = r.headers.get("ETag", ""), r.headers.get("Last-Modified", "")
+        # A server that encodes the body anyway counts its length and ranges in encoded
+        # bytes, so the decoded body is neither checked against them nor resumed
+        encoded = r.headers.get("Content-Encoding", "identity") != "identity"
+        length = None if encoded else r.headers.get("Content-Length")
+        total = offset + int(length) if length is not None else None
+        if encoded:
+            r.raw.decode_content = True
+            manifest.drop(part_path.name)
+        else:
+            manifest.set(part_path.name, ManifestEntry(url, modified, etag, last_modified))
+
+        digest, size = hashlib.sha256(), 0
+        with open(part_path, "r+b" if offset else "wb") as f:
+            while size < offset:
+                chunk = f.read(min(DOWNLOAD_CHUNK, offset - size))
+                digest.update(chunk)
+                size += len(chunk)
+            f.truncate(offset)
+            try:
+                for chunk in adaptive_chunks(r.raw):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if on_progress is not None:
+                        on_progress(size, total)
+            # Raised as `requests` raises them when it reads a body itself
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e) from e
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.ConnectionError(e) from e
+        if total is not None and size != total:
+            raise ValueError(f"Downloaded {size} of {total} bytes from {url}")
+        os.replace(part_path, dest)
+
+    manifest.drop(part_path.name)
+    manifest.set(
+        dest.name,
+        ManifestEntry(
+            url, modified, etag, last_modified, size, digest.hexdigest(), dest.stat().st_mtime_ns
+        ),
+    )
+    return True
+
+
+class DownloadManager:
+    """Downloads into a cache directory, several at a time over keep-alive sessions.
+
+    Each worker thread keeps one `requests.Session`, so its connections are
+    reused from one download to the next. Downloads show a progress bar
+    unless `progress` is off.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        *,
+        workers: int = DOWNLOAD_WORKERS,
+        retries: int = DOWNLOAD_RETRIES,
+        backoff: float = DOWNLOAD_BACKOFF,
+        progress: bool = True,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = DownloadManifest(self.cache_dir / MANIFEST_NAME)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.progress = progress
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._lock = threading.Lock()
+
+    def path(self, url: str) -> Path:
+        """Return the cache path of a URL: its file name in the cache directory."""
+        return self.cache_dir / urlsplit(url).path.rsplit("/", 1)[-1]
+
+    def session(self) -> requests.Session:
+        """Return the session of the calling thread, opening it on first use."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=self.workers))
+            session.mount("https://", HTTPAdapter(pool_maxsize=self.workers))
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def fetch(self, url: str, modified: str = "") -> Path:
+        """Download a URL unless the cached copy is current, and return its path.
+
+        Raises as `download` does.
+        """
+        with self._progress() as progress:
+            return self._fetch_one(url, modified, progress)
+
+    def fetch_many(self, jobs: Iterable[Tuple[str, str]]) -> Dict[str, Path | Exception]:
+        """Download the `(url, modified)` jobs on `workers` threads.
+
+        Returns the path of each URL, or the error its download failed with.
+        """
+        by_url = dict(jobs)  # one download per URL, so no two threads write the same file
+        results: Dict[str, Path | Exception] = {}
+        with self._progress() as progress:
+            with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = {
+                    executor.submit(self._fetch_one, url, modified, progress): url
+                    for url, modified in by_url.items()
+                }
+                for future in futures.as_completed(pending):
+                    url = pending[future]
+                    try:
+                        results[url] = future.result()
+                    except (requests.RequestException, ValueError, OSError) as e:
+                        results[url] = e
+        return {url: results[url] for url in by_url}
+
+    def close(self):
+        """Close the sessions of every worker thread."""
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self._local = threading.local()
+
+    def _fetch_one(self, url: str, modified: str, progress: Optional[Progress]) -> Path:
+        """Download a URL, reporting to its own task of the progress bar."""
+        dest = self.path(url)
+        on_progress = None
+        if progress is not None:
+            task = progress.add_task(dest.name, total=None)
+            on_progress = partial(_update_task, progress, task)
+        download(
+            url,
+            dest,
+            self.manifest,
+            modified=modified,
+            session=self.session(),
+            retries=self.retries,
+            backoff=self.backoff,
+            on_progress=on_progress,
+        )
+        return dest
+
+    @contextmanager
+    def _progress(self) -> Iterator[Optional[Progress]]:
+        """Show the progress bars of the downloads made inside the block, if enabled."""
+        if not self.progress:
+            yield None
+            return
+        columns = (
+            *Progress.get_default_columns()[:-1],
+            DownloadColumn(),
+            TransferSpeedColumn(),
+        )
+        with Progress(*columns, console=console, transient=True) as progress:
+            yield progress
+
+
+def _update_task(progress: Progress, task: TaskID, done: int, total: Optional[int]):
+    """Report the bytes written to a download's task of the progress bar."""
+    progress.update(task, completed=done, total=total)
@@ -0,0 +1,210 @@
+"""Metadata of CMS datasets, fetched over one pooled session and cached on disk."""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent import futures
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cms_etl.models.cms_meta_res import CMSMetaResponse
+from cms_etl.utils import console
+
+META_CACHE_NAME = "meta_cache.json"
+"""Name of the metadata cache file in the cache directory."""
+
+META_TTL = 24 * 60 * 60
+"""Seconds a cached metadata response is used before it is fetched again."""
+
+META_TIMEOUT = (5, 10)
+"""Connect and read timeouts of a metadata request, in seconds."""
+
+META_RETRIES = 3
+"""Times a failed metadata request is retried."""
+
+META_BACKOFF = 0.5
+"""Backoff factor of the retries: they wait 0.5, 1 and 2 seconds by default."""
+
+META_WORKERS = 8
+"""Metadata requests made at the same time, and connections kept in the pool."""
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+"""Response statuses worth retrying."""
+
+
+class CMSMetaClient:
+    """Fetches `CMSMetaResponse`s, reusing responses younger than `ttl` seconds.
+
+    All requests share one session, whose pool keeps a connection per worker
+    alive and retries connection errors and the statuses of `_RETRY_STATUSES`
+    with exponential backoff. Responses are kept in memory and in a JSON file
+    of the cache directory, so they survive restarts; a stale response is
+    still used when fetching it again fails. Threads asking for a URL that is
+    being fetched wait for that request instead of making their own.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        *,
+        ttl: float = META_TTL,
+        retries: int = META_RETRIES,
+        backoff: float = META_BACKOFF,
+        workers: int = META_WORKERS,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / META_CACHE_NAME
+        self.ttl = ttl
+        self.workers = workers
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # url -> {"fetched": epoch seconds, "meta": the response JSON}
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+        self._parsed: Dict[str, CMSMetaResponse] = {}
+        self._pending: Dict[str, futures.Future[CMSMetaResponse]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Read the cache file; an unreadable one is ignored."""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError as e:
+            console.log(f"Ignoring unreadable metadata cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        """Write the cache file, if responses were fetched since it was last written."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def is_fresh(self, url: str) -> bool:
+        """Return whether the cached response of a URL is younger than the TTL."""
+        entry = self._entries.get(url)
+        return entry is not None and time.time() - entry["fetched"] < self.ttl
+
+    def get(self, url: str) -> CMSMetaResponse:
+        """Return the metadata of a dataset from its metastore URL, cached if fresh.
+
+        Raises `requests.RequestException` when it can't be fetched and nothing
+        is cached, and pydantic's ValidationError on a malformed response.
+        """
+        try:
+            return self._get(url)
+        finally:
+            self._save()
+
+    def get_many(self, urls: Iterable[str]) -> List[CMSMetaResponse]:
+        """Return the metadata of several URLs in order, fetching the stale ones concurrently.
+
+        The cache file is written once, after the batch. Raises the first error
+        `get` raises.
+        """
+        urls = list(urls)
+        stale = [url for url in dict.fromkeys(urls) if not self.is_fresh(url)]
+        try:
+            if len(stale) > 1:
+                with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    list(executor.map(self._get, stale))
+            return [self._get(url) for url in urls]
+        finally:
+            self._save()
+
+    def _get(self, url: str) -> CMSMetaResponse:
+        """Return the metadata of a URL like `get`, without writing the cache file."""
+        if self.is_fresh(url):
+            return self._cached(url)
+        with self._lock:
+            pending = self._pending.get(url)
+            fetching = pending is None
+            if pending is None:
+                pending = self._pending[url] = futures.Future()
+        if not fetching:
+            return pending.result()
+        try:
+            parsed = self._fetch(url)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(parsed)
+            return parsed
+        finally:
+            with self._lock:
+                del self._pending[url]
+
+    def _fetch(self, url: str) -> CMSMetaResponse:
+        """Fetch the metadata of a URL, falling back on the cached response when that fails."""
+        try:
+            response = self.session.get(url, timeout=META_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            if url not in self._entries:
+                raise
+            console.log(f"Using cached metadata of {url}, fetching it failed: {e}")
+            return self._cached(url)
+        parsed = CMSMetaResponse(**data)
+        with self._lock:
+            self._entries[url] = {"fetched": time.time(), "meta": data}
+            self._parsed[url] = parsed
+            self._dirty = True
+        return parsed
+
+    def _cached(self, url: str) -> CMSMetaResponse:
+        """Return the cached metadata of a URL, parsing it on first use."""
+        parsed = self._parsed.get(url)
+        if parsed is None:
+            parsed = CMSMetaResponse(**self._entries[url]["meta"])
+            self._parsed[url] = parsed
+        return parsed
+
+    def prefetch(self, urls: Iterable[str]) -> threading.Thread:
+        """Fetch the metadata of the URLs on a background thread, logging failures.
+
+        The thread is a daemon, so it never holds up exiting.
+        """
+        urls = list(urls)
+
+        def run():
+            try:
+                self.get_many(urls)
+            except Exception as e:  # pylint: disable=broad-except
+                console.log(f"Prefetching CMS metadata failed: {e}")
+
+        thread = threading.Thread(target=run, name="cms-meta-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,9 +1,11 @@
 """Table class for DataFrame manipulation."""
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import pandas as pd
 
+from cms_etl.compare.blocking import compute_zip_keys
+from cms_etl.compare.match_keys import compute_match_keys
 from cms_etl.table.command_manager import CommandManager
 
 
@@ -17,6 +19,8 @@ class Table:
         self.description = description
         self.cmd_manager = CommandManager(self)
         self.tmp_df_dict = dict()
+        self._match_keys: Dict[str, pd.DataFrame] = {}
+        self._zip_keys: Dict[str, pd.DataFrame] = {}
         self.metadata = {}
         if metadata:
             for key, value in metadata.items():
@@ -34,6 +38,30 @@ class Table:
         """Reset the DataFrame to its initial state."""
         self.__df = self.__init_df.copy(deep=True)
         self.cmd_manager = CommandManager(self)
+        self.invalidate_match_keys()
+
+    def match_keys(self, col: str) -> pd.DataFrame:
+        """Return the cached match keys (processed, house_num, lead_alpha) of a column.
+
+        The keys are computed on first use and dropped whenever the DataFrame changes.
+        """
+        if col not in self._match_keys:
+            self._match_keys[col] = compute_match_keys(self.__df[col])
+        return self._match_keys[col]
+
+    def zip_keys(self, col: str) -> pd.DataFrame:
+        """Return the cached zip keys (zip5, zip3) of a column.
+
+        Like the match keys, they are computed once and shared by every blocking stage.
+        """
+        if col not in self._zip_keys:
+            self._zip_keys[col] = compute_zip_keys(self.__df[col])
+        return self._zip_keys[col]
+
+    def invalidate_match_keys(self):
+        """Drop the cached match and zip keys."""
+        self._match_keys.clear()
+        self._zip_keys.clear()
 
     @property
     def df(self) -> pd.DataFrame:
@@ -43,6 +71,7 @@ class Table:
     @df.setter
     def df(self, new_df: pd.DataFrame):
         self.__df = new_df
+        self.invalidate_match_keys()
 
     def __repr__(self):
         return f"\nTable(name={self.name}, description={self.description}\n{self.__df})"
@@ -286,5 +286,4 @@ def isolate_addr_head(address: str) -> str:
     """Normalize an address string."""
     if address is None or pd.isna(address):
         return ""
-    print(" ".join(address.split(" ")[0:2]))
-    return " ".join(address.split(" ")[0:1])
+    return " ".join(str(address).split(" ")[0:1])
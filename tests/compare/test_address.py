@@ -0,0 +1,34 @@
+"""Tests for the address module."""
+
+import pandas as pd
+from cms_etl.compare.address import AddressStandardizer, standardize_address
+
+
+def test_standardize_address():
+    """Test the USPS suffix, directional and unit abbreviations."""
+    assert standardize_address(" 123 North Main Street, Suite 200 ") == "123 N MAIN ST STE 200"
+    assert standardize_address("45 w. oak avenue apartment 3") == "45 W OAK AVE APT 3"
+    assert standardize_address("9 Streeter Rd") == "9 STREETER RD"  # whole words only
+    assert standardize_address(None) == ""
+
+
+def test_standardizer_memoizes_unique_values():
+    """Test that a column is standardized once per distinct value and keeps missing values."""
+    standardizer = AddressStandardizer()
+    col = pd.Series(["1 Elm Street", None, "1 Elm Street", "2 Oak Road"], index=[5, 6, 7, 8])
+    result = standardizer.standardize(col)
+    assert result.index.tolist() == [5, 6, 7, 8]
+    assert result.tolist()[:1] + result.tolist()[2:] == ["1 ELM ST", "1 ELM ST", "2 OAK RD"]
+    assert pd.isna(result[6])
+    assert len(standardizer) == 2
+
+    standardizer.standardize(pd.Series(["1 Elm Street", "3 Pine Lane"]))
+    assert len(standardizer) == 3
+
+
+def test_standardizer_memo_is_bounded():
+    """Test that the memo is cleared instead of growing past its size."""
+    standardizer = AddressStandardizer(memo_size=2)
+    standardizer.standardize(pd.Series(["1 A St", "2 B St"]))
+    assert standardizer.standardize_one("3 C Street") == "3 C ST"
+    assert len(standardizer) == 1
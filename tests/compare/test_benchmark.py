@@ -0,0 +1,58 @@
+"""Test the compare benchmarks."""
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+BENCHMARK_PATH = Path(__file__).parents[2] / "scripts" / "benchmark.py"
+"""The benchmark script, which lives outside the package."""
+
+_spec = importlib.util.spec_from_file_location("benchmark", BENCHMARK_PATH)
+assert _spec is not None and _spec.loader is not None
+benchmark = sys.modules["benchmark"] = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(benchmark)
+
+
+def test_score_predictions():
+    """Test precision and recall against the ground truth."""
+    truth = {"a": 1, "b": 2, "c": 3, "d": 4}
+    assert benchmark.score_predictions({"a": 1, "b": 5}, truth) == (0.5, 0.25)
+    assert benchmark.score_predictions({}, truth) == (None, 0.0)
+
+
+def test_run_benchmarks(tmp_path, monkeypatch):
+    """Test that every stage is measured at every size without prompting."""
+    monkeypatch.chdir(tmp_path)
+    results = benchmark.run_benchmarks([60, 120], sample=30)
+    assert [(result.stage, result.table_rows) for result in results] == [
+        ("filter_by_lead_digits", 60),
+        ("fuzz_col_w_process", 60),
+        ("fuzz_col_vs_col", 60),
+        ("filter_by_lead_digits", 120),
+        ("fuzz_col_w_process", 120),
+        ("fuzz_col_vs_col", 120),
+    ]
+    assert [result.measured_rows for result in results[3:]] == [30, 30, 120]
+    for result in results:
+        assert result.rows_per_sec > 0
+        assert result.peak_mb is not None and result.peak_mb > 0
+        assert 0.5 < result.recall <= 1
+    assert results[0].precision is None
+    assert results[2].precision is not None and results[2].precision > 0.9
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_main_writes_json(tmp_path, mocker):
+    """Test that the results are printed and written as JSON."""
+    mocker.patch("cms_etl.utils.console.print")
+    output = tmp_path / "bench.json"
+    benchmark.main(["--sizes", "40", "--sample", "10", "--no-memory", "--output", str(output)])
+    data = json.loads(output.read_text(encoding="utf-8"))
+    assert [row["stage"] for row in data] == [
+        "filter_by_lead_digits",
+        "fuzz_col_w_process",
+        "fuzz_col_vs_col",
+    ]
+    assert data[0]["peak_mb"] is None
+    assert data[2]["measured_rows"] == 40
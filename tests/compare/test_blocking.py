@@ -0,0 +1,106 @@
+"""Tests for the blocking module."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from cms_etl.compare.blocking import (
+    BlockIndex,
+    SortedNeighborhood,
+    canonical_zips,
+    compute_zip_keys,
+    neighborhood_keys,
+    normalize_block_key,
+)
+from cms_etl.compare.match_keys import compute_match_keys
+
+
+def test_normalize_block_key():
+    """Test the normalize_block_key function."""
+    assert normalize_block_key(" 12345 ") == "12345"
+    assert normalize_block_key(12345) == "12345"
+    assert normalize_block_key(None) == ""
+    assert normalize_block_key(np.nan) == ""
+
+
+def test_canonical_zips():
+    """Test that zips that lost their leading zeros or carry a ZIP+4 get 5 digits."""
+    assert canonical_zips(pd.Series([2134, 12345, 21341234])).tolist() == [
+        "02134",
+        "12345",
+        "02134",
+    ]
+    assert canonical_zips(pd.Series([2134.0, np.nan])).tolist() == ["02134", ""]
+    values = pd.Series(["02134-1234", " 2134 ", "021341234", "12345 6789", "K1A 0B1", None])
+    assert canonical_zips(values).tolist() == ["02134", "02134", "02134", "12345", "K1A 0B1", ""]
+
+
+def test_compute_zip_keys():
+    """Test that zip3 keys are only given to zips."""
+    keys = compute_zip_keys(pd.Series(["02134-1234", "K1A 0B1", None], index=[5, 6, 7]))
+    assert keys.index.tolist() == [5, 6, 7]
+    assert keys["zip5"].tolist() == ["02134", "K1A 0B1", ""]
+    assert keys["zip3"].tolist() == ["021", "", ""]
+
+
+class TestBlockIndex:
+    """Tests for the BlockIndex class."""
+
+    df = pd.DataFrame(
+        {
+            "address": ["1 Main St", "2 Main St", "3 Oak Ave", "4 Elm St", "5 Pine St"],
+            "zip_code": ["12345 ", "12345", "54321", None, " 54321"],
+        }
+    )
+
+    def test_positions(self):
+        """Test looking up the positions of a block."""
+        index = BlockIndex(self.df, "zip_code")
+        assert index.positions("12345").tolist() == [0, 1]
+        assert index.positions(" 54321").tolist() == [2, 4]
+        assert index.positions("99999").size == 0
+
+    def test_get_block(self):
+        """Test getting the rows of a block."""
+        index = BlockIndex(self.df, "zip_code")
+        block = index.get_block("54321")
+        assert block is not None
+        assert block["address"].tolist() == ["3 Oak Ave", "5 Pine St"]
+        assert index.get_block("99999") is None
+
+    def test_missing_keys_are_not_indexed(self):
+        """Test that missing values do not form a block."""
+        index = BlockIndex(self.df, "zip_code")
+        assert len(index) == 2
+        assert "" not in index
+        assert index.get_block(None) is None
+        assert sorted(index.keys()) == ["12345", "54321"]
+
+
+def test_neighborhood_keys():
+    """Test that neighborhood keys sort on the street, then the house number."""
+    keys = compute_match_keys(pd.Series(["12 Pine Rd", "9 Pine Rd", "4 Elm St", "", "Pine Rd"]))
+    nb_keys = neighborhood_keys(keys)
+    assert nb_keys[3] == ""
+    assert nb_keys.sort_values().index.tolist() == [3, 2, 4, 1, 0]
+
+
+class TestSortedNeighborhood:
+    """Tests for the SortedNeighborhood class."""
+
+    keys = pd.Series(["b|1", "", "a|2", "c|3", "a|1", "d|4"])
+
+    def test_positions(self):
+        """Test that a key's window holds the rows sorting around it."""
+        neighborhood = SortedNeighborhood(self.keys, window=2)
+        assert len(neighborhood) == 5
+        assert neighborhood.positions("b|2").tolist() == [0, 3]
+        # Windows are clipped to the sorted rows
+        assert neighborhood.positions("0").tolist() == [4, 2]
+        assert neighborhood.positions("z").tolist() == [3, 5]
+        assert neighborhood.window_starts(["0", "b|2", "z"]).tolist() == [0, 2, 3]
+
+    def test_window(self):
+        """Test windows wider than the table and invalid windows."""
+        assert SortedNeighborhood(self.keys, window=10).positions("c").tolist() == [4, 2, 0, 3, 5]
+        with pytest.raises(ValueError):
+            SortedNeighborhood(self.keys, window=0)
@@ -0,0 +1,83 @@
+"""Tests for the candidate_export module."""
+
+import pandas as pd
+import pytest
+from cms_etl.compare.candidate_export import (
+    candidate_frame,
+    export_scorers,
+    read_candidates,
+    replay_decisions,
+    write_candidates,
+)
+from cms_etl.compare.match_engine import match_blocks
+from cms_etl.compare.match_keys import compute_match_keys
+
+CMS_DF = pd.DataFrame(
+    {
+        "address": ["123 Main Street", "456 Elm St", "Main Street", "99 Nowhere Blvd"],
+        "zip_code": ["12345", "12345", "12345", "12345"],
+    }
+)
+DB_DF = pd.DataFrame(
+    {
+        "address": ["123 Main St", "456 Elm St", "456 Elm St Rear", "Main Street", "99 Else"],
+        "zip_code": ["12345", "12345", "12345", "12345", "12345"],
+    }
+)
+
+
+def _frame(top_k=3, **kwargs):
+    decisions = match_blocks(CMS_DF, DB_DF, "address", "address", top_k=top_k, **kwargs)
+    keys1 = compute_match_keys(CMS_DF["address"])
+    keys2 = compute_match_keys(DB_DF["address"])
+    frame = candidate_frame(
+        decisions, keys1["processed"].tolist(), keys2["processed"].tolist(), ["ratio", "w_ratio"]
+    )
+    return decisions, frame
+
+
+def test_candidate_frame():
+    """Test that every row keeps its top k candidates, below the cutoff too, with each scorer."""
+    decisions, frame = _frame(exact_first=False)
+    assert list(frame.columns) == [
+        "src_pos", "rank", "cand_pos", "score", "status", "tier", "ratio", "w_ratio"
+    ]  # fmt: skip
+    assert frame.groupby("src_pos").size().tolist() == [3, 3, 3, 3]
+    assert all(decision.top[0][0] == decision.candidates[0][0] for decision in decisions[:3])
+    nowhere = frame[frame["src_pos"] == 3]
+    assert nowhere["score"].max() < 80  # no candidate reaches the cutoff
+    assert (frame["ratio"] <= 100).all()
+
+    with pytest.raises(ValueError):
+        candidate_frame(decisions, [], [], ["partial_ratio_alignment"])
+
+
+def test_exact_hits_keep_their_hit():
+    """Test that rows resolved by the exact pre-pass export their single hit."""
+    decisions, frame = _frame()
+    assert decisions[0].tier == "exact"
+    assert frame.loc[frame["src_pos"] == 0, ["cand_pos", "tier"]].values.tolist() == [[0, "exact"]]
+
+
+def test_write_and_read_candidates(tmp_path):
+    """Test that a candidate file round-trips with its metadata."""
+    _, frame = _frame()
+    path = write_candidates(frame, tmp_path / "candidates.parquet", {"top_k": 3})
+    read, metadata = read_candidates(path)
+    pd.testing.assert_frame_equal(read, frame)
+    assert metadata == {"top_k": 3}
+
+
+def test_replay_decisions():
+    """Test that replaying the exported scores reproduces the engine's decisions."""
+    decisions, frame = _frame(exact_first=False)
+    replayed = replay_decisions(frame)
+    assert replayed["status"].tolist() == [decision.status for decision in decisions]
+    assert replayed["best"].tolist() == [
+        pd.NA if decision.best is None else decision.best for decision in decisions
+    ]
+
+    # Nothing scores above a confidence threshold of 100
+    strict = replay_decisions(frame, "ratio", confident_score=100)
+    assert strict.loc[1, "status"] == "none"
+    assert "w_ratio" in export_scorers()
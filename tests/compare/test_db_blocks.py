@@ -0,0 +1,72 @@
+"""Tests for the db_blocks module."""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+from cms_etl.compare.db_blocks import DBBlockSource
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.db.adapters import SQLiteAdapter
+from cms_etl.db.adapters.config import SQLiteConfig
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    """Return an adapter over a facilities table with an integer and a text zip column."""
+    path = tmp_path / "facilities.db"
+    with sqlite3.connect(path) as conn:
+        pd.DataFrame(
+            {
+                "id": [1, 2, 3, 4, 5],
+                "address": ["1 Main St", "2 Main St", "3 Oak Ave", "4 Elm St", "5 Pine St"],
+                "zip_code": ["02134", "02134", "54321", "12345", None],
+                "zip_int": [2134, 2134, 54321, 12345, None],
+            }
+        ).to_sql("facilities", conn, index=False)
+        conn.execute("CREATE INDEX ix_zip ON facilities (zip_code)")
+    db = SQLiteAdapter(SQLiteConfig(file_path=str(path)))
+    yield db
+    db.close()
+
+
+def test_fetch(adapter):
+    """Test that blocks are fetched in batches and served from the cache after that."""
+    metrics.reset()
+    source = DBBlockSource(adapter, "facilities", "zip_code", batch_size=2)
+    rows = source.fetch(["54321", "02134", "", "54321", "99999"])
+    assert rows["id"].tolist() == [3, 1, 2]
+    assert rows.index.tolist() == [0, 1, 2]
+    assert metrics.counters["db_queries"] == 2
+    assert "99999" in source  # an empty block isn't looked up again
+
+    rows = source.fetch(["02134", "99999", "12345"])
+    assert rows["id"].tolist() == [1, 2, 4]
+    assert metrics.counters["db_queries"] == 3
+    assert metrics.counters["db_block_hits"] == 2
+    assert metrics.counters["db_block_misses"] == 4
+    assert source.fetch([]).columns.tolist() == ["id", "address", "zip_code", "zip_int"]
+
+
+def test_fetch_integer_zips(adapter, mocker: MockerFixture):
+    """Test that a zip column of integers is found by canonical zip, and indexing is checked."""
+    mock_log = mocker.patch("cms_etl.compare.db_blocks.console.log")
+    source = DBBlockSource(adapter, "facilities", "zip_int")
+    mock_log.assert_called_once()
+    assert source.fetch(["02134"])["id"].tolist() == [1, 2]
+    with pytest.raises(ValueError):
+        DBBlockSource(adapter, "facilities", "zip")
+
+
+def test_cache_eviction(adapter):
+    """Test that the least recently used blocks are evicted beyond the row limit."""
+    source = DBBlockSource(adapter, "facilities", "zip_code", cache_rows=2)
+    source.fetch(["02134"])
+    source.fetch(["54321"])
+    assert "02134" not in source
+    assert source.cached_rows == 1
+    source.fetch(["12345"])
+    source.fetch(["54321"])
+    source.fetch(["02134"])
+    assert list(source._blocks) == ["02134"]  # pylint: disable=protected-access
+    assert len(source) == 1
@@ -0,0 +1,98 @@
+"""Tests for the decision_cache module."""
+
+import pandas as pd
+from cms_etl.compare.compare_tools import fuzz_col_w_process
+from cms_etl.compare.decision_cache import DecisionCache, field_key, pair_keys, scorer_key
+from cms_etl.compare.scoring import FieldSpec
+from pytest_mock import MockerFixture
+
+
+def test_pair_keys():
+    """Test that the keys of several fields are joined row by row."""
+    assert pair_keys([["1 main st", "2 oak ave"], ["ste 4", ""]]) == [
+        "1 main st | ste 4",
+        "2 oak ave | ",
+    ]
+
+
+def test_scorer_key():
+    """Test that the key of a run changes with its weights and thresholds."""
+    fields = [FieldSpec("a", "b", weight=2).key, FieldSpec("c", "d", "ratio", min_score=50).key]
+    assert scorer_key(fields, 80, 86) == "token_set*2/skip,ratio*1/skip>50@80-86"
+    assert scorer_key(fields[:1], 80, 86) != scorer_key(fields[:1], 80, 90)
+    assert scorer_key(fields[:1], 80, 86) != scorer_key([FieldSpec("a", "b").key], 80, 86)
+    assert FieldSpec("a", "b").key == field_key("token_set")
+
+
+def test_record_and_lookup(tmp_path):
+    """Test that decisions persist across connections and settle later choices."""
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        cache.record("12 pine rd", ["12 pine rd", "12 pine rd w"], "token_set", 1)
+        cache.record("1 main st", ["1 main st n", "1 main st s"], "token_set", None)
+
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        assert len(cache) == 4
+        assert cache.decisions("12 pine rd", "token_set") == {
+            "12 pine rd": False,
+            "12 pine rd w": True,
+        }
+        assert cache.cached_choice("12 pine rd", ["12 pine rd w", "x"], "token_set") == (True, 0)
+        assert cache.cached_choice("1 main st", ["1 main st s"], "token_set") == (True, None)
+        # A candidate nobody decided on still needs a reviewer
+        assert cache.cached_choice("1 main st", ["1 main st s", "1 main"], "token_set") == (
+            False,
+            None,
+        )
+        assert cache.cached_choice("12 pine rd", ["12 pine rd w"], "ratio") == (False, None)
+        assert cache.accepted_pairs("token_set") == {"12 pine rd": "12 pine rd w"}
+
+
+def test_record_duplicate_candidates(tmp_path):
+    """Test that candidates with the same key share the decision made for either."""
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        cache.record("12 pine rd", ["12 pine rd", "12 pine rd"], "token_set", 0)
+        assert cache.decisions("12 pine rd", "token_set") == {"12 pine rd": True}
+
+
+def test_fuzz_col_w_process_cache(tmp_path, mocker: MockerFixture):
+    """Test that a prompt answer is recorded and answers the same question next time."""
+    mocker.patch("cms_etl.utils.console.clear")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.print")
+    mock_input = mocker.patch("cms_etl.utils.console.input", return_value="2")
+    df = pd.DataFrame({"id": [1, 2, 3], "address": ["12 Pine Rd", "12 Pine Rd W", "40 Elm"]})
+    row = pd.Series({"address": "12 Pine Rd"})
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        match = fuzz_col_w_process(df, row, "address", "12 Pine Rd", "token_set", cache=cache)
+        assert match is not None and match["id"] == 2
+        assert mock_input.call_count == 1
+
+        spy = mocker.spy(cache, "record")
+        match = fuzz_col_w_process(df, row, "address", "12 PINE ROAD", "token_set", cache=cache)
+        assert match is not None and match["id"] == 2
+        assert mock_input.call_count == 1
+        spy.assert_not_called()
+
+        # Rejecting every candidate sticks too
+        scorer = scorer_key([field_key("token_set")], 80, 86)
+        cache.record("12 pine rd", ["12 pine rd", "12 pine rd w"], scorer, None)
+        match = fuzz_col_w_process(df, row, "address", "12 Pine Rd", "token_set", cache=cache)
+        assert match is None
+        assert mock_input.call_count == 1
+
+
+def test_fuzz_col_w_process_invalid_index(tmp_path, mocker: MockerFixture):
+    """Test that an invalid answer is asked again and never recorded as a rejection."""
+    mocker.patch("cms_etl.utils.console.clear")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.print")
+    mocker.patch("cms_etl.utils.console.log")
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["x", "5", "1"])
+    df = pd.DataFrame({"id": [1, 2, 3], "address": ["40 Elm", "12 Pine Rd", "12 Pine Rd W"]})
+    row = pd.Series({"address": "12 Pine Rd"})
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        match = fuzz_col_w_process(df, row, "address", "12 Pine Rd", "token_set", cache=cache)
+        assert match is not None and match["id"] == 2
+        assert mock_input.call_count == 3
+        scorer = scorer_key([field_key("token_set")], 80, 86)
+        assert cache.decisions("12 pine rd", scorer) == {"12 pine rd": True, "12 pine rd w": False}
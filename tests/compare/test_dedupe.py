@@ -0,0 +1,64 @@
+"""Tests for the dedupe module."""
+
+import numpy as np
+import pandas as pd
+from cms_etl.compare import dedupe
+from cms_etl.compare.dedupe import UnionFind, cluster_ids, duplicate_pairs, find_duplicate_clusters
+
+DF = pd.DataFrame(
+    {
+        "address": [
+            "123 Main Street",
+            "123 Main St.",
+            "123 Main St",
+            "123 Main Street",
+            "456 Elm St",
+            "456 Elm Street",
+            "456 Oak Ave",
+            None,
+        ],
+        "zip_code": ["12345", "12345", "12345", "99999", "12345", "12345", "12345", "12345"],
+    }
+)
+
+
+def test_union_find():
+    """Test that unions merge sets transitively."""
+    sets = UnionFind(5)
+    sets.union(0, 1)
+    sets.union(3, 4)
+    sets.union(1, 4)
+    labels = sets.labels()
+    assert len(set(labels[[0, 1, 3, 4]])) == 1
+    assert labels[2] == 2
+
+
+def test_cluster_ids():
+    """Test that clusters are numbered by their first row and singletons get no id."""
+    ids = cluster_ids(6, np.array([[4, 5], [1, 3], [3, 2]]))
+    assert ids.tolist() == [pd.NA, 1, 1, 1, 2, 2]
+
+
+def test_duplicate_pairs_blocks_on_zip_and_house_number():
+    """Test that only rows sharing a zip and house number are compared."""
+    pairs = duplicate_pairs(DF, "address", block_col="zip_code")
+    assert sorted(map(tuple, pairs.tolist())) == [(0, 1), (0, 2), (1, 2), (4, 5)]
+    unblocked = duplicate_pairs(DF, "address")
+    assert (0, 3) in set(map(tuple, unblocked.tolist()))
+
+
+def test_oversized_blocks_use_ngram_neighbours(monkeypatch):
+    """Test that blocks over the size limit find the same pairs from n-gram neighbours."""
+    expected = sorted(map(tuple, duplicate_pairs(DF, "address").tolist()))
+    monkeypatch.setattr(dedupe, "MAX_BLOCK_SIZE", 1)
+    pairs = duplicate_pairs(DF, "address")
+    assert sorted(map(tuple, pairs.tolist())) == expected
+    assert (pairs[:, 0] < pairs[:, 1]).all()
+
+
+def test_find_duplicate_clusters():
+    """Test that the cluster ids are aligned to the index."""
+    df = DF.set_axis(list("abcdefgh"))
+    ids = find_duplicate_clusters(df, "address", block_col="zip_code")
+    assert ids.index.tolist() == list("abcdefgh")
+    assert ids.tolist() == [1, 1, 1, pd.NA, 2, 2, pd.NA, pd.NA]
@@ -0,0 +1,95 @@
+"""Test the row fingerprint store."""
+
+import pandas as pd
+from cms_etl.compare.fingerprints import (
+    FingerprintStore,
+    find_ccn_col,
+    row_fingerprints,
+    row_keys,
+    table_digest,
+)
+from cms_etl.compare.review_queue import ReviewCandidate, ReviewItem
+
+
+def test_find_ccn_col():
+    """Test that the CCN column is found by name."""
+    assert find_ccn_col(["Provider Name", "CMS Certification Number (CCN)"]) == (
+        "CMS Certification Number (CCN)"
+    )
+    assert find_ccn_col(["Provider Name"]) is None
+
+
+def test_row_keys():
+    """Test that repeated CCNs get distinct keys and missing CCNs get none."""
+    keys = row_keys(pd.Series(["015009", " 015009", None, "015010"]))
+    assert keys.tolist() == ["015009", "015009#1", "", "015010"]
+
+
+def test_row_fingerprints():
+    """Test that fingerprints only change with the hashed columns."""
+    df = pd.DataFrame(
+        {"addr": ["1 Main St", "1 Main St ", None], "zip": ["12345", "12345", "1"], "x": [1, 2, 3]}
+    )
+    hashes = row_fingerprints(df, ["addr", "zip"])
+    assert hashes[0] == hashes[1]
+    assert hashes[0] != hashes[2]
+    assert hashes.index.equals(df.index)
+
+
+def test_store_round_trip(tmp_path):
+    """Test that a saved store reloads and is dropped when the columns change."""
+    store = FingerprintStore.load(tmp_path / "fp.json", ["addr", "address"])
+    store.record("015009", "aa", 0, "match", {"id": 1})
+    store.record("015010", "bb", 1, "none")
+    store.record("015011", "cc", 2, "queued")
+    store.record("", "dd", 3, "none")
+    store.save()
+
+    store = FingerprintStore.load(tmp_path / "fp.json", ["addr", "address"])
+    assert set(store.rows) == {"015009", "015010", "015011"}
+    mask = store.unchanged(
+        ["015009", "015010", "015011", "", "015012"], ["aa", "xx", "cc", "dd", "ee"]
+    )
+    assert mask.tolist() == [True, False, False, False, False]
+    assert store.prior("015009")["match"] == {"id": 1}
+    assert not FingerprintStore.load(tmp_path / "fp.json", ["addr", "zip"]).rows
+
+
+def test_store_table2_digest(tmp_path):
+    """Test that a store matched against a different table2 is dropped."""
+    db = pd.DataFrame({"address": ["1 Main St", "2 Oak Ave"], "zip": ["02134", None]})
+    digest = table_digest("db", db, ["address", "zip"])
+    assert digest == table_digest("db", db.copy(), ["address", "zip"])
+    assert digest != table_digest("db", db.iloc[:1], ["address", "zip"])
+    assert digest != table_digest("db", db.assign(address=["1 Main St", "3 Elm"]), ["address"])
+    assert digest != table_digest("db2", db, ["address", "zip"])
+
+    store = FingerprintStore.load(tmp_path / "fp.json", ["addr"], digest)
+    store.record("015009", "aa", 0, "match", {"id": 1})
+    store.save()
+    assert FingerprintStore.load(tmp_path / "fp.json", ["addr"], digest).rows
+    assert FingerprintStore.load(tmp_path / "fp.json", ["addr"]).table2 == digest
+    changed = FingerprintStore.load(tmp_path / "fp.json", ["addr"], "other")
+    assert not changed.rows and changed.table2 == "other"
+
+
+def test_store_resolve_and_prune(tmp_path):
+    """Test that reviewed items resolve queued rows and missing rows are pruned."""
+    store = FingerprintStore(tmp_path / "fp.json", ["addr"])
+    store.record("015009", "aa", 0, "queued")
+    store.record("015010", "bb", 1, "queued")
+    store.record("015011", "cc", 2, "queued")
+    cand = ReviewCandidate(4, 90.0, {"id": 4})
+    store.resolve(
+        [
+            ReviewItem("ambiguous", 0, {}, [cand], status="accepted", choice=0),
+            ReviewItem("line2", 1, {}, [cand], status="rejected"),
+            ReviewItem("line2", 2, {}, [cand]),
+        ]
+    )
+    assert store.rows["015009"] == {"hash": "aa", "pos": 0, "status": "match", "match": {"id": 4}}
+    assert store.rows["015010"]["status"] == "none"
+    assert store.rows["015011"]["status"] == "queued"
+
+    store.prune(["015009"])
+    assert set(store.rows) == {"015009"}
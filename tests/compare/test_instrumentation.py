@@ -0,0 +1,87 @@
+"""Test the match run instrumentation."""
+
+import json
+
+import pandas as pd
+import pytest
+from cms_etl.compare import compare_tools
+from cms_etl.compare.instrumentation import MatchMetrics, bucket_label, metrics, size_bucket, timed
+from pytest_mock import MockerFixture
+from rich.console import Console
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with empty module metrics."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_size_buckets():
+    """Test the power-of-two histogram buckets."""
+    assert [size_bucket(size) for size in [0, 1, 2, 3, 4, 7, 8, 1000]] == [0, 1, 2, 2, 4, 4, 8, 512]
+    assert [bucket_label(bucket) for bucket in [0, 1, 2, 512]] == ["0", "1", "2-3", "512-1023"]
+
+
+def test_match_metrics(tmp_path):
+    """Test that stages, counters and histograms are recorded and written."""
+    recorder = MatchMetrics()
+    with recorder.stage("scoring"):
+        pass
+    recorder.add_time("scoring", 0.5)
+    recorder.count("scorer_calls", 10)
+    recorder.observe("candidate_block", 3)
+    recorder.observe("candidate_block", 2, n=4)
+
+    data = json.loads(recorder.write_json(tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert data["stages"]["scoring"]["calls"] == 2
+    assert data["stages"]["scoring"]["seconds"] >= 0.5
+    assert data["counters"] == {"scorer_calls": 10}
+    assert data["histograms"] == {"candidate_block": {"2-3": 5}}
+
+    console = Console(record=True, width=120)
+    console.print(recorder.summary())
+    assert "scorer_calls" in console.export_text()
+
+
+def test_timed():
+    """Test that decorated functions are counted in the module metrics."""
+
+    @timed("double")
+    def double(value: int) -> int:
+        return value * 2
+
+    assert double(2) == 4
+    assert double(3) == 6
+    assert metrics.stages["double"].calls == 2
+
+
+def test_timed_nested(mocker: MockerFixture):
+    """Test that a timed call records its self time, without that of nested timed calls."""
+    mocker.patch("cms_etl.compare.instrumentation.perf_counter", side_effect=[0.0, 1.0, 3.0, 6.0])
+
+    @timed("inner")
+    def inner():
+        pass
+
+    @timed("outer")
+    def outer():
+        inner()
+
+    outer()
+    assert metrics.stages["inner"].seconds == 2.0
+    assert metrics.stages["outer"].seconds == 4.0
+    assert metrics.stages["outer"].calls == 1
+
+
+def test_compare_tools_are_instrumented():
+    """Test that the row path records its filters, candidate blocks and scorer calls."""
+    df = pd.DataFrame({"address": ["123 Main St", "123 Main Street", "45 Oak Ave"]})
+    filtered = compare_tools.filter_by_lead_digits(df, "address", "123 Main St")
+    assert filtered is not None
+    compare_tools.fuzz_col_w_process(filtered, pd.Series(), "address", "45 Oak Ave", "ratio")
+    assert metrics.stages["filter_by_lead_digits"].calls == 1
+    assert metrics.stages["process.extract"].calls == 1
+    assert metrics.counters["scorer_calls"] == 2
+    assert metrics.histograms["candidate_block"] == {2: 1}
@@ -0,0 +1,291 @@
+"""Tests for the match_engine module."""
+
+import pandas as pd
+import pytest
+from cms_etl.compare import compare_tools, match_engine
+from cms_etl.compare.blocking import BlockIndex, SortedNeighborhood, neighborhood_keys
+from cms_etl.compare.match_engine import (
+    BlockMatcher,
+    build_block_tasks,
+    build_exact_keys,
+    classify_scores,
+    exact_hits,
+    match_blocks,
+    shard_tasks,
+    tier_counts,
+)
+from cms_etl.compare.match_keys import compute_match_keys
+from cms_etl.compare.ngram_index import NGramIndex
+from cms_etl.compare.scoring import FieldSpec
+from pytest_mock import MockerFixture
+
+CMS_DF = pd.DataFrame(
+    {
+        "address": [
+            "123 Main Street",
+            "456 Elm St",
+            "789 Oak Avenue",
+            "12 Pine Rd",
+            "Main Street",
+            "55 Birch Lane",
+            "99 Nowhere Blvd",
+        ],
+        "zip_code": ["12345", "12345", "54321", "54321", "12345", "11111", "12345"],
+    }
+)
+
+DB_DF = pd.DataFrame(
+    {
+        "address": [
+            "123 Main Street",
+            "456 Elm St",
+            "456 Elm St Rear",
+            "789 Oak Ave",
+            "0012 Pine Rd",
+            "Main Street",
+            "55 Birch Lane",
+            "99 Somewhere Else",
+        ],
+        "zip_code": ["12345", "12345", "12345", "54321", "54321", "12345 ", "22222", "12345"],
+    }
+)
+
+
+def test_classify_scores():
+    """Test the classify_scores function."""
+    assert classify_scores([]) == "none"
+    assert classify_scores([90.0]) == "match"
+    assert classify_scores([90.0, 85.0]) == "match"
+    assert classify_scores([90.0, 88.0]) == "ambiguous"
+    assert classify_scores([90.0, 86.0]) == "none"
+    assert classify_scores([85.0]) == "none"
+
+
+def test_match_blocks_unblocked():
+    """Test matching without blocking."""
+    decisions = match_blocks(CMS_DF, DB_DF, "address", "address", exact_first=False)
+    assert len(decisions) == len(CMS_DF)
+    assert decisions[2].status == "match"
+    assert decisions[2].best == 3
+    assert decisions[4].status == "ambiguous"  # "Main Street" is a token subset of both
+    assert [pos for pos, _ in decisions[4].candidates] == [0, 5]
+    assert decisions[6].status == "none"
+
+
+def test_match_blocks_blocked():
+    """Test that blocking restricts the candidates."""
+    decisions = match_blocks(
+        CMS_DF, DB_DF, "address", "address", block_cols=("zip_code", "zip_code"), lead_filter=True
+    )
+    assert decisions[3].best == 4  # leading zeros don't matter
+    assert decisions[4].best == 5  # leading words are blocked too
+    assert decisions[5].status == "none"  # different zip
+    assert decisions[6].status == "none"  # below the cutoff
+
+
+def test_exact_hits():
+    """Test that only unique, non-empty exact keys are joined."""
+    src_keys = pd.Series(["a", "b", "c", ""])
+    cand_keys = pd.Series(["c", "b", "b", "", "a"])
+    assert exact_hits(src_keys, cand_keys).tolist() == [4, -1, 0, -1]
+
+
+def test_build_exact_keys():
+    """Test that exact keys combine the zip with the processed address."""
+    keys = build_exact_keys(CMS_DF, compute_match_keys(CMS_DF["address"]), "zip_code")
+    assert keys[0] == "12345|123 main st"
+    df = pd.DataFrame({"address": ["1 Main", None], "zip_code": [None, "12345"]})
+    assert build_exact_keys(df, compute_match_keys(df["address"]), "zip_code").tolist() == ["", ""]
+
+
+def test_match_blocks_canonical_zips():
+    """Test that zips read as numbers, or carrying a ZIP+4, still block together."""
+    df1 = pd.DataFrame({"address": ["12 Pine Rd", "40 Elm St"], "zip_code": [2134, 2134.0]})
+    df2 = pd.DataFrame(
+        {"address": ["12 Pine Rd", "40 Elm Street"], "zip_code": ["02134-1234", "021349999"]}
+    )
+    blocked = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    decisions = match_blocks(df1, df2, "address", "address", **blocked)
+    assert [decision.best for decision in decisions] == [0, 1]
+    assert [decision.tier for decision in decisions] == ["exact", "exact"]
+
+    # A wrong last two digits only shares the zip3 block
+    df1["zip_code"] = [2199, 2199]
+    assert match_blocks(df1, df2, "address", "address", **blocked)[0].status == "none"
+    coarse = match_blocks(df1, df2, "address", "address", **blocked, zip_level="zip3")
+    assert [decision.best for decision in coarse] == [0, 1]
+    with pytest.raises(ValueError):
+        match_blocks(df1, df2, "address", "address", **blocked, zip_level="zip4")
+
+
+def test_match_blocks_exact_first():
+    """Test that unique exact hits are resolved before fuzzy scoring."""
+    decisions = match_blocks(
+        CMS_DF, DB_DF, "address", "address", block_cols=("zip_code", "zip_code"), lead_filter=True
+    )
+    tiers = [decision.tier for decision in decisions]
+    assert tiers == ["exact", "exact", "exact", "fuzzy", "exact", "fuzzy", "fuzzy"]
+    assert decisions[1].best == 1  # "456 Elm St Rear" would have made it ambiguous
+    assert decisions[4].best == 5  # zips are stripped
+    assert decisions[2].best == 3  # "Avenue" and "Ave" standardize alike
+    assert tier_counts(decisions) == {"exact": 4, "fuzzy": 1, "ambiguous": 0, "none": 2}
+
+
+def test_match_blocks_ngram_fallback():
+    """Test that rows whose zip finds nothing are scored against their n-gram short list."""
+    index = NGramIndex.build(compute_match_keys(DB_DF["address"])["processed"].tolist())
+    blocked = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    decisions = match_blocks(CMS_DF, DB_DF, "address", "address", **blocked, ngram_index=index)
+    assert decisions[5].best == 6  # zip 11111 has no DB rows
+    assert decisions[6].status == "none"  # its zip has rows, so it isn't rescued
+
+    unblocked = match_blocks(
+        CMS_DF, DB_DF, "address", "address", exact_first=False, ngram_index=index, top_n=1
+    )
+    assert [len(decision.candidates) for decision in unblocked] == [1, 1, 1, 1, 1, 1, 0]
+
+
+def test_match_blocks_neighborhood_fallback():
+    """Test that rows whose zip finds nothing are scored against their sorted neighborhood."""
+    neighborhood = SortedNeighborhood(neighborhood_keys(compute_match_keys(DB_DF["address"])), 2)
+    blocked = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    decisions = match_blocks(
+        CMS_DF, DB_DF, "address", "address", **blocked, neighborhood=neighborhood
+    )
+    assert decisions[5].best == 6  # zip 11111 has no DB rows, but the street sorts alike
+    assert decisions[6].status == "none"
+
+    # Rows that sort into the same window share a task
+    df1 = pd.DataFrame({"address": ["55 Birch Lane", "57 Birch Lane", "1 Zed St"]})
+    tasks = build_block_tasks(df1, DB_DF, "address", "address", neighborhood=neighborhood)
+    assert [task.src_positions.tolist() for task in tasks] == [[0, 1], [2]]
+    assert all(len(task.cand_positions) == 2 for task in tasks)
+
+    both = match_blocks(
+        CMS_DF,
+        DB_DF,
+        "address",
+        "address",
+        **blocked,
+        ngram_index=NGramIndex.build(compute_match_keys(DB_DF["address"])["processed"].tolist()),
+        neighborhood=neighborhood,
+    )
+    assert both[5].best == 6
+
+
+@pytest.mark.parametrize("fuzz_type", ["token_set", "ratio", "w_ratio"])
+def test_match_blocks_agrees_with_row_path(mocker: MockerFixture, fuzz_type: str):
+    """Test that the engine makes the same decisions as the row-by-row path."""
+    mock_console = mocker.patch("cms_etl.compare.compare_tools.console")
+    mock_console.input.return_value = ""
+    decisions = match_blocks(
+        CMS_DF,
+        DB_DF,
+        "address",
+        "address",
+        block_cols=("zip_code", "zip_code"),
+        lead_filter=True,
+        fuzz_type=fuzz_type,
+        exact_first=False,
+    )
+
+    zip_index = BlockIndex(DB_DF, "zip_code")
+    for pos, row in CMS_DF.iterrows():
+        mock_console.input.reset_mock()
+        decision = decisions[pos]
+        filtered = zip_index.get_block(row["zip_code"])
+        if filtered is not None:
+            filtered = compare_tools.filter_by_lead_digits(filtered, "address", row["address"])
+        if filtered is None or filtered.empty:
+            assert decision.status == "none"
+            continue
+        match = compare_tools.fuzz_col_w_process(
+            filtered, row, "address", row["address"], fuzz_type
+        )
+        if decision.status == "match":
+            assert match == DB_DF.iloc[decision.best].to_dict()
+        elif decision.status == "ambiguous":
+            mock_console.input.assert_called_once()
+        else:
+            assert match is None
+            mock_console.input.assert_not_called()
+
+
+def test_shard_tasks():
+    """Test that shards are balanced and deterministic."""
+    tasks = build_block_tasks(CMS_DF, DB_DF, "address", "address", chunk_size=2)
+    assert len(tasks) == 4
+    shards = shard_tasks(tasks, 2)
+    assert len(shards) == 2
+    assert [len(shard) for shard in shards] == [2, 2]
+    assert shards == shard_tasks(tasks, 2)
+
+
+def test_match_blocks_parallel():
+    """Test that the process pool merges into the same decisions as the serial path."""
+    df1 = pd.concat([CMS_DF] * 20, ignore_index=True)
+    kwargs = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    serial = match_blocks(df1, DB_DF, "address", "address", **kwargs)
+    parallel = match_blocks(
+        df1, DB_DF, "address", "address", workers=2, min_parallel_rows=0, **kwargs
+    )
+    assert parallel == serial
+
+
+def test_block_matcher_chunks(mocker: MockerFixture):
+    """Test that chunks of df1 share one index and one process pool, and match like one call."""
+    df1 = pd.concat([CMS_DF] * 20, ignore_index=True)
+    kwargs = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    expected = match_blocks(df1, DB_DF, "address", "address", **kwargs)
+    pool = mocker.spy(match_engine.futures, "ProcessPoolExecutor")
+    with BlockMatcher("address", "address", workers=2, min_parallel_rows=0, **kwargs) as matcher:
+        with pytest.raises(ValueError, match="index"):
+            matcher.match(df1)
+        matcher.index(DB_DF)
+        decisions = [
+            decision
+            for start in range(0, len(df1), 50)
+            for decision in matcher.match(df1.iloc[start : start + 50])
+        ]
+    assert pool.call_count == 1
+    assert [(d.status, d.best, d.tier) for d in decisions] == [
+        (d.status, d.best, d.tier) for d in expected
+    ]
+
+
+def test_block_matcher_total_rows(mocker: MockerFixture):
+    """Test that the pool is chosen from the rows of the whole run, not those of each chunk."""
+    df1 = pd.concat([CMS_DF] * 20, ignore_index=True)
+    kwargs = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True, "workers": 2}
+    pool = mocker.spy(match_engine.futures, "ProcessPoolExecutor")
+    with BlockMatcher("address", "address", min_parallel_rows=100, **kwargs) as matcher:
+        matcher.index(DB_DF)
+        matcher.match(df1.iloc[:50])
+    assert pool.call_count == 0
+    with BlockMatcher(
+        "address", "address", min_parallel_rows=100, total_rows=len(df1), **kwargs
+    ) as matcher:
+        matcher.index(DB_DF)
+        matcher.match(df1.iloc[:50])
+    assert pool.call_count == 1
+
+
+def test_match_blocks_fields():
+    """Test that further fields weigh into the decision and gate exact hits."""
+    cms = CMS_DF.assign(line2=["", "", "", "", "", "", ""])
+    db = DB_DF.assign(line2=["Ste 9", "", "Rear", "", "", "", "", ""])
+    fields = [
+        FieldSpec("address", "address", weight=3.0),
+        FieldSpec("line2", "line2", missing="mismatch", min_score=86),
+    ]
+    blocked = {"block_cols": ("zip_code", "zip_code"), "lead_filter": True}
+    decisions = match_blocks(cms, db, "address", "address", **blocked, fields=fields)
+    # The exact address hit disagrees on line 2, so it's scored and held back
+    assert decisions[0].status == "none"
+    assert decisions[0].candidates == [(0, 80.0)]
+    assert decisions[0].fields == [(100.0, 0.0)]
+    assert decisions[1].best == 1
+    assert decisions[1].fields == [(100.0, 100.0)]
+
+    with pytest.raises(ValueError):
+        match_blocks(cms, db, "line2", "line2", fields=fields)
@@ -0,0 +1,85 @@
+"""Tests for the match_keys module."""
+
+import pandas as pd
+from cms_etl.compare import compare_tools
+from cms_etl.compare.match_keys import compute_match_keys, process_strings, process_value
+from rapidfuzz.utils import default_process
+
+ADDRESSES = pd.Series(
+    [" 0012 Pine Rd", "Main Street", "#5 Elm", None, 42, "99999999999999999999 Long St"],
+    index=[10, 11, 12, 13, 14, 15],
+    name="Provider Address",
+)
+
+
+def test_compute_match_keys():
+    """Test the compute_match_keys function."""
+    keys = compute_match_keys(ADDRESSES)
+    assert keys.index.tolist() == ADDRESSES.index.tolist()
+    assert keys["standardized"].tolist()[:3] == ["0012 PINE RD", "MAIN ST", "#5 ELM"]
+    assert keys["processed"].tolist() == [
+        "0012 pine rd",
+        "main st",
+        "5 elm",
+        "",
+        "42",
+        "99999999999999999999 long st",
+    ]
+    assert keys["house_num"].tolist() == [12, pd.NA, pd.NA, pd.NA, 42, pd.NA]
+    assert keys["lead_alpha"].tolist() == [pd.NA, "MAIN", pd.NA, pd.NA, pd.NA, pd.NA]
+
+
+def test_compute_match_keys_non_address():
+    """Test that only address columns get USPS abbreviations."""
+    names = pd.Series([" North Street Manor ", "St. Mary Court", None], name="Provider Name")
+    keys = compute_match_keys(names)
+    assert keys["standardized"].tolist() == ["North Street Manor", "St. Mary Court", pd.NA]
+    assert keys["processed"].tolist() == ["north street manor", "st  mary court", ""]
+    standardized = compute_match_keys(names, address=True)["standardized"]
+    assert standardized.tolist()[:2] == ["N ST MANOR", "ST MARY CT"]
+
+
+def test_process_value():
+    """Test that a single value gets the processed key its column would give it."""
+    for name, value in [("Provider Address", " 12 Pine Road "), ("Provider Name", "St. Mary")]:
+        keys = compute_match_keys(pd.Series([value], name=name))
+        address = name == "Provider Address"
+        assert process_value(value, address=address) == keys["processed"].iat[0]
+    assert process_value(None, address=True) == ""
+
+
+def test_process_strings():
+    """Test that strings are processed as `default_process` processes them."""
+    values = ["  St. Mary's_Home ", "ÉCOLE—Nord", "#5\tElm", "", "A-1"]
+    expected = [default_process(value) for value in values]
+    assert process_strings(pd.Series(values + [None])).tolist() == expected + [""]
+
+
+def test_filters_read_cached_keys():
+    """Test that the compare tools give the same rows with and without cached keys."""
+    df = pd.DataFrame({"address": ["12 Pine Rd", "12 Oak Ave", "Main Street", "13 Pine Rd"]})
+    keys = compute_match_keys(df["address"])
+    for compare_str in ["12 Pine Road", "Main St"]:
+        assert compare_tools.filter_by_lead_digits(df, "address", compare_str).equals(
+            compare_tools.filter_by_lead_digits(df, "address", compare_str, keys)
+        )
+    block = df.iloc[[0, 1, 3]]
+    filtered = compare_tools.filter_by_lead_digits(block, "address", "12 Pine Road", keys)
+    assert filtered.index.tolist() == [0, 1]
+    match = compare_tools.fuzz_col_w_process(
+        filtered, pd.Series(), "address", "12 Pine Road", "token_set", keys
+    )
+    assert match == {"address": "12 Pine Rd"}
+
+
+def test_filters_read_cached_keys_non_address():
+    """Test that queries on a non-address column are keyed like its cached keys."""
+    df = pd.DataFrame({"name": ["North Street Manor", "Main Care Home", "Oak Lodge"]})
+    keys = compute_match_keys(df["name"])
+    assert compare_tools.filter_df_by_lead_alpha(df, "name", "Main Care Home").equals(
+        compare_tools.filter_df_by_lead_alpha(df, "name", "Main Care Home", keys)
+    )
+    match = compare_tools.fuzz_col_w_process(
+        df, pd.Series(), "name", "North Street Manor", "ratio", keys
+    )
+    assert match == {"name": "North Street Manor"}
@@ -0,0 +1,92 @@
+"""Tests for the match_output module."""
+
+import json
+
+import pytest
+from cms_etl.compare.match_output import MatchStream, format_match, write_matches
+from pytest_mock import MockerFixture
+
+
+def test_write_matches(tmp_path):
+    """Test that streamed records are written like a JSON array."""
+    records = [
+        format_match({"ccn": 1}, {"id": 7}, ("cms", "db"), 14),
+        format_match({"ccn": 2}, {"id": 8}, ("cms", "db"), 14),
+    ]
+    path = write_matches(iter(records), 14, tmp_path)
+    assert path.name.startswith("matches_14_")
+    expected = [
+        {"cms": {"ccn": 1, "category_id": 14, "profile_id": 7}, "db": {"id": 7}},
+        {"cms": {"ccn": 2, "category_id": 14, "profile_id": 8}, "db": {"id": 8}},
+    ]
+    assert path.read_text(encoding="utf-8") == json.dumps(expected, indent=2)
+    (tmp_path / "empty").mkdir()
+    assert write_matches([], 14, tmp_path / "empty").read_text(encoding="utf-8") == "[]"
+
+
+def test_write_matches_same_second(tmp_path, mocker: MockerFixture):
+    """Test that writes within the same second go to separate files."""
+    mocker.patch("cms_etl.compare.match_output.time", return_value=1700000000.5)
+    first = write_matches([format_match({"ccn": 1}, {"id": 7}, ("cms", "db"), 14)], 14, tmp_path)
+    second = write_matches([], 14, tmp_path)
+    assert first.name == "matches_14_1700000000.json"
+    assert second.name == "matches_14_1700000000_1.json"
+    assert json.loads(first.read_text(encoding="utf-8"))[0]["db"] == {"id": 7}
+    assert second.read_text(encoding="utf-8") == "[]"
+
+
+class TestMatchStream:
+    """Tests for the MatchStream class."""
+
+    def test_write_and_read(self, tmp_path):
+        """Test streaming decisions and reading the matches back."""
+        stream = MatchStream(tmp_path / "matches_14.jsonl")
+        with stream.open():
+            stream.write(0, "match", {"ccn": 1}, {"id": 7})
+            stream.write(1, "none")
+            stream.write(2, "queued")
+            stream.checkpoint(2)
+        assert stream.incomplete
+        assert stream.decided_positions() == {0, 1, 2}
+        assert list(stream.matches()) == [(0, {"ccn": 1}, {"id": 7})]
+        assert stream.load_checkpoint() == {"last_pos": 2, "complete": False, "digest": ""}
+
+    def test_resume(self, tmp_path):
+        """Test that resuming appends after the checkpoint and drops a line cut off by a crash."""
+        stream = MatchStream(tmp_path / "matches_14.jsonl", "abc")
+        with stream.open():
+            stream.write(0, "none")
+            stream.checkpoint(0)
+            stream.write(1, "queued")  # its review item was never saved
+        with open(stream.path, "a", encoding="utf-8") as f:
+            f.write('{"src_pos": 2, "sta')
+        assert stream.decided_positions() == {0, 1}
+
+        assert stream.rollback() == {0}
+        with stream.open(resume=True):
+            stream.write(1, "match", {"ccn": 2}, {"id": 8})
+            stream.checkpoint(1, complete=True)
+        assert not stream.incomplete
+        assert stream.decided_positions() == {0, 1}
+        assert list(stream.matches()) == [(1, {"ccn": 2}, {"id": 8})]
+
+        with stream.open():
+            pass
+        assert stream.decided_positions() == set()
+        assert stream.load_checkpoint() is None
+
+    def test_rollback_without_checkpoint(self, tmp_path):
+        """Test that decisions written before the first checkpoint are all dropped."""
+        stream = MatchStream(tmp_path / "matches_14.jsonl")
+        with stream.open():
+            stream.write(0, "none")
+        assert stream.rollback() == set()
+        assert stream.decided_positions() == set()
+
+    def test_rollback_other_comparison(self, tmp_path):
+        """Test that a stream checkpointed by another comparison is not resumed."""
+        with MatchStream(tmp_path / "matches_14.jsonl", "abc").open() as stream:
+            stream.write(0, "none")
+            stream.checkpoint(0)
+        with pytest.raises(ValueError, match="another comparison"):
+            MatchStream(tmp_path / "matches_14.jsonl", "def").rollback()
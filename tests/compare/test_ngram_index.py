@@ -0,0 +1,57 @@
+"""Test the n-gram inverted index."""
+
+import pandas as pd
+from cms_etl.compare.compare_tools import filter_by_ngrams
+from cms_etl.compare.ngram_index import NGramIndex, ngrams
+
+VALUES = ["123 main street", "456 elm st", "789 oak avenue", "", "12 main st"]
+
+
+def test_ngrams():
+    """Test that n-grams are padded and distinct."""
+    assert ngrams("abab") == {" ab", "aba", "bab", "ab "}
+    assert ngrams("a") == {" a "}
+    assert ngrams("") == set()
+
+
+def test_top_n():
+    """Test that candidates are ranked by shared n-grams, ties by position."""
+    index = NGramIndex.build(VALUES)
+    assert index.top_n("main street", 2).tolist() == [0, 4]
+    assert index.top_n("oak ave", 1).tolist() == [2]
+    assert index.top_n("zzz").size == 0
+    assert index.top_n("").size == 0
+
+
+def test_save_and_load(tmp_path):
+    """Test that a saved index answers queries the same way."""
+    index = NGramIndex.build(VALUES)
+    index.save(tmp_path / "index.npz")
+    loaded = NGramIndex.load(tmp_path / "index.npz")
+    assert len(loaded) == len(index)
+    assert loaded.digest == index.digest
+    assert loaded.top_n("main street").tolist() == index.top_n("main street").tolist()
+
+
+def test_load_or_build(tmp_path, mocker):
+    """Test that a saved index is reused only for the values it was built over."""
+    path = tmp_path / "index.npz"
+    NGramIndex.load_or_build(path, VALUES)
+    build = mocker.spy(NGramIndex, "build")
+    NGramIndex.load_or_build(path, VALUES)
+    build.assert_not_called()
+    index = NGramIndex.load_or_build(path, VALUES[:2])
+    build.assert_called_once()
+    assert index.size == 2
+    assert NGramIndex.load(path).size == 2
+
+
+def test_filter_by_ngrams():
+    """Test that the short list of rows comes back in rank order."""
+    df = pd.DataFrame({"address": ["123 Main Street", "456 Elm St", "12 Main St"]})
+    index = NGramIndex.build(["123 main street", "456 elm st", "12 main st"])
+    assert filter_by_ngrams(df, index, "12 MAIN ST.", 2)["address"].tolist() == [
+        "12 Main St",
+        "123 Main Street",
+    ]
+    assert filter_by_ngrams(df, index, "") is None
@@ -0,0 +1,95 @@
+"""Tests for the review_queue module."""
+
+from cms_etl.compare.decision_cache import DecisionCache
+from cms_etl.compare.review_queue import ReviewCandidate, ReviewItem, ReviewQueue
+from pytest_mock import MockerFixture
+
+
+def make_queue(tmp_path) -> ReviewQueue:
+    """Return a queue with an ambiguous item and a line 2 item."""
+    queue = ReviewQueue(
+        tmp_path / "review.json",
+        metadata={"source_types": ["cms", "db"], "category_id": 14, "columns": ["addr", "addr"]},
+    )
+    queue.add(
+        ReviewItem(
+            "line2",
+            5,
+            {"addr": "1 Main St"},
+            [ReviewCandidate(0, 100.0, {"id": 1, "addr": "1 Main St"})],
+            detail="Line 2 validation failed",
+        )
+    )
+    queue.add(
+        ReviewItem(
+            "ambiguous",
+            2,
+            {"addr": "2 Oak Ave"},
+            [
+                ReviewCandidate(3, 100.0, {"id": 4, "addr": "2 Oak Ave"}),
+                ReviewCandidate(4, 95.0, {"id": 5, "addr": "2 Oak Ave Rear"}),
+            ],
+        )
+    )
+    return queue
+
+
+def test_save_and_load(tmp_path):
+    """Test that a queue survives a round trip through its file."""
+    queue = make_queue(tmp_path)
+    queue.save()
+    loaded = ReviewQueue.load(tmp_path / "review.json")
+    assert loaded == queue
+    assert not (tmp_path / "review.json.tmp").exists()
+
+
+def test_review(tmp_path, mocker: MockerFixture):
+    """Test reviewing the pending items."""
+    mocker.patch("cms_etl.utils.console.clear")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.print")
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["y", "2"])
+    queue = make_queue(tmp_path)
+    assert queue.review() == 2
+    assert mock_input.call_count == 2
+    assert not queue.pending
+    assert queue.accepted() == [
+        (2, {"addr": "2 Oak Ave"}, {"id": 5, "addr": "2 Oak Ave Rear"}),
+        (5, {"addr": "1 Main St"}, {"id": 1, "addr": "1 Main St"}),
+    ]
+    # decisions are saved as they are made
+    assert not ReviewQueue.load(tmp_path / "review.json").pending
+
+
+def test_review_rejects(tmp_path, mocker: MockerFixture):
+    """Test that empty answers reject the items."""
+    mocker.patch("cms_etl.utils.console.clear")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.print")
+    mocker.patch("cms_etl.utils.console.input", side_effect=["n", ""])
+    queue = make_queue(tmp_path)
+    queue.review()
+    assert [item.status for item in queue.items] == ["rejected", "rejected"]
+    assert not queue.accepted()
+
+
+def test_review_decision_cache(tmp_path, mocker: MockerFixture):
+    """Test that decisions are cached and settle the same items of a later queue."""
+    mocker.patch("cms_etl.utils.console.clear")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.print")
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["n", "2"])
+    with DecisionCache(tmp_path / "decisions.sqlite") as cache:
+        for _ in range(2):
+            queue = make_queue(tmp_path)
+            queue.metadata["scorer"] = "token_set"
+            queue.items[0].src_key = "1 main st"
+            queue.items[1].src_key = "2 oak ave"
+            for item in queue.items:
+                for cand in item.candidates:
+                    cand.key = cand.row["addr"].lower()
+            assert queue.review(cache) == 2
+            assert [item.status for item in queue.items] == ["rejected", "accepted"]
+            assert queue.items[1].choice == 1
+        assert mock_input.call_count == 2
+        assert len(cache) == 3
@@ -0,0 +1,47 @@
+"""Tests for the scoring module."""
+
+import numpy as np
+import pytest
+from cms_etl.compare.scoring import FieldSpec, combined_pair_scores, combined_scores
+
+SPECS = [
+    FieldSpec("address", "address", "ratio", weight=3.0),
+    FieldSpec("line2", "line2", "ratio", missing="mismatch", min_score=86),
+    FieldSpec("phone", "phone", "ratio"),
+]
+SRC = [["12 pine rd", "40 elm"], ["", "ste 4"], ["5551234", ""]]
+CAND = [["12 pine rd", "12 pine rd", "40 elm"], ["", "rear", "ste 4"], ["5551234", "", "5550000"]]
+
+
+def test_combined_scores():
+    """Test the weighted mean, the missing value policies and the min_score cap."""
+    combined, fields = combined_scores(SRC, CAND, SPECS, score_cutoff=80)
+    assert combined.shape == (2, 3)
+    assert fields.shape == (3, 2, 3)
+    # Line 2 is missing on both sides (left out), the phones agree
+    assert combined[0, 0] == pytest.approx(100.0)
+    # Line 2 on one side only scores 0 and fails its min_score; the missing phone is left out.
+    # The weighted mean is 75, held at the cutoff as line 1 agrees.
+    assert fields[1, 0, 1] == 0.0
+    assert combined[0, 1] == 80.0
+    assert combined[1, 0] < 80.0
+    # Every field agrees except the phone, missing on the source side
+    assert combined[1, 2] == pytest.approx(100.0)
+    assert fields[2, 1, 2] == 0.0
+
+
+def test_min_score_caps_at_cutoff():
+    """Test that failing a min_score caps an otherwise confident score at the cutoff."""
+    specs = [FieldSpec("a", "a", "ratio", weight=9.0), FieldSpec("b", "b", "ratio", min_score=86)]
+    src, cand = [["main st"], ["ste 4"]], [["main st"], ["ste 5"]]
+    combined, _ = combined_scores(src, cand, specs, score_cutoff=80)
+    assert combined[0, 0] == 80.0
+
+
+def test_combined_pair_scores():
+    """Test that pair scores equal the matching cells of the full matrix."""
+    combined, fields = combined_scores(SRC, CAND, SPECS, score_cutoff=80)
+    pairs = [[values[0], values[2]] for values in CAND]
+    pair_combined, pair_fields = combined_pair_scores(SRC, pairs, SPECS, score_cutoff=80)
+    np.testing.assert_allclose(pair_combined, [combined[0, 0], combined[1, 2]])
+    np.testing.assert_allclose(pair_fields, fields[:, [0, 1], [0, 2]])
@@ -0,0 +1,39 @@
+"""Test the synthetic table generator."""
+
+import numpy as np
+from cms_etl.compare.synthetic import CMS_COLUMNS, generate_tables, typo
+
+
+def test_generate_tables_is_seeded():
+    """Test that the same seed gives the same tables and another seed doesn't."""
+    tables = generate_tables(200, seed=7)
+    again = generate_tables(200, seed=7)
+    assert tables.cms.equals(again.cms)
+    assert tables.db.equals(again.db)
+    assert tables.truth == again.truth
+    assert not tables.cms.equals(generate_tables(200, seed=8).cms)
+
+
+def test_generate_tables_truth():
+    """Test that the ground truth points at DB rows of the same provider."""
+    tables = generate_tables(500, seed=1)
+    assert list(tables.cms.columns) == CMS_COLUMNS
+    assert tables.cms["CMS Certification Number (CCN)"].is_unique
+    assert 0.7 < len(tables.truth) / len(tables.cms) < 0.9
+    assert len(tables.db) > len(tables.truth)  # distractors
+    db = tables.db.set_index("id")
+    cms = tables.cms.set_index("CMS Certification Number (CCN)")
+    for ccn, row_id in tables.truth.items():
+        cms_num = cms.loc[ccn, "Provider Address"].split()[0]
+        assert db.loc[row_id, "address"].split()[0] == cms_num
+        db_zip = db.loc[row_id, "zip_code"].split("-")[0]
+        assert db_zip.zfill(5) == cms.loc[ccn, "ZIP Code"]
+    assert tables.cms["ZIP Code"].duplicated().any()
+
+
+def test_typo():
+    """Test that a typo changes the text by one edit."""
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        text = typo("Main Street", rng)
+        assert abs(len(text) - len("Main Street")) <= 1
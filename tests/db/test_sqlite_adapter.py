@@ -6,6 +6,7 @@ import pandas as pd
 import pytest
 from cms_etl.db.adapters import SQLiteAdapter
 from cms_etl.db.adapters.config import SQLiteConfig
+from sqlalchemy import text
 
 
 def test_sqlite_fixture(sqlite_test_db):
@@ -99,6 +100,24 @@ def test_execute_query(sqlite_test_db):
     assert df.values.tolist() == [[1, 4], [2, 5], [3, 6]]
 
 
+def test_select_in(sqlite_test_db):
+    """Test selecting the rows whose column holds one of several values."""
+    df = sqlite_test_db.select_in("simple_table", "a", [1, 3, 7])
+    assert df.values.tolist() == [[1, 4], [3, 6]]
+    df = sqlite_test_db.select_in("simple_table", "a", ["2"], columns=["b"])
+    assert df.values.tolist() == [[5]]
+
+
+def test_columns_and_indexes(sqlite_test_db):
+    """Test listing the columns of a table and whether a column is indexed."""
+    assert sqlite_test_db.list_columns("simple_table") == ["a", "b"]
+    assert not sqlite_test_db.is_indexed("simple_table", "b")
+    with sqlite_test_db.engine.begin() as c:
+        c.execute(text("CREATE INDEX ix_b ON simple_table (b, a)"))
+    assert sqlite_test_db.is_indexed("simple_table", "b")
+    assert not sqlite_test_db.is_indexed("simple_table", "a")
+
+
 def test_test_connection(sqlite_test_db):
     """Test the test_connection method."""
     assert sqlite_test_db.test_connection() is True
@@ -0,0 +1,416 @@
+"""Test Compare Tables Menu."""
+
+import json
+import time
+
+import pandas as pd
+import pytest
+from cms_etl.compare.candidate_export import read_candidates
+from cms_etl.compare.compare_tools import fuzz_col_w_process
+from cms_etl.compare.instrumentation import metrics
+from cms_etl.compare.match_output import MatchStream
+from cms_etl.compare.review_queue import ReviewQueue
+from cms_etl.menu.menus.compare import compare_tables
+from cms_etl.menu.menus.compare.compare_tables import CompareTablesMenu
+from cms_etl.table.table import Table
+from cms_etl.utils import console
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def compare_menu(mocker: MockerFixture, tmp_path, monkeypatch):
+    """Return a CompareTablesMenu with a CMS table and a DB table selected."""
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("cms_etl.utils.console.print")
+    mocker.patch("cms_etl.utils.console.rule")
+    mocker.patch("cms_etl.utils.console.clear")
+    cms_df = pd.DataFrame(
+        {
+            "CMS Certification Number (CCN)": ["015009", "015010", "015011"],
+            "Provider Name": ["Sunny Acres", "Oak Manor", "Pine Rest"],
+            "Provider Address": ["123 Main Street", "789 Oak Ave", "12 Pine Rd"],
+            "Address Line 2": ["", "Suite 4", ""],
+            "ZIP Code": ["12345", "54321", "54321"],
+        }
+    )
+    db_df = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4, 5],
+            "address": ["123 Main Street", "789 Oak Avenue", "12 Pine Rd", "12 Pine Rd", "40 Elm"],
+            "address2": ["", "Suite 4", "", "", ""],
+            "zip_code": ["12345", "54321", "54321", "54321", "54321"],
+        }
+    )
+    table1 = Table(cms_df, "cms", source_type="cms", s1_category_id=14)
+    table2 = Table(db_df, "db", source_type="db")
+    menu = CompareTablesMenu(
+        mocker.MagicMock(), "Compare Tables", table1=table1, table2=table2, workers=1
+    )
+
+    def select_columns():
+        menu._col_name_t1 = "Provider Address"  # pylint: disable=protected-access
+        menu._col_name_t2 = "address"  # pylint: disable=protected-access
+
+    menu.select_columns = select_columns
+    return menu
+
+
+def test_fuzz_col_vs_col(compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture):
+    """Test that confident matches are written without prompting and ambiguous rows are queued."""
+    mock_input = mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    mock_input.assert_called_once_with("Review them now? (y/n): ")
+    console.print.assert_any_call(  # type: ignore[attr-defined]
+        "Resolved 2 row(s) by exact match and 0 by fuzzy match; 1 ambiguous, 0 without a match."
+    )
+
+    [queue_file] = list(tmp_path.glob("review_14_*.json"))
+    queue = ReviewQueue.load(queue_file)
+    assert len(queue.pending) == 1
+    assert queue.pending[0].kind == "ambiguous"
+    assert [cand.row["id"] for cand in queue.pending[0].candidates] == [3, 4]
+
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+    assert matches[0]["cms"]["category_id"] == 14
+    assert matches[1]["db"]["address"] == "789 Oak Avenue"
+
+    metrics = json.loads((tmp_path / "match_metrics_14.json").read_text(encoding="utf-8"))
+    assert {"exact_join", "blocking", "scoring", "write_matches"} <= set(metrics["stages"])
+    assert metrics["counters"]["rows_exact"] == 2
+    assert metrics["counters"]["rows_queued_ambiguous"] == 1
+    assert metrics["counters"]["scorer_calls"] == 4  # 2 candidates, on line 1 and line 2
+
+
+def test_fuzz_col_vs_col_line2_breaks_ties(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that line 2 is part of the combined score, so it settles ties on line 1."""
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[3, "address2"] = "Rear"
+    compare_menu.table2.df = db_df
+    mock_input = mocker.patch("cms_etl.utils.console.input")
+    compare_menu.fuzz_col_vs_col()
+    mock_input.assert_not_called()
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2, 3]
+
+
+def test_fuzz_col_vs_col_line2_failure(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a line 1 match whose line 2 disagrees is queued for review."""
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[1, "address2"] = "Suite 9"
+    compare_menu.table2.df = db_df
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    [queue_file] = list(tmp_path.glob("review_14_*.json"))
+    queue = ReviewQueue.load(queue_file)
+    [line2] = [item for item in queue.pending if item.kind == "line2"]
+    assert line2.src_pos == 1
+    assert [cand.row["id"] for cand in line2.candidates] == [2]
+    assert "'Address Line 2' vs. 'address2'" in line2.detail
+
+
+def test_fuzz_col_vs_col_line2_failure_outranked(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a line 1 match failing line 2 is queued even when a weaker candidate outranks it."""
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[2, "address2"] = "Suite 9"
+    db_df.loc[3, "address"] = "12 Pines Rd"  # line 1 scores 95, line 2 agrees
+    compare_menu.table2.df = db_df
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    [queue_file] = list(tmp_path.glob("review_14_*.json"))
+    [line2] = ReviewQueue.load(queue_file).pending
+    assert (line2.kind, line2.src_pos) == ("line2", 2)
+    assert [cand.row["id"] for cand in line2.candidates] == [3]
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+
+
+def test_fuzz_col_vs_col_exports_candidates(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a run with top_k set exports the top candidates of every row."""
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.top_k = 2
+    compare_menu.fuzz_col_vs_col()
+    frame, metadata = read_candidates(tmp_path / "candidates_14.parquet")
+    assert metadata["columns"] == ["Provider Address", "address"]
+    assert frame.groupby("src_pos")["cand_pos"].apply(list).to_dict() == {
+        0: [0],
+        1: [1],
+        2: [2, 3],
+    }
+    assert {"score", "token_set", "w_ratio"} <= set(frame.columns)
+
+
+def test_write_matches_timing(compare_menu: CompareTablesMenu, mocker: MockerFixture):
+    """Test that displaying the matches is not timed as writing them."""
+    mocker.patch("cms_etl.utils.console.rule", side_effect=lambda: time.sleep(0.2))
+    metrics.reset()
+    compare_menu._write_matches(  # pylint: disable=protected-access
+        iter([(0, {"ccn": "015009"}, {"id": 1})]), ("cms", "db"), 14
+    )
+    assert metrics.stages["write_matches"].seconds < 0.2
+
+
+def test_set_options(compare_menu: CompareTablesMenu):
+    """Test that the worker count is shown in the options."""
+    compare_menu._set_options()  # pylint: disable=protected-access
+    assert [option.name for option in compare_menu.options] == [
+        "Select Tables for Comparison",
+        "Set Worker Count (1)",
+        "Set Candidate Export (top 0)",
+        "Set Sorted-Neighborhood Window (off)",
+        "Fuzzy Match Columns",
+        "Review Queued Matches",
+        "Back",
+    ]
+
+
+def test_fuzz_col_vs_col_review_now(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that reviewing the queue right away writes a single matches file in table1 order."""
+    mocker.patch("cms_etl.utils.console.input", side_effect=["y", "2"])
+    compare_menu.fuzz_col_vs_col()
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2, 4]
+
+
+def test_fuzz_col_vs_col_decision_cache(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a pair accepted in review is matched without scoring or prompting next time."""
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[2:3, "address"] = ["12 Pine Rd N", "12 Pine Rd S"]
+    compare_menu.table2.df = db_df
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["y", "2"])
+    compare_menu.fuzz_col_vs_col()
+    assert len(compare_menu.decision_cache) == 2
+
+    # Without fingerprints to carry the decision forward, the cache still settles the row
+    (tmp_path / "fingerprints_14.json").unlink()
+    spy = mocker.spy(compare_tables.BlockMatcher, "match")
+    init = mocker.spy(compare_tables.BlockMatcher, "__init__")
+    compare_menu.fuzz_col_vs_col()
+    assert mock_input.call_count == 2
+    # The pool is chosen from the rows the run scores, without the cached row
+    assert init.call_args.kwargs["total_rows"] == 2
+    [call] = spy.call_args_list
+    assert call.args[1]["Provider Name"].tolist() == ["Sunny Acres", "Oak Manor"]
+    matches_file = sorted(tmp_path.glob("matches_14_*.json"))[-1]
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2, 4]
+    metrics = json.loads((tmp_path / "match_metrics_14.json").read_text(encoding="utf-8"))
+    assert metrics["counters"]["rows_skipped_cached"] == 1
+
+
+def test_fuzz_col_vs_col_decision_cache_thresholds(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that decisions are not reused by a run with other thresholds."""
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[2:3, "address"] = ["12 Pine Rd N", "12 Pine Rd S"]
+    compare_menu.table2.df = db_df
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["y", "2"] * 2)
+    compare_menu.fuzz_col_vs_col()
+
+    (tmp_path / "fingerprints_14.json").unlink()
+    compare_menu.score_cutoff = 75
+    compare_menu.fuzz_col_vs_col()
+    assert mock_input.call_count == 4
+    assert len(compare_menu.decision_cache) == 4  # recorded again, under the new key
+    metrics = json.loads((tmp_path / "match_metrics_14.json").read_text(encoding="utf-8"))
+    assert metrics["counters"].get("rows_skipped_cached", 0) == 0
+
+
+def test_decision_cache_shared_with_row_path(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that decisions made row by row and in a run are found by each other."""
+    db_df = compare_menu.table2.df.copy()
+    db_df["name"] = ["Sunny Acres", "Oak Manor E", "Oak Manor W", "Pine Rest N", "Pine Rest S"]
+    compare_menu.table2.df = db_df
+
+    def select_columns():
+        compare_menu._col_name_t1 = "Provider Name"  # pylint: disable=protected-access
+        compare_menu._col_name_t2 = "name"  # pylint: disable=protected-access
+
+    compare_menu.select_columns = select_columns
+    mock_input = mocker.patch("cms_etl.utils.console.input", side_effect=["2", "y", "2"])
+    row = compare_menu.table1.df.iloc[1]
+    cache = compare_menu.decision_cache
+    assert fuzz_col_w_process(db_df, row, "name", "Oak Manor", "token_set", cache=cache)["id"] == 3
+
+    # The run settles 'Oak Manor' from the row-by-row answer, and queues 'Pine Rest'
+    compare_menu.fuzz_col_vs_col()
+    assert mock_input.call_count == 3
+    matches_file = sorted(tmp_path.glob("matches_14_*.json"))[-1]
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 3, 5]
+    metrics = json.loads((tmp_path / "match_metrics_14.json").read_text(encoding="utf-8"))
+    assert metrics["counters"]["rows_skipped_cached"] == 1
+
+    # The answer given in review settles 'Pine Rest' row by row
+    row = compare_menu.table1.df.iloc[2]
+    assert fuzz_col_w_process(db_df, row, "name", "Pine Rest", "token_set", cache=cache)["id"] == 5
+    assert mock_input.call_count == 3
+
+
+def test_fuzz_col_vs_col_resume(compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture):
+    """Test that a resumed run skips the checkpointed rows and decides the rest again."""
+    compare_menu.select_columns()
+    digest = compare_menu._run_digest()  # pylint: disable=protected-access
+    stream = MatchStream(tmp_path / f"decisions_14_{digest}.jsonl", digest)
+    with stream.open():
+        stream.write(0, "none")
+        stream.checkpoint(0)
+        stream.write(2, "queued")  # the crash came before its review item was saved
+    mocker.patch("cms_etl.utils.console.input", side_effect=["y", "n"])
+    compare_menu.fuzz_col_vs_col()
+    assert stream.decided_positions() == {0, 1, 2}
+    assert not stream.incomplete
+    [queue_file] = list(tmp_path.glob(f"review_14_{digest}.json"))
+    assert [item.src_pos for item in ReviewQueue.load(queue_file).pending] == [2]
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [2]
+
+
+def test_carry_forward(compare_menu: CompareTablesMenu, mocker: MockerFixture):
+    """Test that rows keep their decision only when they have a CCN and are unchanged."""
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    # pylint: disable=protected-access
+    block_cols, _, fingerprint_cols = compare_menu._match_fields()
+    prints = compare_menu._carry_forward(14, fingerprint_cols, block_cols)
+    assert prints.enabled
+    assert prints.carried.tolist() == [True, True, False]  # the queued row is matched again
+
+    # Changes to a table2 left in its database can't be seen, so nothing is carried forward
+    compare_menu.db_blocks = True
+    prints = compare_menu._carry_forward(14, fingerprint_cols, block_cols)
+    assert not prints.enabled
+    assert not prints.carried.any()
+    compare_menu.db_blocks = False
+
+    assert compare_menu.table1 is not None
+    compare_menu.table1.df = compare_menu.table1.df.drop(columns="CMS Certification Number (CCN)")
+    prints = compare_menu._carry_forward(14, fingerprint_cols, block_cols)
+    assert not prints.enabled
+    assert not prints.carried.any()
+
+
+def test_record_row_cached(compare_menu: CompareTablesMenu, tmp_path):
+    """Test that a row without a decision is matched to its cached candidate and fingerprinted."""
+    # pylint: disable=protected-access
+    compare_menu.select_columns()
+    block_cols, _, fingerprint_cols = compare_menu._match_fields()
+    prints = compare_menu._carry_forward(14, fingerprint_cols, block_cols)
+    stream = MatchStream(tmp_path / "decisions.jsonl")
+    queue = ReviewQueue(tmp_path / "review.json")
+    with stream.open():
+        status = compare_menu._record_row(2, None, 3, prints, stream, queue)
+    assert status == "match"
+    [(src_pos, _, match)] = list(stream.matches())
+    assert (src_pos, match["id"]) == (2, 4)
+    assert prints.store.prior("015011")["status"] == "match"
+    assert not queue.items
+
+
+def test_fuzz_col_vs_col_other_comparison(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that runs of different settings keep their own stream and review queue."""
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    compare_menu.confident_score = 95
+    compare_menu.fuzz_col_vs_col()
+    assert len(list(tmp_path.glob("decisions_14_*.jsonl"))) == 2
+    assert len(list(tmp_path.glob("review_14_*.json"))) == 2
+
+
+def test_fuzz_col_vs_col_chunks(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture, monkeypatch
+):
+    """Test that table2 is indexed once however many chunks table1 is matched in."""
+    monkeypatch.setattr(compare_tables, "CHECKPOINT_ROWS", 1)
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    index = mocker.spy(compare_tables.BlockMatcher, "index")
+    match = mocker.spy(compare_tables.BlockMatcher, "match")
+    compare_menu.fuzz_col_vs_col()
+    assert index.call_count == 1
+    assert match.call_count == 3
+    [matches_file] = list(tmp_path.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+
+
+def test_fuzz_col_vs_col_incremental(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a second run only rescores new, changed and unreviewed rows."""
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    assert compare_menu.table1 is not None
+    df = compare_menu.table1.df.copy()
+    df.loc[1, ["Provider Address", "Address Line 2"]] = ["40 Elm", ""]
+    compare_menu.table1.df = df
+    spy = mocker.spy(compare_tables.BlockMatcher, "match")
+    compare_menu.fuzz_col_vs_col()
+
+    [call] = spy.call_args_list
+    assert call.args[1]["Provider Name"].tolist() == ["Oak Manor", "Pine Rest"]
+    store = json.loads((tmp_path / "fingerprints_14.json").read_text(encoding="utf-8"))
+    assert {ccn: row["status"] for ccn, row in store["rows"].items()} == {
+        "015009": "match",
+        "015010": "match",
+        "015011": "queued",
+    }
+    assert store["rows"]["015010"]["match"]["id"] == 5
+    matches_file = sorted(tmp_path.glob("matches_14_*.json"))[-1]
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 5]
+
+
+def test_fuzz_col_vs_col_table2_changed(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that stored decisions are not carried forward once table2 changed."""
+    mocker.patch("cms_etl.utils.console.input", return_value="n")
+    compare_menu.fuzz_col_vs_col()
+    assert compare_menu.table2 is not None
+    db_df = compare_menu.table2.df.copy()
+    db_df.loc[0, "address"] = "900 Main Street"
+    compare_menu.table2.df = db_df
+    spy = mocker.spy(compare_tables.BlockMatcher, "match")
+    compare_menu.fuzz_col_vs_col()
+
+    [call] = spy.call_args_list
+    assert len(call.args[1]) == 3
+    matches_file = sorted(tmp_path.glob("matches_14_*.json"))[-1]
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [2]
+
+
+def test_review_resolves_fingerprints(
+    compare_menu: CompareTablesMenu, tmp_path, mocker: MockerFixture
+):
+    """Test that a reviewed row is carried forward on the next run."""
+    mocker.patch("cms_etl.utils.console.input", side_effect=["y", "2", "n"])
+    compare_menu.fuzz_col_vs_col()
+    store = json.loads((tmp_path / "fingerprints_14.json").read_text(encoding="utf-8"))
+    assert store["rows"]["015011"]["status"] == "match"
+
+    spy = mocker.spy(compare_tables.BlockMatcher, "match")
+    compare_menu.fuzz_col_vs_col()
+    spy.assert_not_called()
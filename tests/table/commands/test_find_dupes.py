@@ -16,3 +16,29 @@ def test_find_duplicates_command():
     cmd.undo()
     assert len(table.df) == 4
     assert table.df["a"].reset_index(drop=True).equals(pd.Series([1, 2, 2, 3]))
+
+
+def test_find_fuzzy_duplicates_command():
+    """Test that near-duplicates are clustered and undo restores the frame without copying it."""
+    df = pd.DataFrame(
+        {
+            "address": ["9 Oak Ave", "12 Pine Rd", "9 Oak Avenue", "12 Pine Road", "12 Elm St"],
+            "zip_code": ["11111", "22222", "11111", "22222", "22222"],
+        }
+    )
+    table = Table(df, "test_table")
+    cmd = FindColumnDuplicatesCommand(table, "address", zip_col="zip_code")
+    cmd.execute()
+    assert table.df.index.tolist() == [0, 2, 1, 3]
+    assert table.df["duplicate_cluster"].tolist() == [1, 1, 2, 2]
+    assert "duplicate_cluster" not in df.columns
+    cmd.undo()
+    assert table.df is df
+
+    cmd = FindColumnDuplicatesCommand(table, "address", zip_col="zip_code", only_duplicates=False)
+    cmd.execute()
+    assert table.df["duplicate_cluster"].tolist() == [1, 2, 1, 2, pd.NA]
+    assert cmd.serialize()["args"]["zip_col"] == "zip_code"
+    table.df.loc[0, "address"] = "1 Changed St"
+    cmd.undo()
+    assert table.df is df and df.loc[0, "address"] == "9 Oak Ave"
@@ -0,0 +1,99 @@
+"""Fixtures for the table loader tests."""
+
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FileServer(ThreadingHTTPServer):
+    """Serve in-memory files with an ETag and Last-Modified, recording each request.
+
+    Ranges are served as long as `If-Range` matches the ETag. A file put with
+    an `encoding` is sent as is, with that Content-Encoding. The next
+    `truncate` responses send half their body and drop the connection, and
+    the statuses queued in `errors` are answered before any file.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.files: dict[str, bytes] = {}
+        self.etags: dict[str, str] = {}
+        self.encodings: dict[str, str] = {}
+        self.requests: list[tuple[str, dict[str, str], int]] = []
+        self.truncate = 0
+        self.errors: list[int] = []
+
+    def url(self, path: str) -> str:
+        """Return the URL of a served path."""
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def put(self, path: str, body: bytes, etag: str, encoding: str = ""):
+        """Serve a file at a path."""
+        self.files[path] = body
+        self.etags[path] = etag
+        self.encodings[path] = encoding
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Answer GETs from the files of the server, over keep-alive connections."""
+
+    server: FileServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Send a file or a range of it, a 304 when its ETag matches, or an error."""
+        self.server.requests.append((self.path, dict(self.headers), self.client_address[1]))
+        if self.server.errors:
+            self.send_error(self.server.errors.pop(0))
+            return
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        body, etag = self.server.files[self.path], self.server.etags[self.path]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        byte_range = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if byte_range and self.headers.get("If-Range", etag) == etag:
+            start = int(byte_range.group(1))
+            if start >= len(body):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.send_header("ETag", etag)
+        if self.server.encodings[self.path]:
+            self.send_header("Content-Encoding", self.server.encodings[self.path])
+        self.send_header("Last-Modified", "Wed, 01 May 2024 00:00:00 GMT")
+        self.end_headers()
+        if self.server.truncate:
+            # Promise the whole body but send half of it
+            self.server.truncate -= 1
+            self.wfile.write(body[start : start + (len(body) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep the test output quiet."""
+
+
+@pytest.fixture
+def file_server():
+    """Run a local HTTP file server for the duration of a test."""
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,95 @@
+"""Tests for the cms_loader module."""
+
+import json
+
+import pandas as pd
+import pytest
+from cms_etl.models.cms_meta_res import CMSMetaResponse, DistributionItem
+from cms_etl.table.loaders.cms_loader import CMSSourceLoader, read_profile
+from pytest_mock import MockerFixture
+
+CSV = (
+    b"CCN,Provider Name,Zip,Beds,Ownership,Processing Date,Notes\n"
+    b"015009,Sunny Acres,02134,120,For profit,2024-05-01,\n"
+    b"015010,Oak Manor,54321,,Non profit,2024-05-02,Closed\n"
+)
+
+PROFILE = {
+    "usecols": ["CCN", "Zip", "Beds", "Ownership", "Processing Date"],
+    "dtypes": {
+        "CCN": "string",
+        "Zip": "string",
+        "Beds": "Int64",
+        "Ownership": "category",
+        "Processing Date": "date",
+    },
+}
+
+
+@pytest.fixture
+def cms_loader(tmp_path, file_server, mocker: MockerFixture):
+    """Return a loader of one profiled and one plain source, cached in a temporary directory."""
+    file_server.put("/providers.csv", CSV, '"v1"')
+    sources = {
+        "Nursing Homes": {
+            "s1_category_id": 7,
+            "sources": {
+                "https://data.cms.gov/metastore/items/4pq5-n9py": PROFILE,
+                "https://data.cms.gov/metastore/items/abcd-1234": {},
+            },
+        }
+    }
+    (tmp_path / "cms_sources.json").write_text(json.dumps(sources), encoding="utf-8")
+    paths = {
+        "data/cms_sources.json": str(tmp_path / "cms_sources.json"),
+        "data/cms_cache": str(tmp_path / "cms_cache"),
+    }
+    mocker.patch(
+        "cms_etl.table.loaders.cms_loader.pkg_resources.resource_filename",
+        side_effect=lambda _, name: paths[name],
+    )
+    mocker.patch("cms_etl.table.loaders.cms_loader.console")
+    return CMSSourceLoader()
+
+
+def source_meta(identifier: str, url: str) -> CMSMetaResponse:
+    """Return the metadata of a dataset with a CSV at a URL."""
+    return CMSMetaResponse.model_construct(
+        identifier=identifier,
+        title=identifier,
+        modified="2024-05-01",
+        distribution=[DistributionItem.model_construct(downloadURL=url)],
+    )
+
+
+def test_read_profile():
+    """Test that profiles become `read_csv` arguments, with dates parsed."""
+    assert read_profile({}) == {}
+    assert read_profile(PROFILE) == {
+        "usecols": PROFILE["usecols"],
+        "parse_dates": ["Processing Date"],
+        "dtype": {"CCN": "string", "Zip": "string", "Beds": "Int64", "Ownership": "category"},
+    }
+
+
+def test_get_dataset_profile(cms_loader: CMSSourceLoader, file_server):
+    """Test that a profiled source is read with its columns and dtypes, also from the cache."""
+    url = file_server.url("/providers.csv")
+    assert cms_loader.get_read_profile("Nursing Homes", "abcd-1234") == {}
+
+    for _ in range(2):  # parsed, then read back from the Parquet cache
+        dataset = cms_loader.get_dataset("Nursing Homes", source_meta("4pq5-n9py", url))
+        assert dataset is not None
+        df, metadata = dataset
+        assert df.columns.tolist() == PROFILE["usecols"]
+        assert df["CCN"].tolist() == ["015009", "015010"]
+        assert df["Zip"].dtype == "string"
+        assert df["Beds"].dtype == "Int64" and df["Beds"].isna().tolist() == [False, True]
+        assert isinstance(df["Ownership"].dtype, pd.CategoricalDtype)
+        assert pd.api.types.is_datetime64_any_dtype(df["Processing Date"])
+        assert metadata["s1_category_id"] == 7
+
+    # Without a profile every column is read, with inferred types
+    df, _ = cms_loader.get_dataset("Nursing Homes", source_meta("abcd-1234", url))
+    assert len(df.columns) == 7
+    assert df["CCN"].tolist() == [15009, 15010]
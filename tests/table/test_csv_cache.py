@@ -0,0 +1,66 @@
+"""Tests for the csv_cache module."""
+
+import os
+
+import pandas as pd
+from cms_etl.table.loaders.csv_cache import cache_path, read_cached_csv
+from pandas.testing import assert_frame_equal
+from pytest_mock import MockerFixture
+
+
+def write_csv(path, zips):
+    """Write a small CMS-like CSV."""
+    pd.DataFrame(
+        {
+            "CCN": ["015009", "015010", "015012"],
+            "Provider Name": ["Sunny Acres", None, "Pine Rest"],
+            "Beds": [120, 80, None],
+            "ZIP Code": zips,
+            "Mixed": ["A", 2, None],
+        }
+    ).to_csv(path, index=False)
+
+
+def test_round_trip(tmp_path, mocker: MockerFixture):
+    """Test that the cached frame equals the parsed one, and is read without parsing."""
+    csv_path = tmp_path / "providers.csv"
+    write_csv(csv_path, [35233, 2134, 36301])
+    parsed = read_cached_csv(csv_path)
+    assert cache_path(csv_path).exists()
+    assert parsed["CCN"].tolist() == [15009, 15010, 15012]
+    assert parsed["Mixed"].tolist()[:2] == ["A", "2"]
+
+    spy = mocker.spy(pd, "read_csv")
+    cached = read_cached_csv(csv_path)
+    spy.assert_not_called()
+    assert_frame_equal(cached, parsed)
+    assert pd.isna(cached["Provider Name"][1])
+
+
+def test_invalidation(tmp_path, mocker: MockerFixture):
+    """Test that the cache is rewritten when the CSV or the parse arguments change."""
+    csv_path = tmp_path / "providers.csv"
+    write_csv(csv_path, [35233, 2134, 36301])
+    read_cached_csv(csv_path)
+
+    write_csv(csv_path, [35233, 2134, 36302])
+    os.utime(csv_path, ns=(0, 0))
+    assert read_cached_csv(csv_path)["ZIP Code"].tolist() == [35233, 2134, 36302]
+
+    spy = mocker.spy(pd, "read_csv")
+    df = read_cached_csv(csv_path, dtype={"CCN": str, "ZIP Code": str})
+    assert spy.call_count == 1
+    assert df["CCN"].tolist() == ["015009", "015010", "015012"]
+    assert read_cached_csv(csv_path, dtype={"CCN": str, "ZIP Code": str}).equals(df)
+    assert spy.call_count == 1
+
+
+def test_unreadable_cache(tmp_path, mocker: MockerFixture):
+    """Test that a corrupt cache file is replaced."""
+    mock_log = mocker.patch("cms_etl.table.loaders.csv_cache.console.log")
+    csv_path = tmp_path / "providers.csv"
+    write_csv(csv_path, [35233, 2134, 36301])
+    cache_path(csv_path).write_bytes(b"not parquet")
+    assert len(read_cached_csv(csv_path)) == 3
+    mock_log.assert_called_once()
+    assert read_cached_csv(csv_path)["Beds"].tolist()[:2] == [120.0, 80.0]
@@ -0,0 +1,165 @@
+"""Tests for the download_cache module."""
+
+import gzip
+import io
+import os
+
+import pytest
+import requests
+from cms_etl.table.loaders.download_cache import (
+    DownloadManager,
+    DownloadManifest,
+    adaptive_chunks,
+    download,
+    file_sha256,
+)
+
+CSV = b"CCN,Provider Name\n015009,Sunny Acres\n015010,Oak Manor\n"
+
+
+def test_download_and_manifest(tmp_path, file_server):
+    """Test that a download is recorded, and repeated only when the dataset changes."""
+    file_server.put("/providers.csv", CSV, '"v1"')
+    url, dest = file_server.url("/providers.csv"), tmp_path / "providers.csv"
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    assert download(url, dest, manifest, modified="2024-05-01")
+    assert dest.read_bytes() == CSV
+
+    entry = DownloadManifest(tmp_path / "manifest.json").get("providers.csv")
+    assert entry is not None
+    assert (entry.url, entry.modified, entry.etag) == (url, "2024-05-01", '"v1"')
+    assert (entry.size, entry.sha256) == (len(CSV), file_sha256(dest))
+    assert entry.last_modified == "Wed, 01 May 2024 00:00:00 GMT"
+
+    # Same modified date: no request at all
+    assert not download(url, dest, manifest, modified="2024-05-01")
+    assert len(file_server.requests) == 1
+
+    # New modified date, same file: a conditional request answered with a 304
+    assert not download(url, dest, manifest, modified="2024-06-01")
+    headers = file_server.requests[-1][1]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Wed, 01 May 2024 00:00:00 GMT"
+    assert manifest.get("providers.csv").modified == "2024-06-01"
+
+    # The file changed on the server
+    file_server.put("/providers.csv", CSV + b"015012,Pine Rest\n", '"v2"')
+    assert download(url, dest, manifest, modified="2024-07-01")
+    assert dest.read_bytes().endswith(b"Pine Rest\n")
+    assert manifest.verify(dest)
+
+
+def test_corrupt_copy_is_downloaded_again(tmp_path, file_server):
+    """Test that a cached file that no longer matches its checksum is replaced."""
+    file_server.put("/providers.csv", CSV, '"v1"')
+    url, dest = file_server.url("/providers.csv"), tmp_path / "providers.csv"
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    download(url, dest, manifest, modified="2024-05-01")
+
+    dest.write_bytes(CSV.replace(b"Sunny", b"Sonny"))
+    os.utime(dest, ns=(0, 0))
+    assert not manifest.verify(dest)
+    assert download(url, dest, manifest, modified="2024-05-01")
+    assert "If-None-Match" not in file_server.requests[-1][1]
+    assert dest.read_bytes() == CSV
+
+
+def test_failed_download_keeps_copy(tmp_path, file_server):
+    """Test that a failed download leaves the cached copy, and its part is resumed later."""
+    file_server.put("/providers.csv", CSV, '"v1"')
+    url, dest = file_server.url("/providers.csv"), tmp_path / "providers.csv"
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    download(url, dest, manifest, modified="2024-05-01")
+
+    body = CSV * 2
+    file_server.put("/providers.csv", body, '"v2"')
+    file_server.truncate = 1
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(url, dest, manifest, modified="2024-06-01", retries=0)
+    assert dest.read_bytes() == CSV
+    assert manifest.verify(dest)
+    part_path = tmp_path / "providers.csv.part"
+    assert part_path.read_bytes() == body[: len(body) // 2]
+    assert manifest.get("providers.csv.part").etag == '"v2"'
+
+    # The next call asks for the rest only
+    assert download(url, dest, manifest, modified="2024-06-01")
+    headers = file_server.requests[-1][1]
+    assert (headers["Range"], headers["If-Range"]) == (f"bytes={len(body) // 2}-", '"v2"')
+    assert dest.read_bytes() == body
+    assert manifest.get("providers.csv").sha256 == file_sha256(dest)
+    assert manifest.get("providers.csv.part") is None
+    assert not part_path.exists()
+
+    with pytest.raises(requests.HTTPError):
+        download(file_server.url("/missing.csv"), tmp_path / "missing.csv", manifest)
+    assert not (tmp_path / "missing.csv").exists()
+
+
+def test_download_retries(tmp_path, file_server):
+    """Test that interrupted attempts are resumed, and a part of a changed file restarts."""
+    body = CSV * 50
+    file_server.put("/providers.csv", body, '"v1"')
+    url, dest = file_server.url("/providers.csv"), tmp_path / "providers.csv"
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    file_server.truncate = 2
+    progress = []
+    assert download(
+        url, dest, manifest, retries=2, backoff=0, on_progress=lambda *p: progress.append(p)
+    )
+    assert dest.read_bytes() == body
+    assert [r[1].get("Range") for r in file_server.requests] == [
+        None,
+        f"bytes={len(body) // 2}-",
+        f"bytes={len(body) // 2 + len(body) // 4}-",
+    ]
+    assert progress[-1] == (len(body), len(body))
+
+    # The part was of "v2", but the server has moved on to "v3": a full body is sent
+    file_server.put("/providers.csv", body.upper(), '"v2"')
+    file_server.truncate = 1
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(url, dest, manifest, modified="2024-06-01", retries=0)
+    file_server.put("/providers.csv", body.lower(), '"v3"')
+    assert download(url, dest, manifest, modified="2024-06-01", retries=0)
+    assert file_server.requests[-1][1]["If-Range"] == '"v2"'
+    assert dest.read_bytes() == body.lower()
+    assert manifest.verify(dest)
+
+
+def test_adaptive_chunks():
+    """Test that chunks grow while they are read quickly, up to the largest size."""
+    chunks = list(adaptive_chunks(io.BytesIO(b"abcdefghijk"), min_size=1, max_size=4))
+    assert chunks == [b"a", b"bc", b"defg", b"hijk"]
+
+
+def test_encoded_body(tmp_path, file_server):
+    """Test that a body the server gzips anyway is written decoded."""
+    file_server.put("/providers.csv", gzip.compress(CSV), '"v1"', encoding="gzip")
+    url, dest = file_server.url("/providers.csv"), tmp_path / "providers.csv"
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    assert download(url, dest, manifest, modified="2024-05-01")
+    assert dest.read_bytes() == CSV
+    assert manifest.verify(dest)
+
+
+def test_fetch_many(tmp_path, file_server):
+    """Test that several files are fetched over one connection, failures reported by URL."""
+    for name in ("a", "b", "c"):
+        file_server.put(f"/{name}.csv", CSV + name.encode(), f'"{name}"')
+    manager = DownloadManager(tmp_path / "cache", workers=1, progress=False)
+    urls = [file_server.url(f"/{name}.csv") for name in ("a", "b", "missing", "c")]
+    results = manager.fetch_many([(url, "2024-05-01") for url in urls + urls[:1]])
+    manager.close()
+
+    assert list(results) == urls
+    assert isinstance(results[urls[2]], requests.HTTPError)
+    assert results[urls[0]] == tmp_path / "cache" / "a.csv"
+    assert results[urls[3]].read_bytes() == CSV + b"c"
+    assert len(file_server.requests) == 4
+    # One connection, kept alive up to the 404
+    assert len({port for _, _, port in file_server.requests[:3]}) == 1
+
+    manager = DownloadManager(tmp_path / "cache", workers=2, progress=False)
+    assert manager.fetch(urls[1], "2024-05-01") == results[urls[1]]
+    assert len(file_server.requests) == 4
@@ -0,0 +1,108 @@
+"""Tests for the meta_cache module."""
+
+import json
+import threading
+
+import pytest
+import requests
+from cms_etl.table.loaders import meta_cache
+from cms_etl.table.loaders.meta_cache import CMSMetaClient
+from pytest_mock import MockerFixture
+
+
+def meta_json(title: str) -> bytes:
+    """Return a metastore response of a dataset."""
+    return json.dumps(
+        {
+            "accessLevel": "public",
+            "landingPage": "https://data.cms.gov/provider-data/dataset/4pq5-n9py",
+            "bureauCode": ["009:38"],
+            "issued": "2024-01-01",
+            "@type": "dcat:Dataset",
+            "modified": "2024-05-01",
+            "released": "2024-05-01",
+            "keyword": ["Nursing homes"],
+            "contactPoint": {"@type": "vcard:Contact", "fn": "CMS", "hasEmail": "x@cms.gov"},
+            "publisher": {"@type": "org:Organization", "name": "CMS"},
+            "identifier": title.lower(),
+            "description": "",
+            "title": title,
+            "programCode": ["009:000"],
+            "distribution": [
+                {
+                    "@type": "dcat:Distribution",
+                    "downloadURL": f"https://data.cms.gov/{title}.csv",
+                    "mediaType": "text/csv",
+                }
+            ],
+            "theme": ["Nursing homes"],
+        }
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def metas(file_server):
+    """Serve the metadata of three datasets, returning their URLs."""
+    for title in ("A", "B", "C"):
+        file_server.put(f"/meta/{title}", meta_json(title), f'"{title}"')
+    return [file_server.url(f"/meta/{title}") for title in ("A", "B", "C")]
+
+
+def test_get_cached(tmp_path, file_server, metas):
+    """Test that responses are reused within the TTL, across instances, and when stale."""
+    client = CMSMetaClient(tmp_path, backoff=0)
+    assert [meta.title for meta in client.get_many(metas + metas[:1])] == ["A", "B", "C", "A"]
+    assert client.get(metas[0]) is client.get(metas[0])
+    assert len(file_server.requests) == 3
+    client.close()
+
+    # A new client reads the cache file
+    client = CMSMetaClient(tmp_path, backoff=0)
+    assert len(client) == 3
+    assert client.get(metas[1]).distribution[0].downloadURL.endswith("B.csv")
+    assert len(file_server.requests) == 3
+
+    # Past the TTL responses are fetched again, or kept when that fails
+    client = CMSMetaClient(tmp_path, ttl=0, retries=0)
+    file_server.put("/meta/A", meta_json("A2"), '"A2"')
+    file_server.errors = [500]
+    assert client.get(metas[0]).title == "A"
+    assert client.get(metas[0]).title == "A2"
+    with pytest.raises(requests.HTTPError):
+        client.get(file_server.url("/meta/missing"))
+
+
+def test_retries_and_prefetch(tmp_path, file_server, metas):
+    """Test that transient errors are retried, and that prefetching fills the cache."""
+    client = CMSMetaClient(tmp_path, retries=2, backoff=0)
+    file_server.errors = [503, 502]
+    assert client.get(metas[0]).title == "A"
+    assert len(file_server.requests) == 3
+
+    client.prefetch(metas).join()
+    assert len(file_server.requests) == 5
+    assert all(client.is_fresh(url) for url in metas)
+    client.get_many(metas)
+    assert len(file_server.requests) == 5
+
+
+def test_shared_fetches(tmp_path, file_server, metas, mocker: MockerFixture):
+    """Test that URLs being prefetched are not requested again, and the cache is written once."""
+    client = CMSMetaClient(tmp_path, backoff=0)
+    release = threading.Event()
+    session_get = client.session.get
+
+    def slow_get(*args, **kwargs):
+        release.wait(5)
+        return session_get(*args, **kwargs)
+
+    mock_get = mocker.patch.object(client.session, "get", side_effect=slow_get)
+    mock_replace = mocker.spy(meta_cache.os, "replace")
+    thread = client.prefetch(metas)
+    while mock_get.call_count < 3:
+        release.wait(0.01)
+    threading.Timer(0.1, release.set).start()
+    assert [meta.title for meta in client.get_many(metas)] == ["A", "B", "C"]
+    thread.join()
+    assert len(file_server.requests) == 3
+    assert mock_replace.call_count == 1
@@ -0,0 +1,50 @@
+"""Tests for the Table class."""
+
+import pandas as pd
+from cms_etl.table.commands import SplitAddressLinesCommand
+from cms_etl.table.table import Table
+from pytest_mock import MockerFixture
+
+
+class TestTableMatchKeys:
+    """Tests for the cached match keys of a Table."""
+
+    def test_match_keys_are_cached(self):
+        """Test that match keys are only computed once."""
+        table = Table(pd.DataFrame({"address": ["12 pine rd"]}), "test_table")
+        keys = table.match_keys("address")
+        assert table.match_keys("address") is keys
+        assert keys["house_num"].tolist() == [12]
+
+    def test_zip_keys_are_cached(self):
+        """Test that zip keys are computed once and dropped with the match keys."""
+        table = Table(pd.DataFrame({"zip_code": [2134, 12345]}), "test_table")
+        keys = table.zip_keys("zip_code")
+        assert table.zip_keys("zip_code") is keys
+        assert keys["zip5"].tolist() == ["02134", "12345"]
+        table.df = pd.DataFrame({"zip_code": ["12345-6789"]})
+        assert table.zip_keys("zip_code")["zip3"].tolist() == ["123"]
+
+    def test_commands_invalidate_match_keys(self, mocker: MockerFixture):
+        """Test that executing, undoing and redoing a command drops the cached keys."""
+        mocker.patch("cms_etl.utils.console.print")
+        table = Table(
+            pd.DataFrame({"address": ["12 Pine Rd Suite 4"], "address2": [""]}), "test_table"
+        )
+        assert table.match_keys("address")["processed"].tolist() == ["12 pine rd ste 4"]
+
+        table.cmd_manager.exec_cmd(SplitAddressLinesCommand(table, "address", "address2"))
+        assert table.match_keys("address")["processed"].tolist() == ["12 pine rd"]
+        table.cmd_manager.undo()
+        assert table.match_keys("address")["processed"].tolist() == ["12 pine rd ste 4"]
+        table.cmd_manager.redo()
+        assert table.match_keys("address")["processed"].tolist() == ["12 pine rd"]
+
+    def test_replacing_df_invalidates_match_keys(self):
+        """Test that assigning a new DataFrame drops the cached keys."""
+        table = Table(pd.DataFrame({"address": ["12 pine rd"]}), "test_table")
+        table.match_keys("address")
+        table.df = pd.DataFrame({"address": ["Main St"]})
+        assert table.match_keys("address")["lead_alpha"].tolist() == ["MAIN"]
+        table.reset_dataframe()
+        assert table.match_keys("address")["house_num"].tolist() == [12]
@@ -0,0 +1,185 @@
+"""Test the headless match subcommand."""
+
+import argparse
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+from cms_etl.batch import parse_columns, parse_field, parse_source
+from cms_etl.compare.decision_cache import DECISION_CACHE_PATH, DecisionCache
+from cms_etl.compare.review_queue import ReviewQueue
+from cms_etl.compare.scoring import FieldSpec
+from cms_etl.main import main
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch, mocker: MockerFixture):
+    """Write a CMS CSV and a database table to match it against."""
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("cms_etl.utils.console.print")
+    mocker.patch("cms_etl.utils.console.log")
+    pd.DataFrame(
+        {
+            "Provider Name": ["Sunny Acres", "Oak Manor", "Pine Rest"],
+            "Provider Address": ["123 Main Street", "789 Oak Ave", "12 Pine Rd"],
+            "Address Line 2": ["", "", ""],
+            "ZIP Code": ["12345", "54321", "54321"],
+        }
+    ).to_csv(tmp_path / "cms.csv", index=False)
+    db_df = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4],
+            "address": ["123 Main Street", "789 Oak Avenue", "12 Pine Rd N", "12 Pine Rd S"],
+            "address2": ["", "", "", ""],
+            "zip_code": ["12345", "54321", "54321", "54321"],
+        }
+    )
+    db_df.to_csv(tmp_path / "db.csv", index=False)
+    with sqlite3.connect(tmp_path / "facilities.db") as conn:
+        db_df.to_sql("facilities", conn, index=False)
+    return tmp_path
+
+
+def test_parse_arguments():
+    """Test parsing the source, column and field arguments."""
+    assert parse_source("cms.csv") == ("csv", "cms.csv")
+    assert parse_source("db:facilities") == ("db", "facilities")
+    assert parse_source("cms:xubh-q36u") == ("cms", "xubh-q36u")
+    assert parse_columns("Provider Address=address") == ("Provider Address", "address")
+    assert parse_field("Provider Name=name:ratio:2") == FieldSpec(
+        "Provider Name", "name", "ratio", 2.0
+    )
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_columns("address")
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_field("a=b:nope")
+
+
+def test_match_csv(sources):
+    """Test a batch run between two CSV files."""
+    with pytest.raises(SystemExit) as exit_info:
+        main(["match", "cms.csv", "db.csv", "--on", "Provider Address=address", "--workers", "1"])
+    assert exit_info.value.code == 0
+
+    [matches_file] = list(sources.glob("matches_None_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+    metrics = json.loads((sources / "match_metrics_None.json").read_text(encoding="utf-8"))
+    assert {"load_sources", "scoring", "write_matches", "total"} <= set(metrics["stages"])
+    assert metrics["counters"]["rows_queued_ambiguous"] == 1
+
+
+def test_match_db_table(sources):
+    """Test a batch run against a database table, with a stricter scorer and thresholds."""
+    with pytest.raises(SystemExit) as exit_info:
+        main(
+            [
+                "match",
+                "csv:cms.csv",
+                "db:facilities",
+                "--sqlite",
+                str(sources / "facilities.db"),
+                "--on",
+                "Provider Address=address",
+                "--category-id",
+                "14",
+                "--scorer",
+                "ratio",
+                "--confident",
+                "95",
+                "--cutoff",
+                "90",
+                "--metrics",
+                "timing.json",
+                "--top-k",
+                "2",
+            ]
+        )
+    assert exit_info.value.code == 0
+    [matches_file] = list(sources.glob("matches_14_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+    assert matches[0]["cms"]["category_id"] == 14
+    assert (sources / "candidates_14.parquet").exists()
+    # Neither '12 Pine Rd N' nor '12 Pine Rd S' scores above 95 on ratio, so nothing is queued
+    metrics = json.loads((sources / "timing.json").read_text(encoding="utf-8"))
+    assert "total" in metrics["stages"]
+    assert metrics["counters"]["rows_none"] == 1
+    assert "rows_queued_ambiguous" not in metrics["counters"]
+
+
+def test_match_db_blocks(sources):
+    """Test a batch run that fetches the zip blocks of the database table as needed."""
+    with pytest.raises(SystemExit) as exit_info:
+        main(
+            [
+                "match",
+                *["cms.csv", "db:facilities", "--sqlite", str(sources / "facilities.db")],
+                *["--on", "Provider Address=address", "--db-blocks", "--workers", "1"],
+            ]
+        )
+    assert exit_info.value.code == 0
+    [matches_file] = list(sources.glob("matches_None_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2]
+    metrics = json.loads((sources / "match_metrics_None.json").read_text(encoding="utf-8"))
+    assert metrics["counters"]["db_queries"] == 1
+    assert metrics["counters"]["db_rows_fetched"] == 4
+    assert metrics["counters"]["rows_queued_ambiguous"] == 1
+
+
+def test_match_db_blocks_decision_cache(sources):
+    """Test that a pair accepted before is looked up in the database rows a chunk fetches."""
+    argv = [
+        "match",
+        *["cms.csv", "db:facilities", "--sqlite", str(sources / "facilities.db")],
+        *["--on", "Provider Address=address", "--db-blocks", "--workers", "1"],
+    ]
+    with pytest.raises(SystemExit):
+        main(argv)
+    [queue_file] = list(sources.glob("review_None_*.json"))
+    queue = ReviewQueue.load(queue_file)
+    [item] = queue.items
+    with DecisionCache(sources / DECISION_CACHE_PATH) as cache:
+        keys = [cand.key for cand in item.candidates]
+        choice = [cand.row["id"] for cand in item.candidates].index(4)
+        cache.record(item.src_key, keys, queue.metadata["scorer"], choice)
+    for path in sources.glob("matches_None_*.json"):
+        path.unlink()
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert exit_info.value.code == 0
+    [matches_file] = list(sources.glob("matches_None_*.json"))
+    matches = json.loads(matches_file.read_text(encoding="utf-8"))
+    assert [match["cms"]["profile_id"] for match in matches] == [1, 2, 4]
+    metrics = json.loads((sources / "match_metrics_None.json").read_text(encoding="utf-8"))
+    assert metrics["counters"]["rows_skipped_cached"] == 1
+    assert "rows_queued_ambiguous" not in metrics["counters"]
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["match", "missing.csv", "db.csv", "--on", "Provider Address=address"],
+        ["match", "cms.csv", "db.csv", "--on", "Provider Address=street"],
+        ["match", "cms.csv", "db:facilities", "--on", "Provider Address=address"],
+        [
+            "match",
+            *["cms.csv", "db.csv", "--on", "Provider Address=address"],
+            *["--cutoff", "90", "--confident", "85"],
+        ],
+        [
+            "match",
+            *["cms.csv", "db:facilities", "--on", "Provider Address=address"],
+            *["--sqlite", "facilities.db", "--db-blocks", "--top-k", "2"],
+        ],
+    ],
+)
+def test_match_failure(sources, argv):
+    """Test that a run that cannot load its sources or columns exits non-zero."""
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert exit_info.value.code == 1
@@ -9,5 +9,7 @@ def test_main(mocker):
     mocker.patch("cms_etl.utils.console.input")
     mocker.patch("cms_etl.app_context.AppContext")
     mock_run_main = mocker.patch("cms_etl.menu.MenuController.run_main_menu")
-    main()
+    mock_prefetch = mocker.patch("cms_etl.table.loaders.CMSSourceLoader.prefetch_metas")
+    main([])
     mock_run_main.assert_called_once()
+    mock_prefetch.assert_called_once()